@@ -7,6 +7,9 @@
 """
 
 from datetime import datetime, timedelta
+
+import pandas as pd
+
 from database import get_connection
 
 
@@ -24,6 +27,10 @@ class AlertConfig:
     NEW_EVENT_DAYS = 14             # イベント開始から2週間
     NEW_EVENT_MIN_RATE = 0.3        # 期待される最低会員率30%
 
+    # 急成長校
+    RAPID_GROWTH_RATE = 0.5         # 前年比50%以上の成長
+    RAPID_GROWTH_MIN_PREV_SALES = 10000  # 前年度売上の最低額
+
     # 表示件数（ページネーション用）
     PAGE_SIZE = 30
 
@@ -43,60 +50,280 @@ def get_current_fiscal_year():
     return today.year - 1
 
 
-def alert_no_events_this_year(cursor, config=AlertConfig):
+# ============================================
+# 学校別特徴量とアラートルール
+# ============================================
+
+SCHOOL_COLUMNS = ['school_name', 'attribute', 'studio_name', 'region', 'manager']
+
+
+def load_alert_features(cursor, current_fy=None):
     """
-    アラート1: 今年度未実施（前年実施あり）
+    学校単位のアラートで共有する特徴量を一括取得
 
-    前年度にイベントを実施していたが、今年度はまだ実施していない学校
-    全件取得（件数制限なし）
+    学校マスタ・イベント（売上年度別の売上付き）・最新報告書の会員数をそれぞれ1回だけ集計する。
+    各アラートはこの特徴量に対する条件式（ルール）として評価する。
+
+    Args:
+        cursor: DBカーソル
+        current_fy: 基準年度。Noneの場合は現在年度
+
+    Returns:
+        dict: {
+            'current_fy': int, 'prev_fy': int,
+            'events': イベント単位のDataFrame,
+            'schools': 学校単位のDataFrame（index: school_id）
+        }
     """
-    current_fy = get_current_fiscal_year()
+    current_fy = current_fy if current_fy else get_current_fiscal_year()
     prev_fy = current_fy - 1
+    latest_report_id, _ = get_latest_report_id(cursor)
 
-    query = '''
+    cursor.execute('SELECT id, school_name, attribute, studio_name, region, manager FROM schools')
+    schools = pd.DataFrame(cursor.fetchall(), columns=['school_id'] + SCHOOL_COLUMNS).set_index('school_id')
+
+    # イベント×売上年度の売上（イベントの年度と売上月の年度は異なりうる）
+    cursor.execute('''
         SELECT
-            s.id as school_id,
-            s.school_name,
-            s.attribute,
-            s.studio_name,
-            s.region,
-            s.manager,
-            COUNT(DISTINCT e_prev.id) as prev_year_events,
-            COALESCE(SUM(es_prev.sales), 0) as prev_year_sales
-        FROM schools s
-        -- 前年度にイベントがある
-        INNER JOIN events e_prev ON e_prev.school_id = s.id AND e_prev.fiscal_year = ?
-        LEFT JOIN event_sales es_prev ON es_prev.event_id = e_prev.id
-        -- 今年度にイベントがない
-        WHERE NOT EXISTS (
-            SELECT 1 FROM events e_curr
-            WHERE e_curr.school_id = s.id AND e_curr.fiscal_year = ?
-        )
-        GROUP BY s.id, s.school_name, s.attribute, s.studio_name, s.region, s.manager
-        HAVING prev_year_sales > 0
-        ORDER BY prev_year_sales DESC
-    '''
+            e.id,
+            e.school_id,
+            e.fiscal_year,
+            e.start_date,
+            es.fiscal_year as sales_fy,
+            SUM(es.sales) as sales
+        FROM events e
+        LEFT JOIN event_sales es ON es.event_id = e.id
+        GROUP BY e.id, es.fiscal_year
+    ''')
+    event_sales = pd.DataFrame(
+        cursor.fetchall(),
+        columns=['event_id', 'school_id', 'fiscal_year', 'start_date', 'sales_fy', 'sales']
+    )
+    event_sales = event_sales[event_sales['school_id'].isin(schools.index)]
+
+    events = event_sales.drop_duplicates('event_id').set_index('event_id')[
+        ['school_id', 'fiscal_year', 'start_date']
+    ].copy()
+    events['sales'] = event_sales.groupby('event_id')['sales'].sum()
+
+    for label, fy in (('curr', current_fy), ('prev', prev_fy)):
+        # イベントの年度で集計
+        by_event_fy = events[events['fiscal_year'] == fy].groupby('school_id')
+        schools[f'events_{label}'] = by_event_fy.size().reindex(schools.index, fill_value=0)
+        schools[f'event_sales_{label}'] = by_event_fy['sales'].sum().reindex(schools.index, fill_value=0.0)
+        # 売上月の年度で集計（売上行がない学校はNaN）
+        by_sales_fy = event_sales[event_sales['sales_fy'] == fy].groupby('school_id')
+        schools[f'sales_{label}'] = by_sales_fy['sales'].sum().reindex(schools.index)
+
+    # 最新報告書の会員数（基準年度分）
+    cursor.execute('''
+        SELECT school_id, SUM(student_count), SUM(member_count)
+        FROM member_rates
+        WHERE report_id = ? AND fiscal_year = ?
+        GROUP BY school_id
+    ''', (latest_report_id, current_fy))
+    members = pd.DataFrame(
+        cursor.fetchall(), columns=['school_id', 'students', 'members']
+    ).set_index('school_id')
+    schools['students'] = members['students'].reindex(schools.index)
+    schools['members'] = members['members'].reindex(schools.index)
+    schools['member_rate'] = (schools['members'] / schools['students']).where(schools['students'] > 0, 0.0)
+    # 会員率の行がない学校は会員率アラートの対象外
+    schools.loc[~schools.index.isin(members.index), 'member_rate'] = float('nan')
+
+    return {
+        'current_fy': current_fy,
+        'prev_fy': prev_fy,
+        'events': events,
+        'schools': schools
+    }
 
-    cursor.execute(query, (prev_fy, current_fy))
-    results = []
 
-    for row in cursor.fetchall():
+def _text(value):
+    """特徴量フレームの文字列値（NULL/NaNは空文字）"""
+    return value if isinstance(value, str) else ''
+
+
+def _school_info(school_id, row):
+    """アラート共通の学校情報"""
+    return {
+        'school_id': int(school_id),
+        'school_name': row.school_name,
+        'attribute': _text(row.attribute),
+        'studio_name': _text(row.studio_name),
+        'region': _text(row.region),
+        'manager': _text(row.manager)
+    }
+
+
+def rule_no_events_this_year(features, config=AlertConfig):
+    """今年度未実施（前年実施あり）"""
+    df = features['schools']
+    hits = df[(df['events_prev'] > 0) & (df['events_curr'] == 0) & (df['event_sales_prev'] > 0)]
+    hits = hits.sort_values('event_sales_prev', ascending=False, kind='mergesort')
+
+    results = []
+    for row in hits.itertuples():
+        prev_events = int(row.events_prev)
+        prev_sales = float(row.event_sales_prev)
         results.append({
-            'school_id': row[0],
-            'school_name': row[1],
-            'attribute': row[2] or '',
-            'studio_name': row[3] or '',
-            'region': row[4] or '',
-            'manager': row[5] or '',
-            'prev_year_events': row[6],
-            'prev_year_sales': row[7],
+            **_school_info(row.Index, row),
+            'prev_year_events': prev_events,
+            'prev_year_sales': prev_sales,
             'level': 'danger',
-            'message': f'前年度{row[6]}件のイベント実施、売上¥{row[7]:,.0f}'
+            'message': f'前年度{prev_events}件のイベント実施、売上¥{prev_sales:,.0f}'
         })
+    return results
 
+
+def rule_member_rate_decline(features, config=AlertConfig, member_rate_threshold=None, sales_decline_threshold=None):
+    """会員率・売上低下（閾値はNoneの場合フィルタなし）"""
+    if member_rate_threshold is None:
+        member_rate_threshold = 1.0  # 100%（実質フィルタなし）
+    if sales_decline_threshold is None:
+        sales_decline_threshold = 0.0  # 0%（実質フィルタなし）
+
+    df = features['schools']
+    prev_sales = df['event_sales_prev']
+    sales_change = (df['event_sales_curr'] - prev_sales) / prev_sales.where(prev_sales > 0)
+    mask = (
+        (df['member_rate'] < member_rate_threshold)
+        & (prev_sales > 0)
+        & (sales_change < sales_decline_threshold)
+    )
+    hits = df[mask].assign(sales_change=sales_change[mask])
+    hits = hits.sort_values(['member_rate', 'sales_change'], kind='mergesort')
+
+    results = []
+    for row in hits.itertuples():
+        rate = float(row.member_rate)
+        change = float(row.sales_change)
+        level = 'danger' if rate < config.MEMBER_RATE_DANGER or change < config.YOY_DECLINE_DANGER else 'warning'
+        results.append({
+            **_school_info(row.Index, row),
+            'member_rate': rate,
+            'current_sales': float(row.event_sales_curr),
+            'prev_sales': float(row.event_sales_prev),
+            'sales_change': change,
+            'level': level,
+            'message': f'会員率{rate*100:.1f}%、売上{change*100:+.1f}%'
+        })
     return results
 
 
+def rule_new_schools(features, config=AlertConfig, target_month=None):
+    """新規開始校（基準年度に初めてイベントを開始。月指定時はその月に開始したイベントのみ）"""
+    current_fy = features['current_fy']
+    events = features['events']
+    prev_schools = events.loc[events['fiscal_year'] == features['prev_fy'], 'school_id']
+    current = events[(events['fiscal_year'] == current_fy) & ~events['school_id'].isin(prev_schools)]
+    if target_month:
+        current = current[current['start_date'].str[5:7] == f'{target_month:02d}']
+
+    grouped = current.groupby('school_id')
+    hits = pd.DataFrame({
+        'event_count': grouped.size(),
+        'first_event_date': current.dropna(subset=['start_date']).groupby('school_id')['start_date'].min(),
+        'total_sales': grouped['sales'].sum()
+    }).join(features['schools'][SCHOOL_COLUMNS])
+    hits = hits.sort_values(
+        ['first_event_date', 'total_sales'], ascending=False, na_position='last', kind='mergesort'
+    )
+
+    results = []
+    for row in hits.itertuples():
+        event_count = int(row.event_count)
+        total_sales = float(row.total_sales)
+        results.append({
+            **_school_info(row.Index, row),
+            'event_count': event_count,
+            'first_event_date': row.first_event_date if isinstance(row.first_event_date, str) else None,
+            'total_sales': total_sales,
+            'level': 'info',
+            'message': f'{current_fy}年度{event_count}件のイベント、売上¥{total_sales:,.0f}'
+        })
+    return results
+
+
+def rule_rapid_growth(features, config=AlertConfig):
+    """急成長校（売上月の年度で前年比較）"""
+    df = features['schools']
+    growth = (df['sales_curr'] - df['sales_prev']) / df['sales_prev']
+    mask = (
+        df['sales_curr'].notna()
+        & (df['sales_prev'] > config.RAPID_GROWTH_MIN_PREV_SALES)
+        & (growth >= config.RAPID_GROWTH_RATE)
+    )
+    hits = df[mask].assign(growth_rate=growth[mask])
+    hits = hits.sort_values('growth_rate', ascending=False, kind='mergesort')
+
+    results = []
+    for row in hits.itertuples():
+        growth_rate = float(row.growth_rate)
+        results.append({
+            **_school_info(row.Index, row),
+            'current_sales': float(row.sales_curr),
+            'prev_sales': float(row.sales_prev),
+            'growth_rate': growth_rate,
+            'level': 'success',
+            'message': f'売上{growth_rate*100:+.1f}%成長！'
+        })
+    return results
+
+
+def rule_sales_unit_price(features, config=AlertConfig):
+    """売上単価（会員あたり売上）と属性平均の比較"""
+    df = features['schools']
+    hits = df[df['members'] > 0].assign(unit_price=lambda d: d['event_sales_curr'] / d['members'])
+    # 属性がNULLの学校は属性平均の集計キーに含めない（'' の属性とは別扱い）
+    attr_averages = hits.dropna(subset=['attribute']).groupby('attribute')['unit_price'].mean().to_dict()
+    hits = hits.sort_values('school_name', kind='mergesort')
+
+    results = []
+    for row in hits.itertuples():
+        attribute = _text(row.attribute)
+        unit_price = float(row.unit_price)
+        attr_avg = float(attr_averages.get(attribute, 0))
+        diff = unit_price - attr_avg
+        results.append({
+            'school_id': int(row.Index),
+            'school_name': row.school_name,
+            'attribute': attribute,
+            'studio_name': _text(row.studio_name),
+            'branch_name': _text(row.region),
+            'total_members': int(row.members),
+            'total_students': int(row.students) if pd.notna(row.students) else 0,
+            'total_sales': float(row.event_sales_curr),
+            'member_rate': float(row.member_rate),
+            'unit_price': unit_price,
+            'attr_avg': attr_avg,
+            'diff': diff,
+            'level': 'success' if diff > 0 else 'warning',
+            'message': f'単価¥{unit_price:,.0f}（属性平均比{diff:+,.0f}）'
+        })
+    return results
+
+
+# 学校別特徴量で評価するアラート（get_all_alertsで特徴量を1回だけ作って全ルールを評価）
+SCHOOL_ALERT_RULES = {
+    'no_events_this_year': rule_no_events_this_year,
+    'member_rate_decline': rule_member_rate_decline,
+    'new_schools': rule_new_schools,
+    'rapid_growth': rule_rapid_growth,
+    'sales_unit_price': rule_sales_unit_price,
+}
+
+
+def alert_no_events_this_year(cursor, config=AlertConfig):
+    """
+    アラート1: 今年度未実施（前年実施あり）
+
+    前年度にイベントを実施していたが、今年度はまだ実施していない学校
+    全件取得（件数制限なし）
+    """
+    return rule_no_events_this_year(load_alert_features(cursor), config)
+
+
 def alert_new_event_low_registration(cursor, config=AlertConfig):
     """
     イベント開始日別会員率
@@ -182,100 +409,11 @@ def alert_member_rate_decline(cursor, config=AlertConfig, member_rate_threshold=
         member_rate_threshold: 会員率の閾値（例: 0.5 = 50%未満）。Noneの場合はフィルタなし
         sales_decline_threshold: 売上低下の閾値（例: -0.2 = 20%以上減少）。Noneの場合はフィルタなし
     """
-    latest_report_id, _ = get_latest_report_id(cursor)
-    current_fy = get_current_fiscal_year()
-    prev_fy = current_fy - 1
-
-    # デフォルト値の設定
-    if member_rate_threshold is None:
-        member_rate_threshold = 1.0  # 100%（実質フィルタなし）
-    if sales_decline_threshold is None:
-        sales_decline_threshold = 0.0  # 0%（実質フィルタなし）
-
-    # event_salesから売上を集計（school_yearly_salesにデータがない場合に対応）
-    query = '''
-        WITH current_member AS (
-            SELECT
-                school_id,
-                SUM(student_count) as students,
-                SUM(member_count) as members,
-                CASE WHEN SUM(student_count) > 0
-                     THEN CAST(SUM(member_count) AS FLOAT) / SUM(student_count)
-                     ELSE 0 END as rate
-            FROM member_rates
-            WHERE report_id = ? AND fiscal_year = ?
-            GROUP BY school_id
-        ),
-        current_sales AS (
-            -- event_salesから今年度の売上を集計
-            SELECT
-                e.school_id,
-                COALESCE(SUM(es.sales), 0) as total_sales
-            FROM events e
-            LEFT JOIN event_sales es ON es.event_id = e.id
-            WHERE e.fiscal_year = ?
-            GROUP BY e.school_id
-        ),
-        prev_sales AS (
-            -- event_salesから前年度の売上を集計
-            SELECT
-                e.school_id,
-                COALESCE(SUM(es.sales), 0) as total_sales
-            FROM events e
-            LEFT JOIN event_sales es ON es.event_id = e.id
-            WHERE e.fiscal_year = ?
-            GROUP BY e.school_id
-        )
-        SELECT
-            s.id,
-            s.school_name,
-            s.attribute,
-            s.studio_name,
-            s.region,
-            s.manager,
-            cm.rate as current_rate,
-            COALESCE(cs.total_sales, 0) as current_sales,
-            COALESCE(ps.total_sales, 0) as prev_sales,
-            CASE WHEN COALESCE(ps.total_sales, 0) > 0
-                 THEN (COALESCE(cs.total_sales, 0) - ps.total_sales) / ps.total_sales
-                 ELSE 0 END as sales_change
-        FROM schools s
-        JOIN current_member cm ON cm.school_id = s.id
-        LEFT JOIN current_sales cs ON cs.school_id = s.id
-        LEFT JOIN prev_sales ps ON ps.school_id = s.id
-        WHERE cm.rate < ?
-          AND COALESCE(ps.total_sales, 0) > 0
-          AND (COALESCE(cs.total_sales, 0) - ps.total_sales) / ps.total_sales < ?
-        ORDER BY cm.rate ASC, sales_change ASC
-    '''
-
-    cursor.execute(query, (
-        latest_report_id, current_fy,
-        current_fy,
-        prev_fy,
-        member_rate_threshold,
-        sales_decline_threshold
-    ))
-
-    results = []
-    for row in cursor.fetchall():
-        level = 'danger' if row[6] < config.MEMBER_RATE_DANGER or row[9] < config.YOY_DECLINE_DANGER else 'warning'
-        results.append({
-            'school_id': row[0],
-            'school_name': row[1],
-            'attribute': row[2] or '',
-            'studio_name': row[3] or '',
-            'region': row[4] or '',
-            'manager': row[5] or '',
-            'member_rate': row[6],
-            'current_sales': row[7],
-            'prev_sales': row[8],
-            'sales_change': row[9],
-            'level': level,
-            'message': f'会員率{row[6]*100:.1f}%、売上{row[9]*100:+.1f}%'
-        })
-
-    return results
+    return rule_member_rate_decline(
+        load_alert_features(cursor), config,
+        member_rate_threshold=member_rate_threshold,
+        sales_decline_threshold=sales_decline_threshold
+    )
 
 
 def alert_new_schools(cursor, config=AlertConfig, target_fy=None, target_month=None):
@@ -291,76 +429,7 @@ def alert_new_schools(cursor, config=AlertConfig, target_fy=None, target_month=N
         target_fy: 対象年度。Noneの場合は現在年度
         target_month: 対象月（1-12）。Noneの場合は全月
     """
-    current_fy = target_fy if target_fy else get_current_fiscal_year()
-    prev_fy = current_fy - 1
-
-    # 月指定がある場合
-    if target_month:
-        # 指定月に開始したイベントを持つ新規校を取得
-        query = '''
-            SELECT
-                s.id,
-                s.school_name,
-                s.attribute,
-                s.studio_name,
-                s.region,
-                s.manager,
-                COUNT(DISTINCT e.id) as event_count,
-                MIN(e.start_date) as first_event_date,
-                COALESCE(SUM(es.sales), 0) as total_sales
-            FROM schools s
-            JOIN events e ON e.school_id = s.id AND e.fiscal_year = ?
-            LEFT JOIN event_sales es ON es.event_id = e.id
-            WHERE NOT EXISTS (
-                SELECT 1 FROM events e_prev
-                WHERE e_prev.school_id = s.id AND e_prev.fiscal_year = ?
-            )
-            AND strftime('%m', e.start_date) = ?
-            GROUP BY s.id, s.school_name, s.attribute, s.studio_name, s.region, s.manager
-            ORDER BY first_event_date DESC, total_sales DESC
-        '''
-        cursor.execute(query, (current_fy, prev_fy, f'{target_month:02d}'))
-    else:
-        query = '''
-            SELECT
-                s.id,
-                s.school_name,
-                s.attribute,
-                s.studio_name,
-                s.region,
-                s.manager,
-                COUNT(DISTINCT e.id) as event_count,
-                MIN(e.start_date) as first_event_date,
-                COALESCE(SUM(es.sales), 0) as total_sales
-            FROM schools s
-            JOIN events e ON e.school_id = s.id AND e.fiscal_year = ?
-            LEFT JOIN event_sales es ON es.event_id = e.id
-            WHERE NOT EXISTS (
-                SELECT 1 FROM events e_prev
-                WHERE e_prev.school_id = s.id AND e_prev.fiscal_year = ?
-            )
-            GROUP BY s.id, s.school_name, s.attribute, s.studio_name, s.region, s.manager
-            ORDER BY first_event_date DESC, total_sales DESC
-        '''
-        cursor.execute(query, (current_fy, prev_fy))
-
-    results = []
-    for row in cursor.fetchall():
-        results.append({
-            'school_id': row[0],
-            'school_name': row[1],
-            'attribute': row[2] or '',
-            'studio_name': row[3] or '',
-            'region': row[4] or '',
-            'manager': row[5] or '',
-            'event_count': row[6],
-            'first_event_date': row[7],
-            'total_sales': row[8],
-            'level': 'info',
-            'message': f'{current_fy}年度{row[6]}件のイベント、売上¥{row[8]:,.0f}'
-        })
-
-    return results
+    return rule_new_schools(load_alert_features(cursor, target_fy), config, target_month=target_month)
 
 
 def alert_studio_performance_decline(cursor, config=AlertConfig):
@@ -447,67 +516,7 @@ def alert_rapid_growth_schools(cursor, config=AlertConfig):
     前年比で150%以上の売上成長を見せている学校（成功事例）
     全件取得（件数制限なし）
     """
-    latest_report_id, _ = get_latest_report_id(cursor)
-    current_fy = get_current_fiscal_year()
-    prev_fy = current_fy - 1
-
-    # event_salesから売上を集計（売上月の年度で比較）
-    query = '''
-        WITH current_sales AS (
-            SELECT
-                e.school_id,
-                COALESCE(SUM(es.sales), 0) as total_sales
-            FROM events e
-            INNER JOIN event_sales es ON es.event_id = e.id
-            WHERE es.fiscal_year = ?
-            GROUP BY e.school_id
-        ),
-        prev_sales AS (
-            SELECT
-                e.school_id,
-                COALESCE(SUM(es.sales), 0) as total_sales
-            FROM events e
-            INNER JOIN event_sales es ON es.event_id = e.id
-            WHERE es.fiscal_year = ?
-            GROUP BY e.school_id
-        )
-        SELECT
-            s.id,
-            s.school_name,
-            s.attribute,
-            s.studio_name,
-            s.region,
-            s.manager,
-            COALESCE(curr.total_sales, 0) as current_sales,
-            COALESCE(prev.total_sales, 0) as prev_sales,
-            (COALESCE(curr.total_sales, 0) - prev.total_sales) / prev.total_sales as growth_rate
-        FROM schools s
-        JOIN current_sales curr ON curr.school_id = s.id
-        JOIN prev_sales prev ON prev.school_id = s.id
-        WHERE prev.total_sales > 10000  -- 最低売上を設定
-          AND (COALESCE(curr.total_sales, 0) - prev.total_sales) / prev.total_sales >= 0.5
-        ORDER BY growth_rate DESC
-    '''
-
-    cursor.execute(query, (current_fy, prev_fy))
-
-    results = []
-    for row in cursor.fetchall():
-        results.append({
-            'school_id': row[0],
-            'school_name': row[1],
-            'attribute': row[2] or '',
-            'studio_name': row[3] or '',
-            'region': row[4] or '',
-            'manager': row[5] or '',
-            'current_sales': row[6],
-            'prev_sales': row[7],
-            'growth_rate': row[8],
-            'level': 'success',
-            'message': f'売上{row[8]*100:+.1f}%成長！'
-        })
-
-    return results
+    return rule_rapid_growth(load_alert_features(cursor), config)
 
 
 def get_yearly_events_comparison(cursor, school_id, left_year, right_year, month=None):
@@ -674,113 +683,10 @@ def get_sales_unit_price_analysis(cursor, target_fy=None):
 
     会員あたり売上単価を計算し、属性平均と比較
     """
-    if target_fy is None:
-        target_fy = get_current_fiscal_year()
-
     latest_report_id, _ = get_latest_report_id(cursor)
     if not latest_report_id:
         return []
-
-    # まず属性別の平均単価を計算
-    attr_avg_query = '''
-        WITH school_data AS (
-            SELECT
-                s.id as school_id,
-                s.attribute,
-                COALESCE(SUM(es.sales), 0) as total_sales,
-                COALESCE(mr.total_members, 0) as total_members
-            FROM schools s
-            LEFT JOIN events e ON e.school_id = s.id AND e.fiscal_year = ?
-            LEFT JOIN (
-                SELECT event_id, SUM(sales) as sales
-                FROM event_sales
-                GROUP BY event_id
-            ) es ON es.event_id = e.id
-            LEFT JOIN (
-                SELECT school_id, SUM(member_count) as total_members
-                FROM member_rates
-                WHERE report_id = ? AND fiscal_year = ?
-                GROUP BY school_id
-            ) mr ON mr.school_id = s.id
-            GROUP BY s.id, s.attribute
-        )
-        SELECT
-            attribute,
-            AVG(CASE WHEN total_members > 0 THEN total_sales / total_members ELSE 0 END) as avg_unit_price
-        FROM school_data
-        WHERE total_members > 0
-        GROUP BY attribute
-    '''
-
-    cursor.execute(attr_avg_query, (target_fy, latest_report_id, target_fy))
-    attr_averages = {row[0]: row[1] for row in cursor.fetchall()}
-
-    # 学校ごとのデータを取得
-    query = '''
-        SELECT
-            s.id,
-            s.school_name,
-            s.attribute,
-            s.studio_name,
-            s.region,
-            COALESCE(mr.total_members, 0) as total_members,
-            COALESCE(mr.total_students, 0) as total_students,
-            COALESCE(sales.total_sales, 0) as total_sales,
-            CASE WHEN COALESCE(mr.total_students, 0) > 0
-                 THEN CAST(mr.total_members AS FLOAT) / mr.total_students
-                 ELSE 0 END as member_rate
-        FROM schools s
-        LEFT JOIN (
-            SELECT school_id, SUM(member_count) as total_members, SUM(student_count) as total_students
-            FROM member_rates
-            WHERE report_id = ? AND fiscal_year = ?
-            GROUP BY school_id
-        ) mr ON mr.school_id = s.id
-        LEFT JOIN (
-            SELECT e.school_id, SUM(es.sales) as total_sales
-            FROM events e
-            LEFT JOIN (
-                SELECT event_id, SUM(sales) as sales
-                FROM event_sales
-                GROUP BY event_id
-            ) es ON es.event_id = e.id
-            WHERE e.fiscal_year = ?
-            GROUP BY e.school_id
-        ) sales ON sales.school_id = s.id
-        WHERE mr.total_members > 0
-        ORDER BY s.school_name
-    '''
-
-    cursor.execute(query, (latest_report_id, target_fy, target_fy))
-    results = []
-
-    for row in cursor.fetchall():
-        total_members = row[5]
-        total_sales = row[7]
-        member_rate = row[8]
-        unit_price = total_sales / total_members if total_members > 0 else 0
-        attribute = row[2] or ''
-        attr_avg = attr_averages.get(attribute, 0)
-        diff = unit_price - attr_avg
-
-        results.append({
-            'school_id': row[0],
-            'school_name': row[1],
-            'attribute': attribute,
-            'studio_name': row[3] or '',
-            'branch_name': row[4] or '',
-            'total_members': total_members,
-            'total_students': row[6],
-            'total_sales': total_sales,
-            'member_rate': member_rate,
-            'unit_price': unit_price,
-            'attr_avg': attr_avg,
-            'diff': diff,
-            'level': 'success' if diff > 0 else 'warning',
-            'message': f'単価¥{unit_price:,.0f}（属性平均比{diff:+,.0f}）'
-        })
-
-    return results
+    return rule_sales_unit_price(load_alert_features(cursor, target_fy))
 
 
 def get_schools_for_filter(cursor):
@@ -794,15 +700,22 @@ def get_all_alerts(db_path=None):
     conn = get_connection(db_path)
     cursor = conn.cursor()
 
+    # 学校単位のアラートは特徴量を1回だけ作って全ルールを評価
+    features = load_alert_features(cursor)
+    school_alerts = {name: rule(features) for name, rule in SCHOOL_ALERT_RULES.items()}
+    latest_report_id, _ = get_latest_report_id(cursor)
+    if not latest_report_id:
+        school_alerts['sales_unit_price'] = []
+
     alerts = {
-        'no_events_this_year': alert_no_events_this_year(cursor),
+        'no_events_this_year': school_alerts['no_events_this_year'],
         'new_event_low_registration': alert_new_event_low_registration(cursor),
-        'member_rate_decline': alert_member_rate_decline(cursor),
-        'new_schools': alert_new_schools(cursor),
+        'member_rate_decline': school_alerts['member_rate_decline'],
+        'new_schools': school_alerts['new_schools'],
         'studio_performance_decline': alert_studio_performance_decline(cursor),
-        'rapid_growth': alert_rapid_growth_schools(cursor),
+        'rapid_growth': school_alerts['rapid_growth'],
         'member_rate_trend_improved': get_member_rate_trend_improved(cursor),
-        'sales_unit_price': get_sales_unit_price_analysis(cursor),
+        'sales_unit_price': school_alerts['sales_unit_price'],
         'schools_for_filter': get_schools_for_filter(cursor),
     }
 
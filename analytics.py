@@ -8,6 +8,9 @@
 
 from datetime import datetime, timedelta
 from collections import defaultdict
+
+import pandas as pd
+
 from database import get_connection
 
 
@@ -366,65 +369,52 @@ def analyze_growth_curves(cursor):
         report_date = datetime.strptime(report_date, '%Y-%m-%d').date()
 
     # 過去のイベントデータから成長カーブを算出
-    # （イベント開始日と、その時点での会員率を紐付ける）
+    # （イベント開始日と、開始から90日以内の各報告書時点の会員率を紐付ける）
+    # 学校×報告書日の会員率を先に集計し、イベントとは経過日数の範囲で結合する
     query = '''
+        WITH report_rates AS (
+            SELECT
+                m.school_id,
+                r.report_date,
+                CAST(SUM(m.member_count) AS FLOAT) / SUM(m.student_count) as rate
+            FROM member_rates m
+            JOIN reports r ON m.report_id = r.id
+            WHERE m.student_count > 0
+            GROUP BY m.school_id, r.report_date
+        )
         SELECT
             s.id as school_id,
-            s.school_name,
             s.attribute,
-            e.event_name,
-            e.start_date,
-            r.report_date,
-            SUM(m.student_count) as students,
-            SUM(m.member_count) as members,
-            CASE WHEN SUM(m.student_count) > 0
-                 THEN CAST(SUM(m.member_count) AS FLOAT) / SUM(m.student_count)
-                 ELSE 0 END as rate
+            CAST(julianday(rr.report_date) - julianday(e.start_date) AS INTEGER) / 7 as week,
+            rr.rate
         FROM events e
         JOIN schools s ON e.school_id = s.id
-        JOIN member_rates m ON m.school_id = s.id
-        JOIN reports r ON m.report_id = r.id
+        JOIN report_rates rr
+            ON rr.school_id = e.school_id
+            AND rr.report_date >= e.start_date
+            AND rr.report_date <= date(e.start_date, '+90 days')
         WHERE e.start_date IS NOT NULL
-          AND m.student_count > 0
-        GROUP BY s.id, s.school_name, s.attribute, e.event_name, e.start_date, r.report_date
-        ORDER BY s.school_name, e.start_date, r.report_date
     '''
 
     cursor.execute(query)
-    rows = cursor.fetchall()
+    history = pd.DataFrame(cursor.fetchall(), columns=['school_id', 'attribute', 'week', 'rate'])
 
-    # 経過日数ごとの会員率を集計（属性別）
-    attribute_curves = defaultdict(lambda: defaultdict(list))
-    school_curves = defaultdict(lambda: defaultdict(list))
+    # 週単位の会員率平均（属性別・学校別）
+    attribute_means = (
+        history[history['attribute'].fillna('') != '']
+        .groupby(['attribute', 'week'])['rate'].mean()
+    )
+    school_means = history.groupby(['school_id', 'week'])['rate'].mean()
 
-    for row in rows:
-        school_id, school_name, attribute, event_name, start_date, rpt_date, students, members, rate = row
+    # 属性別の標準カーブ
+    standard_curves = defaultdict(dict)
+    for (attr, week), rate in attribute_means.items():
+        standard_curves[attr][int(week)] = float(rate)
+    standard_curves = dict(standard_curves)
 
-        if start_date is None:
-            continue
-
-        if isinstance(start_date, str):
-            start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
-        if isinstance(rpt_date, str):
-            rpt_date = datetime.strptime(rpt_date, '%Y-%m-%d').date()
-
-        days_elapsed = (rpt_date - start_date).days
-
-        if 0 <= days_elapsed <= 90:  # 90日以内のデータのみ
-            # 週単位でグループ化
-            week = days_elapsed // 7
-            if attribute:
-                attribute_curves[attribute][week].append(rate)
-            school_curves[school_id][week].append(rate)
-
-    # 属性別の標準カーブを計算
-    standard_curves = {}
-    for attr, weeks in attribute_curves.items():
-        curve = {}
-        for week, rates in weeks.items():
-            if rates:
-                curve[week] = sum(rates) / len(rates)
-        standard_curves[attr] = curve
+    school_curves = defaultdict(dict)
+    for (school_id, week), rate in school_means.items():
+        school_curves[int(school_id)][int(week)] = float(rate)
 
     # 現在進行中のイベントを評価
     current_fy = get_current_fiscal_year()
@@ -467,8 +457,8 @@ def analyze_growth_curves(cursor):
         expected_rate = None
 
         # 1. 学校固有のカーブ
-        if school_id in school_curves and week in school_curves[school_id]:
-            expected_rate = sum(school_curves[school_id][week]) / len(school_curves[school_id][week])
+        if week in school_curves.get(school_id, {}):
+            expected_rate = school_curves[school_id][week]
 
         # 2. 属性別カーブ
         if expected_rate is None and attribute in standard_curves and week in standard_curves[attribute]:
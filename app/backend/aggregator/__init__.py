@@ -2,7 +2,7 @@
 集計ロジック（SP_sales_ver1.1から移植）
 """
 
-from .sales import SalesAggregator, SchoolMasterMismatchError
+from .sales import SalesAggregator, SchoolMasterMismatchError, AggregationResult, RecordView
 from .summary import SalesSummary
 from .accounts import AccountsCalculator
 from .excel_output import ExcelExporter
@@ -11,6 +11,8 @@ from .cumulative import CumulativeAggregator
 __all__ = [
     'SalesAggregator',
     'SchoolMasterMismatchError',
+    'AggregationResult',
+    'RecordView',
     'SalesSummary',
     'AccountsCalculator',
     'ExcelExporter',
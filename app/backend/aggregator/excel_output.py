@@ -8,7 +8,7 @@ from typing import Optional
 import logging
 from datetime import datetime
 
-from .sales import AggregationResult, SchoolSalesRecord, EventSalesRecord
+from .sales import AggregationResult, SCHOOL_SALES_COLUMNS, EVENT_SALES_COLUMNS
 
 logger = logging.getLogger(__name__)
 
@@ -143,31 +143,29 @@ class ExcelExporter:
 
     def _write_school_sheet(self, writer: pd.ExcelWriter) -> None:
         """学校別シートを出力"""
-        if not self.result.school_sales:
+        if self.result.school_frame.empty:
             return
 
-        school_data = {
-            "担当者": [s.salesman for s in self.result.school_sales],
-            "写真館": [s.photostudio for s in self.result.school_sales],
-            "学校名": [s.school_name for s in self.result.school_sales],
-            "売り上げ": [s.sales for s in self.result.school_sales]
-        }
-        school_df = pd.DataFrame(school_data)
+        school_df = self.result.school_frame[SCHOOL_SALES_COLUMNS].rename(columns={
+            "salesman": "担当者",
+            "photostudio": "写真館",
+            "school_name": "学校名",
+            "sales": "売り上げ"
+        })
         school_df.to_excel(writer, sheet_name="学校別", index=False)
 
     def _write_event_sheet(self, writer: pd.ExcelWriter) -> None:
         """イベント別シートを出力"""
-        if not self.result.event_sales:
+        if self.result.event_frame.empty:
             return
 
-        event_data = {
-            "事業所": [e.branch_name for e in self.result.event_sales],
-            "学校名": [e.school_name for e in self.result.event_sales],
-            "イベント名": [e.event_name for e in self.result.event_sales],
-            "イベント開始日": [e.event_start_date for e in self.result.event_sales],
-            "売り上げ": [e.sales for e in self.result.event_sales]
-        }
-        event_df = pd.DataFrame(event_data)
+        event_df = self.result.event_frame[EVENT_SALES_COLUMNS].rename(columns={
+            "branch_name": "事業所",
+            "school_name": "学校名",
+            "event_name": "イベント名",
+            "event_start_date": "イベント開始日",
+            "sales": "売り上げ"
+        })
         event_df.to_excel(writer, sheet_name="イベント別", index=False)
 
     def _write_accounts_sheet(self, writer: pd.ExcelWriter) -> None:
@@ -4,6 +4,7 @@ SP_sales_ver1.1 の sales.py から移植・リファクタリング
 """
 import pandas as pd
 from dataclasses import dataclass, field
+from collections.abc import Iterator, Sequence
 from typing import List, Dict, Optional, Callable
 import logging
 
@@ -46,24 +47,93 @@ class EventSalesRecord:
     sales: float
 
 
+# 列指向で保持する集計結果のカラム（レコードクラスのフィールドと同じ並び）
+SCHOOL_SALES_COLUMNS = ["salesman", "photostudio", "school_name", "sales"]
+EVENT_SALES_COLUMNS = ["branch_name", "school_name", "event_name", "event_start_date", "sales"]
+
+
+class RecordView(Sequence):
+    """
+    DataFrameを行レコードのリストとして見せる読み取り専用ビュー
+
+    件数やスライスはDataFrameのまま扱い、レコードオブジェクトは
+    参照・反復されたときに1件ずつ生成する（大量の小オブジェクトを保持しない）。
+    """
+
+    def __init__(self, frame: pd.DataFrame, record_cls):
+        self.frame = frame
+        self.record_cls = record_cls
+
+    def __len__(self) -> int:
+        return len(self.frame)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return RecordView(self.frame.iloc[index], self.record_cls)
+        return self.record_cls(*self.frame.iloc[index].tolist())
+
+    def __iter__(self) -> Iterator:
+        for values in self.frame.itertuples(index=False, name=None):
+            yield self.record_cls(*values)
+
+    def __eq__(self, other):
+        if isinstance(other, (RecordView, list)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"RecordView({self.record_cls.__name__}, {len(self)}件)"
+
+
+def _records_to_frame(records, columns: List[str]) -> pd.DataFrame:
+    """レコードのリスト（またはRecordView）を列指向のDataFrameに変換"""
+    if isinstance(records, RecordView):
+        return records.frame.reset_index(drop=True)
+    return pd.DataFrame(
+        [[getattr(r, col) for col in columns] for r in records],
+        columns=columns
+    )
+
+
 @dataclass
 class SalesmanSalesRecord:
     """担当者別売上レコード"""
     salesman: str
     sales: float
-    schools: List[SchoolSalesRecord] = field(default_factory=list)
+    schools: Sequence[SchoolSalesRecord] = field(default_factory=list)
 
 
 @dataclass
 class AggregationResult:
-    """集計結果全体を格納するデータクラス"""
+    """
+    集計結果全体を格納するデータクラス
+
+    学校別・イベント別の結果は件数が多いため列指向（school_frame / event_frame）で保持する。
+    school_sales / event_sales は従来のレコードリストAPIとの互換ビュー。
+    """
     summary: SalesSummaryResult = None
     branch_sales: List[BranchSalesRecord] = field(default_factory=list)
     salesman_sales: List[SalesmanSalesRecord] = field(default_factory=list)
-    school_sales: List[SchoolSalesRecord] = field(default_factory=list)
-    event_sales: List[EventSalesRecord] = field(default_factory=list)
+    school_frame: pd.DataFrame = field(default_factory=lambda: pd.DataFrame(columns=SCHOOL_SALES_COLUMNS))
+    event_frame: pd.DataFrame = field(default_factory=lambda: pd.DataFrame(columns=EVENT_SALES_COLUMNS))
     unmatched_schools: List[str] = field(default_factory=list)
 
+    @property
+    def school_sales(self) -> RecordView:
+        return RecordView(self.school_frame, SchoolSalesRecord)
+
+    @school_sales.setter
+    def school_sales(self, records):
+        self.school_frame = _records_to_frame(records, SCHOOL_SALES_COLUMNS)
+
+    @property
+    def event_sales(self) -> RecordView:
+        return RecordView(self.event_frame, EventSalesRecord)
+
+    @event_sales.setter
+    def event_sales(self, records):
+        self.event_frame = _records_to_frame(records, EVENT_SALES_COLUMNS)
+
 
 class SalesAggregator:
     """
@@ -345,7 +415,7 @@ class SalesAggregator:
             from pathlib import Path
             # database_v2モジュールをインポート
             sys.path.insert(0, str(Path(__file__).parent.parent.parent.parent))
-            from database_v2 import get_connection
+            from database_v2 import get_connection, bump_db_generation
             
             conn = get_connection()
             cursor = conn.cursor()
@@ -425,9 +495,15 @@ class SalesAggregator:
                     skipped_count += 1
                     continue
             
+            # 学校名の別名テーブルにも新しい名称を反映（次回の取り込みで索引検索のみで解決）
+            from importer_v2 import sync_school_name_aliases
+            alias_count = sync_school_name_aliases(cursor)
+            bump_db_generation(cursor)
+            
             conn.commit()
             conn.close()
             
+            logger.info(f"学校名の別名を{alias_count}件登録しました")
             logger.info(f"schools_master更新完了: 新規{inserted_count}件, 更新{updated_count}件, スキップ{skipped_count}件")
             
         except Exception as e:
@@ -520,42 +596,49 @@ class SalesAggregator:
         if self.matched_df is None:
             return
 
-        master_sales = self.matched_df.groupby("_matched_master_index")["_net_sales"].sum()
+        master_sales = (
+            self.matched_df.groupby("_matched_master_index")["_net_sales"].sum()
+            .reindex(self.master_df.index, fill_value=0)
+            .astype(float)
+        )
         salesman_series = (
             self.master_df[self.COL_SALESMAN].fillna("").astype(str)
             if self.COL_SALESMAN in self.master_df.columns
             else pd.Series("", index=self.master_df.index)
         )
         salesmen = salesman_series.drop_duplicates().tolist()
+        salesman_totals = master_sales.groupby(salesman_series, sort=False).sum()
+
+        # 学校別（担当者の出現順 → マスタの行順、売上0の学校は除外）
+        empty = pd.Series("", index=self.master_df.index)
+        school_frame = pd.DataFrame({
+            "salesman": salesman_series,
+            "photostudio": self.master_df.get(self.COL_STUDIO, empty),
+            "school_name": self.master_df.get(self.COL_SCHOOL_NAME, empty),
+            "sales": master_sales
+        })
+        school_frame = school_frame[master_sales.abs() >= 1e-9]
+        salesman_order = {name: i for i, name in enumerate(salesmen)}
+        school_frame = (
+            school_frame
+            .assign(_order=school_frame["salesman"].map(salesman_order))
+            .sort_values("_order", kind="stable")
+            .drop(columns="_order")
+            .reset_index(drop=True)
+        )
+        self.result.school_frame = school_frame
 
         for salesman in salesmen:
-            salesman_rows = self.master_df[salesman_series == salesman]
-
-            salesman_total = 0.0
-            school_records: List[SchoolSalesRecord] = []
-
-            for master_idx, row in salesman_rows.iterrows():
-                school_sales = float(master_sales.get(master_idx, 0))
-                salesman_total += school_sales
-
-                if abs(school_sales) < 1e-9:
-                    continue
-
-                school_records.append(SchoolSalesRecord(
-                    salesman=salesman,
-                    photostudio=row.get(self.COL_STUDIO, ""),
-                    school_name=row.get(self.COL_SCHOOL_NAME, ""),
-                    sales=school_sales
-                ))
-
+            salesman_total = float(salesman_totals.get(salesman, 0.0))
             self.result.salesman_sales.append(
                 SalesmanSalesRecord(
                     salesman=salesman,
                     sales=salesman_total,
-                    schools=school_records
+                    schools=RecordView(
+                        school_frame[school_frame["salesman"] == salesman], SchoolSalesRecord
+                    )
                 )
             )
-            self.result.school_sales.extend(school_records)
             logger.info(f"担当者 {salesman}: {salesman_total:,.0f}円")
 
     def _aggregate_by_event(self) -> None:
@@ -585,14 +668,8 @@ class SalesAggregator:
             .sum()
             .reset_index()
         )
-
-        for _, row in grouped.iterrows():
-            self.result.event_sales.append(EventSalesRecord(
-                branch_name=row["_master_branch"],
-                school_name=row["_master_school_name"],
-                event_name=row["_event_name"],
-                event_start_date=row["_event_start"],
-                sales=float(row["_net_sales"])
-            ))
+        grouped.columns = EVENT_SALES_COLUMNS
+        grouped["sales"] = grouped["sales"].astype(float)
+        self.result.event_frame = grouped
 
         logger.info(f"イベント別集計完了: {len(self.result.event_sales)}件")
@@ -5,10 +5,13 @@ from flask import Flask, request, jsonify, send_file, Response, send_from_direct
 from flask_cors import CORS
 from pathlib import Path
 import sys
+import base64
+import csv
+import io
 import json
 import logging
-import queue
 import threading
+from collections import OrderedDict
 from datetime import datetime
 from typing import Optional
 
@@ -17,8 +20,8 @@ APP_DIR = Path(__file__).parent.parent
 if str(APP_DIR) not in sys.path:
     sys.path.insert(0, str(APP_DIR))
 
-from backend.aggregator import SalesAggregator, AccountsCalculator, ExcelExporter, SchoolMasterMismatchError, CumulativeAggregator
-from backend.services import FileHandler, DatabaseService
+# 集計モジュール（pandas / openpyxl）は起動を遅らせないよう各エンドポイント内でインポートする
+from backend.services import FileHandler, DatabaseService, JobManager, JobFailed, SessionStore, ModuleWarmup
 
 # ロギング設定
 logging.basicConfig(
@@ -30,6 +33,14 @@ logger = logging.getLogger(__name__)
 # フロントエンドディレクトリ
 FRONTEND_DIR = Path(__file__).parent.parent / 'frontend'
 
+# 起動後にバックグラウンドで読み込むモジュール（集計・取込・ダッシュボード生成）
+WARMUP_MODULES = (
+    'backend.aggregator',
+    'database_v2',
+    'importer_v2',
+    'dashboard_v2',
+)
+
 
 def create_app(config=None):
     """
@@ -66,19 +77,50 @@ def create_app(config=None):
     # ディレクトリ作成
     Path(app.config['UPLOAD_DIR']).mkdir(parents=True, exist_ok=True)
 
-    # 進捗通知用キュー
-    progress_queues = {}
+    # 集計ジョブ（リクエストスレッドを長時間占有しないようワーカーで実行）
+    app.config.setdefault('JOB_WORKERS', 2)
+    job_manager = JobManager(max_workers=app.config['JOB_WORKERS'])
+    app.job_manager = job_manager
 
     # サービス初期化
     file_handler = FileHandler(Path(app.config['UPLOAD_DIR']))
 
-    # 一時データ保存用
-    app.session_data = {}
+    # 一時データ保存用（TTL・件数上限・メモリ上限付き、大きな集計結果はディスクへ退避）
+    app.config.setdefault('SESSION_TTL_SEC', 6 * 60 * 60)
+    app.config.setdefault('SESSION_MAX_COUNT', 200)
+    app.config.setdefault('SESSION_MEMORY_LIMIT_MB', 256)
+    app.session_data = SessionStore(
+        Path(app.config['UPLOAD_DIR']) / '.sessions',
+        ttl_sec=app.config['SESSION_TTL_SEC'],
+        max_sessions=app.config['SESSION_MAX_COUNT'],
+        memory_limit_bytes=app.config['SESSION_MEMORY_LIMIT_MB'] * 1024 * 1024
+    )
+
+    # 重いモジュールの事前読み込み（待ち受け開始を待たせない）
+    app.config.setdefault('WARMUP_ENABLED', True)
+    app.warmup = ModuleWarmup(WARMUP_MODULES)
+    if app.config['WARMUP_ENABLED']:
+        app.warmup.start()
+    else:
+        app.warmup.disable()
 
     @app.route('/api/health', methods=['GET'])
     def health_check():
-        """ヘルスチェック"""
-        return jsonify({'status': 'ok', 'timestamp': datetime.now().isoformat()})
+        """ヘルスチェック（待ち受け確認用。モジュールの読み込み完了は待たない）"""
+        return jsonify({
+            'status': 'ok',
+            'ready': app.warmup.ready,
+            'timestamp': datetime.now().isoformat()
+        })
+
+    @app.route('/api/ready', methods=['GET'])
+    def ready_check():
+        """準備完了チェック（集計・取込・ダッシュボードのモジュール読み込みが完了するまで503）"""
+        return jsonify({
+            'status': 'ok' if app.warmup.ready else 'starting',
+            **app.warmup.to_dict(),
+            'timestamp': datetime.now().isoformat()
+        }), 200 if app.warmup.ready else 503
 
     @app.route('/api/upload', methods=['POST'])
     def upload_files():
@@ -106,8 +148,7 @@ def create_app(config=None):
                     saved_files[key] = str(filepath)
 
             # セッションに保存
-            session_id = datetime.now().strftime('%Y%m%d%H%M%S')
-            app.session_data[session_id] = saved_files
+            session_id = app.session_data.create(saved_files)
 
             return jsonify({
                 'status': 'success',
@@ -119,36 +160,31 @@ def create_app(config=None):
             logger.error(f"アップロードエラー: {e}")
             return jsonify({'status': 'error', 'message': str(e)}), 500
 
-    @app.route('/api/aggregate', methods=['POST'])
-    def aggregate():
-        """集計実行"""
-        try:
-            data = request.get_json()
-            session_id = data.get('session_id')
-            fiscal_year = data.get('fiscal_year')
-            month = data.get('month')
-
-            # セッションデータ取得
-            if session_id not in app.session_data:
-                return jsonify({
-                    'status': 'error',
-                    'message': 'セッションが見つかりません。ファイルを再アップロードしてください。'
-                }), 400
+    def _run_aggregate_job(report, session_id, fiscal_year, month):
+        """集計パイプライン本体（ワーカースレッドで実行）"""
+        from backend.aggregator import SalesAggregator, AccountsCalculator, ExcelExporter, SchoolMasterMismatchError
 
+        try:
             files = app.session_data[session_id]
 
             # ファイル読み込み
+            report('ファイル読み込みを開始', 0)
             sales_df = file_handler.read_sales_csv(Path(files['sales_file']))
             accounts_df = file_handler.read_accounts_csv(Path(files['accounts_file']))
             master_df = file_handler.read_master_excel(Path(files['master_file']))
+            report('ファイル読み込み完了', 10)
 
-            # 集計実行
-            aggregator = SalesAggregator(sales_df, master_df)
+            # 集計実行（集計側の0〜100%を全体の10〜80%に割り当てる）
+            aggregator = SalesAggregator(
+                sales_df, master_df,
+                progress_callback=lambda message, percentage: report(message, 10 + percentage * 70 // 100)
+            )
             result = aggregator.aggregate_all()
 
             # 会員率計算
             accounts_calc = AccountsCalculator(accounts_df)
             accounts_result_df = accounts_calc.calculate()
+            report('会員率計算完了', 85)
 
             # Excel出力
             output_dir = Path(app.config['OUTPUT_DIR'])
@@ -160,12 +196,15 @@ def create_app(config=None):
                 accounts_df=accounts_result_df
             )
             output_path = exporter.export()
+            report('Excel出力完了', 95)
 
-            # 結果をセッションに保存
+            # 結果をセッションに保存（DB直接保存用に会員率・対象年月も保持）
             app.session_data[session_id]['output_path'] = str(output_path)
             app.session_data[session_id]['result'] = result
+            app.session_data[session_id]['accounts'] = accounts_result_df
+            app.session_data[session_id]['period'] = {'fiscal_year': fiscal_year, 'month': month}
 
-            return jsonify({
+            return {
                 'status': 'success',
                 'summary': result.summary.to_dict(),
                 'output_file': output_path.name,
@@ -176,23 +215,71 @@ def create_app(config=None):
                     'event_count': len(result.event_sales),
                     'unmatched_count': len(result.unmatched_schools)
                 }
-            })
+            }
 
         except SchoolMasterMismatchError as e:
             logger.error(f"マスタ不一致エラー: {e}")
-            return jsonify({
+            raise JobFailed({
                 'status': 'error',
                 'error_type': 'master_mismatch',
                 'message': str(e),
                 'unmatched_schools': e.unmatched_schools
-            }), 400
+            }, 400)
         except ValueError as e:
             logger.error(f"バリデーションエラー: {e}")
-            return jsonify({'status': 'error', 'message': str(e)}), 400
+            raise JobFailed({'status': 'error', 'message': str(e)}, 400)
         except Exception as e:
             logger.error(f"集計エラー: {e}")
+            raise JobFailed({'status': 'error', 'message': str(e)}, 500)
+
+    @app.route('/api/aggregate', methods=['POST'])
+    def aggregate():
+        """集計ジョブ登録（ジョブIDを即座に返し、進捗は /api/progress/<job_id> で通知）"""
+        try:
+            data = request.get_json()
+            session_id = data.get('session_id')
+            fiscal_year = data.get('fiscal_year')
+            month = data.get('month')
+
+            # セッションデータ取得
+            if session_id not in app.session_data:
+                return jsonify({
+                    'status': 'error',
+                    'message': 'セッションが見つかりません。ファイルを再アップロードしてください。'
+                }), 400
+
+            job_id = job_manager.submit(
+                'aggregate', _run_aggregate_job, session_id, fiscal_year, month,
+                session_id=session_id
+            )
+
+            return jsonify({
+                'status': 'accepted',
+                'job_id': job_id,
+                'progress_url': f'/api/progress/{job_id}',
+                'result_url': f'/api/jobs/{job_id}'
+            }), 202
+
+        except Exception as e:
+            logger.error(f"集計ジョブ登録エラー: {e}")
             return jsonify({'status': 'error', 'message': str(e)}), 500
 
+    @app.route('/api/jobs/<job_id>', methods=['GET'])
+    def get_job(job_id):
+        """ジョブ状態・結果取得（完了後は集計APIと同じ形式の結果を返す）"""
+        job = job_manager.get(job_id)
+        if job is None:
+            return jsonify({
+                'status': 'error',
+                'message': 'ジョブが見つかりません'
+            }), 404
+
+        if job.status == 'success':
+            return jsonify({**job.result, 'job': job.to_dict(include_result=False)})
+        if job.status == 'error':
+            return jsonify({**job.error, 'job': job.to_dict(include_result=False)}), job.http_status
+        return jsonify({'status': job.status, 'job': job.to_dict(include_result=False)}), 202
+
     @app.route('/api/download/<session_id>', methods=['GET'])
     def download_file(session_id):
         """Excelファイルダウンロード"""
@@ -222,7 +309,7 @@ def create_app(config=None):
 
     @app.route('/api/save-db', methods=['POST'])
     def save_to_database():
-        """データベースに保存"""
+        """データベースに保存（mode: 'excel'=出力Excelを再取り込み（既定）、'direct'=集計結果を直接保存）"""
         try:
             data = request.get_json()
             session_id = data.get('session_id')
@@ -233,7 +320,8 @@ def create_app(config=None):
                     'message': 'セッションが見つかりません'
                 }), 404
 
-            output_path = app.session_data[session_id].get('output_path')
+            session = app.session_data[session_id]
+            output_path = session.get('output_path')
             if not output_path:
                 return jsonify({
                     'status': 'error',
@@ -241,9 +329,20 @@ def create_app(config=None):
                 }), 400
 
             db_service = DatabaseService()
-            success = db_service.save_to_database(Path(output_path))
+            period = session.get('period') or {}
+            use_direct = data.get('mode', 'excel') == 'direct'
+            if use_direct and period.get('fiscal_year') and period.get('month') and 'result' in session:
+                # 集計結果を直接保存（Excelの書き出し→再読み込みを省略）
+                success = db_service.save_aggregation_result(
+                    session['result'], session.get('accounts'),
+                    int(period['fiscal_year']), int(period['month']),
+                    source_name=Path(output_path).name
+                )
+            else:
+                success = db_service.save_to_database(Path(output_path))
 
             if success:
+                invalidate_analytics_cache()
                 return jsonify({'status': 'success', 'message': 'データベースに保存しました'})
             else:
                 return jsonify({
@@ -293,21 +392,23 @@ def create_app(config=None):
             'current_month': datetime.now().month
         })
 
-    @app.route('/api/progress/<session_id>', methods=['GET'])
-    def get_progress(session_id):
-        """進捗状況取得（Server-Sent Events）"""
+    @app.route('/api/progress/<job_id>', methods=['GET'])
+    def get_progress(job_id):
+        """進捗状況取得（Server-Sent Events）。セッションIDを渡した場合は最新のジョブを購読"""
+        if job_manager.get(job_id) is None:
+            job = job_manager.find_by_session(job_id)
+            if job is not None:
+                job_id = job.id
+
         def generate():
-            q = progress_queues.get(session_id, queue.Queue())
-            while True:
-                try:
-                    message = q.get(timeout=30)
-                    yield f"data: {json.dumps(message)}\n\n"
-                    if message.get('percentage', 0) >= 100:
-                        break
-                except queue.Empty:
-                    yield f"data: {json.dumps({'status': 'waiting'})}\n\n"
+            for event in job_manager.iter_events(job_id):
+                yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
 
-        return Response(generate(), mimetype='text/event-stream')
+        return Response(
+            generate(),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
 
     # ========== 累積集計API ==========
 
@@ -336,10 +437,9 @@ def create_app(config=None):
             )
 
             # セッションに保存
-            session_id = f"cum_{datetime.now().strftime('%Y%m%d%H%M%S')}"
-            app.session_data[session_id] = {
+            session_id = app.session_data.create({
                 'input_file': str(filepath)
-            }
+            }, prefix='cum_')
 
             # 既存累積ファイルがある場合
             existing_file = files.get('existing_file')
@@ -390,6 +490,7 @@ def create_app(config=None):
                 output_dir = Path(app.config['OUTPUT_DIR'])
 
             # 累積集計実行
+            from backend.aggregator import CumulativeAggregator
             aggregator = CumulativeAggregator(
                 input_path=input_path,
                 output_dir=output_dir,
@@ -496,11 +597,10 @@ def create_app(config=None):
                 }), 400
 
             # セッションに保存
-            session_id = f"cum_multi_{datetime.now().strftime('%Y%m%d%H%M%S')}"
-            app.session_data[session_id] = {
+            session_id = app.session_data.create({
                 'input_files': saved_files,
                 'fiscal_year': fiscal_year
-            }
+            }, prefix='cum_multi_')
 
             # 既存累積ファイルのアップロードがある場合
             if 'existing_file' in files:
@@ -558,6 +658,8 @@ def create_app(config=None):
             else:
                 output_dir = Path(app.config['OUTPUT_DIR'])
 
+            from backend.aggregator import CumulativeAggregator
+
             # 年月順にソート（古い順）
             input_files_sorted = sorted(input_files, key=lambda x: (x['year'], x['month']))
 
@@ -684,10 +786,9 @@ def create_app(config=None):
                 }), 400
 
             # セッションに保存
-            session_id = f"pub_{datetime.now().strftime('%Y%m%d%H%M%S')}"
-            app.session_data[session_id] = {
+            session_id = app.session_data.create({
                 'files': saved_files
-            }
+            }, prefix='pub_')
 
             return jsonify({
                 'status': 'success',
@@ -723,68 +824,37 @@ def create_app(config=None):
                 'member_rates': 0
             }
             
-            # 各ファイルをインポート
-            imported_count = 0
-            report_ids = []  # ロールバック用にreport_idを保持
-            
-            try:
-                for file_info in files:
-                    filepath = Path(file_info['path'])
-                    if filepath.exists():
-                        # Ver2のimporterを使用
-                        from importer_v2 import import_excel_v2
-                        result = import_excel_v2(str(filepath))
-                        
-                        if result and result.get('success'):
-                            imported_count += 1
-                            report_ids.append(result['report_id'])
-                            
-                            # 統計情報を集計（Ver2のstats形式）
-                            stats = result.get('stats', {})
-                            for key in total_stats:
-                                if key in stats:
-                                    # statsの値が直接整数の場合と辞書の場合の両方に対応
-                                    value = stats[key]
-                                    if isinstance(value, dict):
-                                        total_stats[key] += value.get('count', 0)
-                                    else:
-                                        total_stats[key] += value
-                            
-                            logger.info(f"インポート完了: {file_info['filename']}")
+            # 全ファイルを1トランザクションで取り込む（ファイルごとにSAVEPOINT）
+            # 1ファイルでも失敗したら全体を巻き戻すため、取り込み済み報告書の削除は不要
+            from importer_v2 import import_excel_files_v2
+            file_paths = [
+                Path(file_info['path']) for file_info in files
+                if Path(file_info['path']).exists()
+            ]
+            batch = import_excel_files_v2(file_paths, stop_on_error=True)
+
+            if not batch['success']:
+                logger.error(f"インポートエラー: {batch.get('error')}（全ファイルを巻き戻しました）")
+                return jsonify({
+                    'status': 'error',
+                    'message': f"インポート中にエラーが発生しました: {batch.get('error', '不明なエラー')}"
+                }), 500
+
+            imported_count = batch['imported_count']
+            for result in batch['results']:
+                # 統計情報を集計（Ver2のstats形式）
+                stats = result.get('stats', {})
+                for key in total_stats:
+                    if key in stats:
+                        # statsの値が直接整数の場合と辞書の場合の両方に対応
+                        value = stats[key]
+                        if isinstance(value, dict):
+                            total_stats[key] += value.get('count', 0)
                         else:
-                            # エラー発生時はロールバック
-                            error_msg = result.get('error', '不明なエラー')
-                            logger.error(f"インポートエラー ({file_info['filename']}): {error_msg}")
-                            
-                            # これまでインポートしたデータを削除
-                            if report_ids:
-                                from database_v2 import get_connection
-                                conn = get_connection()
-                                cursor = conn.cursor()
-                                for report_id in report_ids:
-                                    cursor.execute('DELETE FROM reports WHERE id = ?', (report_id,))
-                                conn.commit()
-                                conn.close()
-                                logger.info(f"ロールバック完了: {len(report_ids)}件削除")
-                            
-                            return jsonify({
-                                'status': 'error',
-                                'message': f'インポート中にエラーが発生しました: {error_msg}'
-                            }), 500
-
-            except Exception as e:
-                # 例外発生時もロールバック
-                logger.error(f"インポート中の例外: {e}")
-                if report_ids:
-                    from database_v2 import get_connection
-                    conn = get_connection()
-                    cursor = conn.cursor()
-                    for report_id in report_ids:
-                        cursor.execute('DELETE FROM reports WHERE id = ?', (report_id,))
-                    conn.commit()
-                    conn.close()
-                    logger.info(f"ロールバック完了: {len(report_ids)}件削除")
-                raise
+                            total_stats[key] += value
+                logger.info(f"インポート完了: {result['file_name']}")
+
+            invalidate_analytics_cache()
 
             return jsonify({
                 'status': 'success',
@@ -1193,6 +1263,93 @@ def create_app(config=None):
             logger.error(f"担当者一覧取得エラー: {e}")
             return jsonify({'status': 'error', 'message': str(e)}), 500
 
+    # ========== 分析API ==========
+
+    def _get_analytics_endpoints():
+        """公開する database_v2 の分析関数と受け付けるクエリパラメータ"""
+        import database_v2
+        return {
+            'school-metrics': (database_v2.get_school_metrics, {'target_fy': int}),
+            'rapid-growth': (database_v2.get_rapid_growth_schools, {
+                'target_fy': int,
+                'min_growth_rate': float,
+                'min_prev_sales': float
+            }),
+            'new-schools': (database_v2.get_new_schools, {'target_fy': int, 'target_month': int}),
+            'no-events': (database_v2.get_no_events_schools, {'target_fy': int}),
+            'declining': (database_v2.get_declining_schools, {
+                'target_fy': int,
+                'member_rate_threshold': float,
+                'sales_decline_threshold': float
+            }),
+            'events-by-date': (database_v2.get_events_for_date_filter, {'years_back': int}),
+            'schools': (database_v2.get_all_schools, {}),
+            'yearly-event-comparison': (database_v2.get_yearly_event_comparison, {
+                'school_id': int,
+                'year1': int,
+                'year2': int
+            }),
+            'improved-member-rate': (database_v2.get_improved_member_rate_schools, {'target_fy': int}),
+            'unit-price': (database_v2.get_sales_unit_price_analysis, {'target_fy': int}),
+            'studio-decline': (database_v2.get_studio_decline_analysis, {'target_fy': int}),
+        }
+
+    def invalidate_analytics_cache():
+        """取り込み完了時に分析キャッシュを破棄（関数側はDB更新世代でも無効化される）"""
+        from database_v2 import analytics_cache
+        analytics_cache.clear()
+
+    @app.route('/api/analytics', methods=['GET'])
+    def list_analytics():
+        """利用可能な分析API一覧"""
+        endpoints = _get_analytics_endpoints()
+        return jsonify({
+            'status': 'success',
+            'endpoints': [
+                {'name': name, 'params': list(params.keys())}
+                for name, (_, params) in endpoints.items()
+            ]
+        })
+
+    @app.route('/api/analytics/<name>', methods=['GET'])
+    def get_analytics(name):
+        """分析データ取得（パラメータ指定・サーバー側キャッシュ付き）"""
+        try:
+            endpoints = _get_analytics_endpoints()
+            if name not in endpoints:
+                return jsonify({'status': 'error', 'message': f'無効な分析名: {name}'}), 404
+
+            func, param_types = endpoints[name]
+            params = {}
+            for key, value_type in param_types.items():
+                raw = request.args.get(key)
+                if raw is None or raw == '':
+                    continue
+                try:
+                    params[key] = value_type(raw)
+                except ValueError:
+                    return jsonify({
+                        'status': 'error',
+                        'message': f'パラメータ {key} の値が不正です: {raw}'
+                    }), 400
+
+            # database_v2側でDB更新世代つきのメモ化が行われる
+            from database_v2 import get_db_generation
+            generation = get_db_generation()
+            data = func(**params)
+
+            return jsonify({
+                'status': 'success',
+                'name': name,
+                'params': params,
+                'generation': generation,
+                'data': data
+            })
+
+        except Exception as e:
+            logger.error(f"分析データ取得エラー ({name}): {e}")
+            return jsonify({'status': 'error', 'message': str(e)}), 500
+
     # ========== データ確認API ==========
 
     @app.route('/api/data/tables', methods=['GET'])
@@ -1208,83 +1365,203 @@ def create_app(config=None):
 
     @app.route('/api/data/filter-options', methods=['GET'])
     def get_filter_options():
-        """フィルター選択肢を取得"""
+        """フィルター選択肢を取得（DB更新世代つきでキャッシュ済みの値を返す）"""
         try:
-            from database import get_connection
-            conn = get_connection()
-            cursor = conn.cursor()
-
-            # 年度一覧
-            cursor.execute('SELECT DISTINCT fiscal_year FROM monthly_summary ORDER BY fiscal_year DESC')
-            fiscal_years = [row[0] for row in cursor.fetchall()]
-
-            # 事業所一覧
-            cursor.execute('SELECT DISTINCT region FROM schools WHERE region IS NOT NULL AND region != "" ORDER BY region')
-            regions = [row[0] for row in cursor.fetchall()]
-
-            # 担当者一覧
-            cursor.execute('SELECT DISTINCT manager FROM schools WHERE manager IS NOT NULL AND manager != "" ORDER BY manager')
-            managers = [row[0] for row in cursor.fetchall()]
-
-            # 学校一覧
-            cursor.execute('SELECT id, school_name FROM schools ORDER BY school_name')
-            schools = [{'id': row[0], 'name': row[1]} for row in cursor.fetchall()]
-
-            conn.close()
-
+            from database_v2 import get_viewer_filter_options
+            _ensure_viewer_indexes()
             return jsonify({
                 'status': 'success',
-                'filters': {
-                    'fiscal_years': fiscal_years,
-                    'months': list(range(1, 13)),
-                    'regions': regions,
-                    'managers': managers,
-                    'schools': schools
-                }
+                'filters': get_viewer_filter_options()
             })
 
         except Exception as e:
             logger.error(f"フィルター選択肢取得エラー: {e}")
             return jsonify({'status': 'error', 'message': str(e)}), 500
 
+    # 検索結果件数のキャッシュ: {(table, filters_json): (db_generation, total_count)}
+    # DB更新世代が変わるまで同じフィルター条件のCOUNTを再実行しない
+    data_count_cache = OrderedDict()
+    data_count_lock = threading.Lock()
+    DATA_COUNT_CACHE_SIZE = 256
+    DATA_SEARCH_MAX_LIMIT = 1000
+    EXPORT_BATCH_SIZE = 1000
+    viewer_indexes_ready = threading.Event()
+    viewer_state = {'school_name_fts': False}
+
+    def _ensure_viewer_indexes():
+        """既存DBにデータ確認画面用インデックス・学校名の全文検索インデックスを作成（プロセスごとに1回）"""
+        if viewer_indexes_ready.is_set():
+            return
+        from database_v2 import get_connection, create_viewer_indexes, create_school_name_fts
+        conn = get_connection()
+        try:
+            cursor = conn.cursor()
+            create_viewer_indexes(cursor)
+            viewer_state['school_name_fts'] = create_school_name_fts(cursor)
+            conn.commit()
+        finally:
+            conn.close()
+        viewer_indexes_ready.set()
+
+    def _cached_total_count(cursor, table, filters, spec):
+        from database_v2 import get_db_generation
+        key = (table, json.dumps(filters, sort_keys=True, ensure_ascii=False, default=str))
+        db_state = get_db_generation()
+        with data_count_lock:
+            cached = data_count_cache.get(key)
+            if cached and cached[0] == db_state:
+                data_count_cache.move_to_end(key)
+                return cached[1]
+
+        where = ' AND '.join(spec['where']) or '1=1'
+        cursor.execute(f"SELECT COUNT(*) FROM {spec['from']} WHERE {where}", spec['params'])
+        total_count = cursor.fetchone()[0]
+
+        with data_count_lock:
+            data_count_cache[key] = (db_state, total_count)
+            data_count_cache.move_to_end(key)
+            while len(data_count_cache) > DATA_COUNT_CACHE_SIZE:
+                data_count_cache.popitem(last=False)
+        return total_count
+
+    def _build_data_query(table, filters):
+        """テーブル名からクエリ定義を構築（無効なテーブル名はNone）"""
+        builders = {
+            'monthly_summary': _build_monthly_summary_query,
+            'school_sales': _build_school_sales_query,
+            'event_sales': _build_event_sales_query,
+            'member_rates': _build_member_rates_query,
+        }
+        builder = builders.get(table)
+        return builder(filters) if builder else None
+
+    def _keyset_condition(order, values):
+        """
+        ORDER BY列の値がカーソル位置より後ろの行に絞る条件を構築
+
+        (k0, k1, ...) の辞書順比較を OR 展開し、NULLはSQLiteの並び順
+        （ASCで先頭・DESCで末尾）に合わせて扱う。
+        """
+        clauses = []
+        params = []
+        for i, (expr, direction) in enumerate(order):
+            value = values[i]
+            parts = []
+            part_params = []
+            for prev_expr, _ in order[:i]:
+                parts.append(f'{prev_expr} IS ?')
+            part_params.extend(values[:i])
+
+            if direction == 'DESC':
+                if value is None:
+                    continue  # NULLは末尾のため、これより後ろの値は無い
+                parts.append(f'({expr} < ? OR {expr} IS NULL)')
+                part_params.append(value)
+            else:
+                if value is None:
+                    parts.append(f'{expr} IS NOT NULL')
+                else:
+                    parts.append(f'{expr} > ?')
+                    part_params.append(value)
+
+            clauses.append('(' + ' AND '.join(parts) + ')')
+            params.extend(part_params)
+
+        if not clauses:
+            return '0', []
+        return '(' + ' OR '.join(clauses) + ')', params
+
+    def _compose_data_query(spec, after=None, with_keys=False):
+        """
+        クエリ定義からSELECT文を組み立てる
+
+        Args:
+            spec: _build_*_query の戻り値
+            after: このカーソル値（ORDER BY列の値）より後ろの行のみ取得
+            with_keys: ORDER BY列を _k0, _k1, ... として追加で取得する
+        """
+        select = spec['select']
+        if with_keys:
+            select += ', ' + ', '.join(f'{expr} AS _k{i}' for i, (expr, _) in enumerate(spec['order']))
+        where = list(spec['where'])
+        params = list(spec['params'])
+        if after is not None:
+            condition, condition_params = _keyset_condition(spec['order'], after)
+            where.append(condition)
+            params.extend(condition_params)
+        order_by = ', '.join(f'{expr} {direction}' for expr, direction in spec['order'])
+        query = f"SELECT {select} FROM {spec['from']} WHERE {' AND '.join(where) or '1=1'} ORDER BY {order_by}"
+        return query, params
+
+    def _encode_cursor(values):
+        raw = json.dumps(values, ensure_ascii=False, default=str).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii')
+
+    def _decode_cursor(cursor_token, key_count):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor_token.encode('ascii')).decode('utf-8'))
+        except (ValueError, UnicodeError):
+            raise ValueError('無効なカーソルです')
+        if not isinstance(values, list) or len(values) != key_count:
+            raise ValueError('無効なカーソルです')
+        return values
+
     @app.route('/api/data/search', methods=['POST'])
     def search_data():
-        """データ検索"""
+        """
+        データ検索
+
+        ページングは2通り:
+        - cursor指定: 前ページの next_cursor から続きを取得（キーセット方式、深いページでも一定速度）
+        - offset指定: 任意ページへのジャンプ用（従来方式）
+        件数は同じフィルター条件ならDB更新までキャッシュする。
+        """
         try:
-            from database import get_connection
+            from database_v2 import get_connection
             data = request.get_json()
             table = data.get('table', 'monthly_summary')
             filters = data.get('filters', {})
-            limit = data.get('limit', 100)
-            offset = data.get('offset', 0)
-
-            conn = get_connection()
-            cursor = conn.cursor()
+            limit = max(1, min(int(data.get('limit', 100)), DATA_SEARCH_MAX_LIMIT))
+            offset = int(data.get('offset', 0) or 0)
+            cursor_token = data.get('cursor')
 
             # テーブルごとにクエリを構築
-            if table == 'monthly_summary':
-                query, params = _build_monthly_summary_query(filters)
-            elif table == 'school_sales':
-                query, params = _build_school_sales_query(filters)
-            elif table == 'event_sales':
-                query, params = _build_event_sales_query(filters)
-            elif table == 'member_rates':
-                query, params = _build_member_rates_query(filters)
-            else:
+            _ensure_viewer_indexes()
+            spec = _build_data_query(table, filters)
+            if spec is None:
                 return jsonify({'status': 'error', 'message': '無効なテーブル名'}), 400
 
-            # 件数取得
-            count_query = f"SELECT COUNT(*) FROM ({query})"
-            cursor.execute(count_query, params)
-            total_count = cursor.fetchone()[0]
-
-            # データ取得（ページング）
-            data_query = f"{query} LIMIT ? OFFSET ?"
-            cursor.execute(data_query, params + [limit, offset])
-            columns = [description[0] for description in cursor.description]
-            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            key_count = len(spec['order'])
+            after = None
+            if cursor_token:
+                try:
+                    after = _decode_cursor(cursor_token, key_count)
+                except ValueError as e:
+                    return jsonify({'status': 'error', 'message': str(e)}), 400
 
-            conn.close()
+            conn = get_connection()
+            try:
+                cursor = conn.cursor()
+
+                # 件数取得
+                total_count = _cached_total_count(cursor, table, filters, spec)
+
+                # データ取得（ページング）
+                query, params = _compose_data_query(spec, after=after, with_keys=True)
+                if after is not None:
+                    cursor.execute(f"{query} LIMIT ?", params + [limit])
+                else:
+                    cursor.execute(f"{query} LIMIT ? OFFSET ?", params + [limit, offset])
+                all_columns = [description[0] for description in cursor.description]
+                fetched = cursor.fetchall()
+            finally:
+                conn.close()
+
+            columns = all_columns[:-key_count]
+            rows = [dict(zip(columns, row[:-key_count])) for row in fetched]
+            next_cursor = None
+            if len(fetched) == limit:
+                next_cursor = _encode_cursor(list(fetched[-1][-key_count:]))
 
             return jsonify({
                 'status': 'success',
@@ -1292,7 +1569,8 @@ def create_app(config=None):
                 'columns': columns,
                 'total_count': total_count,
                 'limit': limit,
-                'offset': offset
+                'offset': offset,
+                'next_cursor': next_cursor
             })
 
         except Exception as e:
@@ -1301,203 +1579,224 @@ def create_app(config=None):
 
     @app.route('/api/data/export', methods=['POST'])
     def export_data():
-        """データCSVエクスポート"""
+        """データCSVエクスポート（一定件数ずつ読み出してストリーミング）"""
         try:
-            import csv
-            import io
-            from database import get_connection
+            from database_v2 import get_connection
 
             data = request.get_json()
             table = data.get('table', 'monthly_summary')
             filters = data.get('filters', {})
 
-            conn = get_connection()
-            cursor = conn.cursor()
-
             # テーブルごとにクエリを構築
-            if table == 'monthly_summary':
-                query, params = _build_monthly_summary_query(filters)
-            elif table == 'school_sales':
-                query, params = _build_school_sales_query(filters)
-            elif table == 'event_sales':
-                query, params = _build_event_sales_query(filters)
-            elif table == 'member_rates':
-                query, params = _build_member_rates_query(filters)
-            else:
+            _ensure_viewer_indexes()
+            spec = _build_data_query(table, filters)
+            if spec is None:
                 return jsonify({'status': 'error', 'message': '無効なテーブル名'}), 400
 
-            cursor.execute(query, params)
-            columns = [description[0] for description in cursor.description]
-            rows = cursor.fetchall()
-
-            conn.close()
-
-            # CSV生成
-            output = io.StringIO()
-            writer = csv.writer(output)
-            writer.writerow(columns)
-            writer.writerows(rows)
+            # SQLエラーはストリーム開始前にJSONで返せるよう、実行までここで行う
+            query, params = _compose_data_query(spec)
+            conn = get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute(query, params)
+                columns = [description[0] for description in cursor.description]
+            except Exception:
+                conn.close()
+                raise
 
-            csv_content = output.getvalue()
-            output.close()
+            def generate():
+                try:
+                    output = io.StringIO()
+                    writer = csv.writer(output)
+                    # BOMつきUTF-8（Excelで文字化けしないように）
+                    output.write('\ufeff')
+                    writer.writerow(columns)
+                    while True:
+                        batch = cursor.fetchmany(EXPORT_BATCH_SIZE)
+                        if batch:
+                            writer.writerows(batch)
+                        chunk = output.getvalue()
+                        if chunk:
+                            yield chunk
+                            output.seek(0)
+                            output.truncate(0)
+                        if not batch:
+                            break
+                finally:
+                    conn.close()
 
-            # BOMつきUTF-8でレスポンス
-            response = Response(
-                '\ufeff' + csv_content,
+            filename = f'export_{table}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+            return Response(
+                generate(),
                 mimetype='text/csv; charset=utf-8',
-                headers={
-                    'Content-Disposition': f'attachment; filename=export_{table}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-                }
+                headers={'Content-Disposition': f'attachment; filename={filename}'}
             )
 
-            return response
-
         except Exception as e:
             logger.error(f"CSVエクスポートエラー: {e}")
             return jsonify({'status': 'error', 'message': str(e)}), 500
 
+    # クエリ定義: select/from/where(条件のリスト)/params/order([(列式, 'ASC'|'DESC')])
+    # order の末尾は行を一意に決める列（キーセットページングのため）
+    # 売上系は取り込みごとに全期間を持つため、最新レポートの行のみを対象にする
+
+    LATEST_REPORT_SQL = '(SELECT MAX(id) FROM reports)'
+
+    def _add_school_filters(filters, where, params):
+        """学校マスタ側の絞り込み（事業所・担当者・学校名）"""
+        if filters.get('region'):
+            where.append('s.region = ?')
+            params.append(filters['region'])
+        if filters.get('manager'):
+            where.append('s.manager = ?')
+            params.append(filters['manager'])
+        if filters.get('school_name'):
+            # 3文字以上は学校名の全文検索インデックス（trigram）で部分一致
+            from database_v2 import school_name_filter_sql
+            condition, condition_params = school_name_filter_sql(
+                's', filters['school_name'], use_fts=viewer_state['school_name_fts']
+            )
+            where.append(condition)
+            params.extend(condition_params)
+
     def _build_monthly_summary_query(filters):
-        """月別サマリークエリ構築"""
-        query = '''
-            SELECT
-                ms.fiscal_year AS 年度,
-                ms.month AS 月,
-                ms.total_sales AS 総売上,
-                ms.direct_sales AS 直取引売上,
-                ms.studio_school_sales AS 写真館学校売上,
-                ms.school_count AS 学校数,
-                ms.budget AS 予算,
-                ms.budget_rate AS 予算比,
-                ms.yoy_rate AS 昨年比
-            FROM monthly_summary ms
-            WHERE 1=1
-        '''
+        """月別サマリークエリ構築（monthly_totals）"""
+        where = [f'mt.report_id = {LATEST_REPORT_SQL}']
         params = []
 
         if filters.get('fiscal_year'):
-            query += ' AND ms.fiscal_year = ?'
+            where.append('mt.fiscal_year = ?')
             params.append(filters['fiscal_year'])
         if filters.get('month'):
-            query += ' AND ms.month = ?'
+            where.append('mt.month = ?')
             params.append(filters['month'])
 
-        query += ' ORDER BY ms.fiscal_year DESC, ms.month DESC'
-        return query, params
+        return {
+            'select': '''
+                mt.fiscal_year AS 年度,
+                mt.month AS 月,
+                mt.total_sales AS 総売上,
+                mt.direct_sales AS 直取引売上,
+                mt.studio_sales AS 写真館学校売上,
+                mt.school_count AS 学校数,
+                mt.budget AS 予算,
+                CASE WHEN mt.budget > 0 THEN ROUND(mt.total_sales / mt.budget, 4) END AS 予算比,
+                CASE WHEN py.total_sales > 0 THEN ROUND(mt.total_sales / py.total_sales, 4) END AS 昨年比
+            ''',
+            'from': '''monthly_totals mt
+                LEFT JOIN monthly_totals py
+                    ON py.report_id = mt.report_id
+                    AND py.fiscal_year = mt.fiscal_year - 1
+                    AND py.month = mt.month''',
+            'where': where,
+            'params': params,
+            'order': [('mt.fiscal_year', 'DESC'), ('mt.month', 'DESC'), ('mt.id', 'DESC')]
+        }
 
     def _build_school_sales_query(filters):
-        """学校別売上クエリ構築"""
-        query = '''
-            SELECT
+        """学校別売上クエリ構築（school_monthly_sales）"""
+        where = [f'ss.report_id = {LATEST_REPORT_SQL}']
+        params = []
+
+        if filters.get('fiscal_year'):
+            where.append('ss.fiscal_year = ?')
+            params.append(filters['fiscal_year'])
+        if filters.get('month'):
+            where.append('ss.month = ?')
+            params.append(filters['month'])
+        _add_school_filters(filters, where, params)
+
+        return {
+            'select': '''
                 ss.fiscal_year AS 年度,
                 ss.month AS 月,
                 s.school_name AS 学校名,
                 s.attribute AS 属性,
                 s.region AS 事業所,
                 s.manager AS 担当者,
-                s.studio_name AS 写真館,
+                COALESCE(ss.studio, s.studio) AS 写真館,
                 ss.sales AS 売上
-            FROM school_sales ss
-            JOIN schools s ON ss.school_id = s.id
-            WHERE 1=1
-        '''
+            ''',
+            'from': 'school_monthly_sales ss JOIN schools_master s ON ss.school_id = s.school_id',
+            'where': where,
+            'params': params,
+            'order': [('ss.fiscal_year', 'DESC'), ('ss.month', 'DESC'), ('ss.sales', 'DESC'), ('ss.id', 'DESC')]
+        }
+
+    def _build_event_sales_query(filters):
+        """イベント別売上クエリ構築（event_sales）"""
+        where = [f'es.report_id = {LATEST_REPORT_SQL}']
         params = []
 
         if filters.get('fiscal_year'):
-            query += ' AND ss.fiscal_year = ?'
+            where.append('es.fiscal_year = ?')
             params.append(filters['fiscal_year'])
         if filters.get('month'):
-            query += ' AND ss.month = ?'
+            where.append('es.month = ?')
             params.append(filters['month'])
-        if filters.get('region'):
-            query += ' AND s.region = ?'
-            params.append(filters['region'])
-        if filters.get('manager'):
-            query += ' AND s.manager = ?'
-            params.append(filters['manager'])
-        if filters.get('school_name'):
-            query += ' AND s.school_name LIKE ?'
-            params.append(f'%{filters["school_name"]}%')
-
-        query += ' ORDER BY ss.fiscal_year DESC, ss.month DESC, ss.sales DESC'
-        return query, params
+        _add_school_filters(filters, where, params)
+        if filters.get('event_start_date'):
+            where.append('es.event_date = ?')
+            params.append(filters['event_start_date'])
 
-    def _build_event_sales_query(filters):
-        """イベント別売上クエリ構築"""
-        query = '''
-            SELECT
+        return {
+            'select': '''
                 es.fiscal_year AS 年度,
                 es.month AS 月,
                 s.school_name AS 学校名,
-                e.event_name AS イベント名,
-                e.start_date AS 開始日,
+                es.event_name AS イベント名,
+                es.event_date AS 開始日,
                 s.region AS 事業所,
                 s.manager AS 担当者,
                 es.sales AS 売上
-            FROM event_sales es
-            JOIN events e ON es.event_id = e.id
-            JOIN schools s ON e.school_id = s.id
-            WHERE 1=1
-        '''
+            ''',
+            'from': 'event_sales es JOIN schools_master s ON es.school_id = s.school_id',
+            'where': where,
+            'params': params,
+            'order': [('es.fiscal_year', 'DESC'), ('es.month', 'DESC'), ('es.sales', 'DESC'), ('es.id', 'DESC')]
+        }
+
+    def _build_member_rates_query(filters):
+        """
+        会員率クエリ構築（member_rates）
+
+        会員率はスナップショットの履歴を表示する。取り込み時に前レポートから
+        引き継いだ同一スナップショットは、最も新しいレポートの行だけを残す。
+        """
+        where = ['''mr.report_id = (
+            SELECT MAX(m2.report_id) FROM member_rates m2
+            WHERE m2.snapshot_date = mr.snapshot_date
+              AND m2.school_id = mr.school_id
+              AND m2.grade = mr.grade
+        )''']
         params = []
 
         if filters.get('fiscal_year'):
-            query += ' AND es.fiscal_year = ?'
-            params.append(filters['fiscal_year'])
-        if filters.get('month'):
-            query += ' AND es.month = ?'
-            params.append(filters['month'])
-        if filters.get('region'):
-            query += ' AND s.region = ?'
-            params.append(filters['region'])
-        if filters.get('manager'):
-            query += ' AND s.manager = ?'
-            params.append(filters['manager'])
-        if filters.get('school_name'):
-            query += ' AND s.school_name LIKE ?'
-            params.append(f'%{filters["school_name"]}%')
-        if filters.get('event_start_date'):
-            query += ' AND e.start_date = ?'
-            params.append(filters['event_start_date'])
-
-        query += ' ORDER BY es.fiscal_year DESC, es.month DESC, es.sales DESC'
-        return query, params
-
-    def _build_member_rates_query(filters):
-        """会員率クエリ構築"""
-        query = '''
-            SELECT
-                mr.fiscal_year AS 年度,
+            # 年度（4月始まり）はスナップショット日の範囲に変換してインデックスを使う
+            fiscal_year = int(filters['fiscal_year'])
+            where.append('mr.snapshot_date >= ? AND mr.snapshot_date < ?')
+            params.extend([f'{fiscal_year}-04-01', f'{fiscal_year + 1}-04-01'])
+        _add_school_filters(filters, where, params)
+
+        return {
+            'select': '''
+                CAST(strftime('%Y', mr.snapshot_date) AS INTEGER)
+                    - (CAST(strftime('%m', mr.snapshot_date) AS INTEGER) < 4) AS 年度,
                 mr.snapshot_date AS スナップショット日,
                 s.school_name AS 学校名,
                 s.attribute AS 属性,
                 s.region AS 事業所,
                 s.manager AS 担当者,
-                mr.grade_category AS 学年カテゴリ,
-                mr.grade_name AS 学年名,
-                mr.student_count AS 生徒数,
+                mr.grade AS 学年,
+                mr.total_students AS 生徒数,
                 mr.member_count AS 会員数,
                 mr.member_rate AS 会員率
-            FROM member_rates mr
-            JOIN schools s ON mr.school_id = s.id
-            WHERE 1=1
-        '''
-        params = []
-
-        if filters.get('fiscal_year'):
-            query += ' AND mr.fiscal_year = ?'
-            params.append(filters['fiscal_year'])
-        if filters.get('region'):
-            query += ' AND s.region = ?'
-            params.append(filters['region'])
-        if filters.get('manager'):
-            query += ' AND s.manager = ?'
-            params.append(filters['manager'])
-        if filters.get('school_name'):
-            query += ' AND s.school_name LIKE ?'
-            params.append(f'%{filters["school_name"]}%')
-
-        query += ' ORDER BY mr.fiscal_year DESC, mr.snapshot_date DESC, s.school_name'
-        return query, params
+            ''',
+            'from': 'member_rates mr JOIN schools_master s ON mr.school_id = s.school_id',
+            'where': where,
+            'params': params,
+            'order': [('mr.snapshot_date', 'DESC'), ('s.school_name', 'ASC'), ('mr.id', 'ASC')]
+        }
 
     # フロントエンド配信（ビルド済みの場合）
     @app.route('/')
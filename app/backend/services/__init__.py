@@ -4,5 +4,8 @@
 
 from .file_handler import FileHandler
 from .db_service import DatabaseService
+from .job_queue import JobManager, JobFailed
+from .session_store import SessionStore
+from .warmup import ModuleWarmup
 
-__all__ = ['FileHandler', 'DatabaseService']
+__all__ = ['FileHandler', 'DatabaseService', 'JobManager', 'JobFailed', 'SessionStore', 'ModuleWarmup']
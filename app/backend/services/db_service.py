@@ -61,6 +61,46 @@ class DatabaseService:
             logger.error(f"データベース保存エラー: {e}")
             return False
 
+    def save_aggregation_result(self, result, accounts_df, fiscal_year: int, month: int,
+                                source_name: Optional[str] = None) -> bool:
+        """
+        集計結果をExcelを経由せずにデータベースへ保存（Ver2版）
+
+        Args:
+            result: SalesAggregatorの集計結果
+            accounts_df: AccountsCalculatorの計算結果
+            fiscal_year: 対象年度
+            month: 対象月
+            source_name: 報告書名として記録するファイル名
+
+        Returns:
+            bool: 成功/失敗
+        """
+        try:
+            from importer_v2 import import_aggregation_v2
+
+            import_result = import_aggregation_v2(
+                result, accounts_df, fiscal_year, month,
+                source_name=source_name, db_path=str(self.db_path)
+            )
+
+            if import_result['success']:
+                logger.info(f"データベース直接保存完了: {fiscal_year}年度 {month}月")
+                logger.info(f"  Report ID: {import_result['report_id']}")
+                logger.info(f"  Stats: {import_result.get('stats', {})}")
+                return True
+            else:
+                error_msg = import_result.get('error', '不明なエラー')
+                logger.error(f"データベース直接保存失敗: {error_msg}")
+                return False
+
+        except ImportError as e:
+            logger.error(f"importer_v2.pyのインポートに失敗: {e}")
+            return False
+        except Exception as e:
+            logger.error(f"データベース直接保存エラー: {e}")
+            return False
+
     def generate_dashboard(self, output_path: Optional[Path] = None) -> Optional[Path]:
         """
         ダッシュボードHTMLを生成（Ver2版）
@@ -1,12 +1,16 @@
 """
 ファイル処理サービス
+
+pandas はAPIサーバーの起動を遅らせないよう、読み込み時に初めてインポートする。
 """
-import pandas as pd
 from pathlib import Path
-from typing import Tuple, Optional
+from typing import TYPE_CHECKING, Tuple, Optional
 import logging
 import shutil
 
+if TYPE_CHECKING:
+    import pandas as pd
+
 logger = logging.getLogger(__name__)
 
 
@@ -45,7 +49,7 @@ class FileHandler:
         logger.info(f"ファイル保存: {filepath}")
         return filepath
 
-    def read_sales_csv(self, filepath: Path) -> pd.DataFrame:
+    def read_sales_csv(self, filepath: Path) -> 'pd.DataFrame':
         """
         売上データCSVを読み込み
 
@@ -65,7 +69,7 @@ class FileHandler:
 
         return df
 
-    def read_accounts_csv(self, filepath: Path) -> pd.DataFrame:
+    def read_accounts_csv(self, filepath: Path) -> 'pd.DataFrame':
         """
         会員データCSVを読み込み
 
@@ -85,7 +89,7 @@ class FileHandler:
 
         return df
 
-    def read_master_excel(self, filepath: Path) -> pd.DataFrame:
+    def read_master_excel(self, filepath: Path) -> 'pd.DataFrame':
         """
         担当者マスタExcelを読み込み
 
@@ -95,6 +99,8 @@ class FileHandler:
         Returns:
             pd.DataFrame: マスタデータ
         """
+        import pandas as pd
+
         df = pd.read_excel(filepath, sheet_name=0)
         df = self._normalize_text_columns(df)
         logger.info(f"マスタデータ読み込み: {len(df)}件")
@@ -106,7 +112,7 @@ class FileHandler:
         return df
 
     def _validate_columns(
-        self, df: pd.DataFrame, required: list, name: str
+        self, df: 'pd.DataFrame', required: list, name: str
     ) -> None:
         """
         必須カラムの存在チェック
@@ -125,8 +131,10 @@ class FileHandler:
                 f"{name}に必須カラムがありません: {missing}"
             )
 
-    def _read_csv_with_fallback(self, filepath: Path) -> pd.DataFrame:
+    def _read_csv_with_fallback(self, filepath: Path) -> 'pd.DataFrame':
         """CSVをエンコーディングフォールバック付きで読み込み"""
+        import pandas as pd
+
         encodings = (self.CSV_ENCODING,) + self.CSV_ENCODING_FALLBACKS
         last_error = None
 
@@ -146,8 +154,10 @@ class FileHandler:
             f"CSVの文字コードを判別できませんでした: {filepath}"
         ) from last_error
 
-    def _normalize_text_columns(self, df: pd.DataFrame) -> pd.DataFrame:
+    def _normalize_text_columns(self, df: 'pd.DataFrame') -> 'pd.DataFrame':
         """全文字列カラムの前後空白を除去（中間空白は保持）"""
+        import pandas as pd
+
         normalized = df.copy()
 
         for col in normalized.columns:
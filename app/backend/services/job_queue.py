@@ -0,0 +1,210 @@
+"""
+バックグラウンドジョブ管理サービス
+
+重い集計処理をHTTPリクエストから切り離し、上限付きのワーカープールで実行する。
+進捗はジョブごとのイベント列として保持し、SSEエンドポイントから購読できる。
+"""
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# ジョブ状態
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_SUCCESS = 'success'
+JOB_ERROR = 'error'
+
+FINISHED_STATUSES = (JOB_SUCCESS, JOB_ERROR)
+
+
+class JobFailed(Exception):
+    """
+    ジョブ失敗（クライアントへ返すエラー内容を保持）
+
+    Args:
+        payload: レスポンスとして返すdict（status/message等）
+        http_status: 対応するHTTPステータスコード
+    """
+
+    def __init__(self, payload: Dict[str, Any], http_status: int = 500):
+        self.payload = payload
+        self.http_status = http_status
+        super().__init__(payload.get('message', ''))
+
+
+class Job:
+    """ジョブ1件分の状態と進捗イベント"""
+
+    def __init__(self, job_id: str, kind: str, session_id: Optional[str] = None):
+        self.id = job_id
+        self.kind = kind
+        self.session_id = session_id
+        self.status = JOB_QUEUED
+        self.created_at = datetime.now()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[Dict[str, Any]] = None
+        self.http_status = 200
+        self.events: List[Dict[str, Any]] = []
+        self.stages: List[Dict[str, Any]] = []
+        self._started_monotonic: Optional[float] = None
+        self._last_stage_monotonic: Optional[float] = None
+        self.condition = threading.Condition()
+
+    def _append_event(self, event: Dict[str, Any]):
+        with self.condition:
+            event['seq'] = len(self.events)
+            self.events.append(event)
+            self.condition.notify_all()
+
+    def report(self, message: str, percentage: int):
+        """進捗を記録（SalesAggregatorのprogress_callbackと同じシグネチャ）"""
+        now = time.monotonic()
+        if self._started_monotonic is None:
+            self._started_monotonic = now
+            self._last_stage_monotonic = now
+        stage = {
+            'message': message,
+            'percentage': percentage,
+            'stage_sec': round(now - self._last_stage_monotonic, 3),
+            'elapsed_sec': round(now - self._started_monotonic, 3)
+        }
+        self._last_stage_monotonic = now
+        self.stages.append(stage)
+        self._append_event({'status': JOB_RUNNING, **stage})
+
+    def to_dict(self, include_result: bool = True) -> Dict[str, Any]:
+        data = {
+            'job_id': self.id,
+            'kind': self.kind,
+            'session_id': self.session_id,
+            'job_status': self.status,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'percentage': self.stages[-1]['percentage'] if self.stages else 0,
+            'stages': list(self.stages)
+        }
+        if include_result:
+            data['result'] = self.result
+            data['error'] = self.error
+        return data
+
+
+class JobManager:
+    """
+    上限付きワーカープールでジョブを実行する
+
+    使用例:
+        manager = JobManager(max_workers=2)
+        job_id = manager.submit('aggregate', run_pipeline, session_id)
+        for event in manager.iter_events(job_id):
+            ...
+    """
+
+    def __init__(self, max_workers: int = 2, max_finished_jobs: int = 100):
+        """
+        Args:
+            max_workers: 同時実行するジョブ数の上限
+            max_finished_jobs: 保持する完了済みジョブ数（古いものから破棄）
+        """
+        self.max_finished_jobs = max_finished_jobs
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job-worker')
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, func: Callable[..., Dict[str, Any]], *args,
+               session_id: Optional[str] = None, **kwargs) -> str:
+        """
+        ジョブを登録して即座にジョブIDを返す
+
+        func は第1引数に進捗通知関数 (message, percentage) を受け取り、
+        成功時のレスポンスdictを返す。失敗時は JobFailed を送出する。
+        """
+        job = Job(uuid.uuid4().hex, kind, session_id)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune_finished()
+        job._append_event({'status': JOB_QUEUED, 'percentage': 0, 'message': '実行待ち'})
+        self._executor.submit(self._run, job, func, args, kwargs)
+        return job.id
+
+    def _run(self, job: Job, func, args, kwargs):
+        job.status = JOB_RUNNING
+        job.started_at = datetime.now()
+        try:
+            job.result = func(job.report, *args, **kwargs)
+            job.status = JOB_SUCCESS
+        except JobFailed as e:
+            job.error = e.payload
+            job.http_status = e.http_status
+            job.status = JOB_ERROR
+        except Exception as e:
+            logger.exception(f"ジョブ実行エラー ({job.kind} {job.id}): {e}")
+            job.error = {'status': 'error', 'message': str(e)}
+            job.http_status = 500
+            job.status = JOB_ERROR
+        finally:
+            job.finished_at = datetime.now()
+            elapsed = (job.finished_at - job.started_at).total_seconds()
+            job._append_event({
+                'status': job.status,
+                'percentage': 100,
+                'message': '完了' if job.status == JOB_SUCCESS else (job.error or {}).get('message', 'エラー'),
+                'elapsed_sec': round(elapsed, 3)
+            })
+            logger.info(f"ジョブ終了 ({job.kind} {job.id}): {job.status} {elapsed:.1f}秒")
+
+    def _prune_finished(self):
+        finished = [j for j in self._jobs.values() if j.status in FINISHED_STATUSES]
+        overflow = len(finished) - self.max_finished_jobs
+        if overflow > 0:
+            finished.sort(key=lambda j: j.finished_at or j.created_at)
+            for job in finished[:overflow]:
+                self._jobs.pop(job.id, None)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def find_by_session(self, session_id: str) -> Optional[Job]:
+        """セッションに紐づく最新のジョブを取得"""
+        with self._lock:
+            jobs = [j for j in self._jobs.values() if j.session_id == session_id]
+        return max(jobs, key=lambda j: j.created_at) if jobs else None
+
+    def iter_events(self, job_id: str, heartbeat_sec: float = 30.0) -> Iterator[Dict[str, Any]]:
+        """
+        ジョブの進捗イベントを順に返す（完了イベントで終了）
+
+        新しいイベントが heartbeat_sec 秒来ない場合は {'status': 'waiting'} を返す。
+        """
+        job = self.get(job_id)
+        if job is None:
+            yield {'status': 'not_found', 'percentage': 100, 'message': 'ジョブが見つかりません'}
+            return
+
+        position = 0
+        while True:
+            with job.condition:
+                if position >= len(job.events):
+                    job.condition.wait(timeout=heartbeat_sec)
+                pending = job.events[position:]
+            if not pending:
+                yield {'status': 'waiting'}
+                continue
+            position += len(pending)
+            for event in pending:
+                yield event
+                if event['status'] in FINISHED_STATUSES:
+                    return
+
+    def shutdown(self, wait: bool = False):
+        self._executor.shutdown(wait=wait)
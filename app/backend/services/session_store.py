@@ -0,0 +1,325 @@
+"""
+アップロードセッション管理サービス
+
+アップロード〜集計〜ダウンロードの間に保持するセッション情報を管理する。
+- セッションIDは衝突しない一意な値（タイムスタンプ + 乱数）
+- TTL（最終アクセスからの経過時間）と件数上限（LRU）で破棄
+- メモリ上限を超えた場合や大きな値（集計結果など）はディスクに退避し、参照時に読み戻す
+- 退避先はストアごとのディレクトリ（同じアップロードディレクトリを使う他のプロセスの退避ファイルは消さない）
+"""
+import gzip
+import logging
+import os
+import pickle
+import shutil
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# デフォルト設定
+DEFAULT_TTL_SEC = 6 * 60 * 60          # 最終アクセスから6時間
+DEFAULT_MAX_SESSIONS = 200
+DEFAULT_MEMORY_LIMIT_BYTES = 256 * 1024 * 1024
+DEFAULT_SPILL_THRESHOLD_BYTES = 1024 * 1024  # これより大きい値は常にディスクへ
+MIN_SPILL_BYTES = 4096  # メモリ上限超過時もこれより小さい値（ファイルパス等）は退避しない
+HEARTBEAT_INTERVAL_SEC = 60  # 使用中の退避ディレクトリの更新日時を更新する間隔
+
+
+def _estimate_size(value: Any) -> int:
+    """値のおおよそのメモリサイズ（バイト）"""
+    return _measure(value)[0]
+
+
+def _measure(value: Any) -> Tuple[int, Optional[bytes]]:
+    """
+    値のおおよそのメモリサイズ（バイト）と、見積もりのためにシリアライズした場合はその内容
+
+    シリアライズ結果は退避時にそのまま書き出し、同じ値を2回シリアライズしないようにする。
+    """
+    if value is None or isinstance(value, (bool, int, float)):
+        return sys.getsizeof(value), None
+    if isinstance(value, (str, bytes)):
+        return sys.getsizeof(value), None
+    if isinstance(value, (list, tuple, dict)) and len(value) < 64:
+        items = value.items() if isinstance(value, dict) else enumerate(value)
+        return sys.getsizeof(value) + sum(_estimate_size(k) + _estimate_size(v) for k, v in items), None
+    # 集計結果などの複合オブジェクトはシリアライズ後のサイズで見積もる
+    try:
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        return len(payload), payload
+    except Exception:
+        return sys.getsizeof(value), None
+
+
+class _SpilledValue:
+    """ディスクに退避した値の参照"""
+
+    __slots__ = ('path', 'size')
+
+    def __init__(self, path: Path, size: int):
+        self.path = path
+        self.size = size
+
+    def load(self) -> Any:
+        with gzip.open(self.path, 'rb') as f:
+            return pickle.load(f)
+
+
+class Session(dict):
+    """
+    セッション1件分のデータ
+
+    通常のdictとして読み書きでき、退避済みの値は参照時にディスクから読み戻す。
+    """
+
+    def __init__(self, store: 'SessionStore', session_id: str):
+        super().__init__()
+        self._store = store
+        self.session_id = session_id
+        self.sizes: Dict[str, int] = {}
+
+    def __setitem__(self, key, value):
+        self._store._on_set(self, key, value)
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        if isinstance(value, _SpilledValue):
+            return value.load()
+        return value
+
+    def get(self, key, default=None):
+        if key not in self:
+            return default
+        return self[key]
+
+    def raw_set(self, key, value):
+        dict.__setitem__(self, key, value)
+
+    def raw_get(self, key):
+        return dict.__getitem__(self, key)
+
+
+class SessionStore:
+    """
+    TTL・LRU・メモリ上限付きのセッションストア
+
+    既存コードの app.session_data と同じく dict 風に扱える
+    （`session_id in store`、`store[session_id]`、`store[session_id][key] = value`）。
+
+    使用例:
+        store = SessionStore(upload_dir / '.sessions')
+        session_id = store.create({'sales_file': path}, prefix='cum_')
+        store[session_id]['result'] = result  # 大きな値はディスクに退避される
+    """
+
+    def __init__(
+        self,
+        spill_dir: Path,
+        ttl_sec: float = DEFAULT_TTL_SEC,
+        max_sessions: int = DEFAULT_MAX_SESSIONS,
+        memory_limit_bytes: int = DEFAULT_MEMORY_LIMIT_BYTES,
+        spill_threshold_bytes: int = DEFAULT_SPILL_THRESHOLD_BYTES
+    ):
+        """
+        Args:
+            spill_dir: 退避ファイルの保存ディレクトリ（この下にストアごとのディレクトリを作成）
+            ttl_sec: 最終アクセスからの有効期間（秒）
+            max_sessions: 保持するセッション数の上限（超えたら最も古いものから破棄）
+            memory_limit_bytes: メモリ上に保持する値の合計サイズ上限
+            spill_threshold_bytes: これを超える値は常にディスクへ退避
+        """
+        self.ttl_sec = ttl_sec
+        self.max_sessions = max_sessions
+        self.memory_limit_bytes = memory_limit_bytes
+        self.spill_threshold_bytes = spill_threshold_bytes
+
+        self._sessions: 'OrderedDict[str, Session]' = OrderedDict()
+        self._last_access: Dict[str, float] = {}
+        self._memory_bytes = 0
+        self._lock = threading.RLock()
+        self._last_heartbeat = 0.0
+
+        # 同じディレクトリを複数のプロセス・アプリで共有しても互いの退避ファイルを消さないよう、
+        # ストアごとのディレクトリに退避する。更新が有効期間より古いものは終了済みとして削除
+        base_dir = Path(spill_dir)
+        base_dir.mkdir(parents=True, exist_ok=True)
+        self._remove_stale_dirs(base_dir)
+        self.spill_dir = base_dir / f"store_{os.getpid()}_{uuid.uuid4().hex[:8]}"
+        self.spill_dir.mkdir()
+
+    # ========== dict互換インターフェース ==========
+
+    def __contains__(self, session_id) -> bool:
+        with self._lock:
+            self._expire()
+            return session_id in self._sessions
+
+    def __getitem__(self, session_id) -> Session:
+        with self._lock:
+            self._expire()
+            session = self._sessions[session_id]
+            self._touch(session_id)
+            return session
+
+    def __setitem__(self, session_id, data: Dict[str, Any]):
+        with self._lock:
+            if session_id in self._sessions:
+                self._discard(session_id)
+            session = Session(self, session_id)
+            self._sessions[session_id] = session
+            self._touch(session_id)
+            for key, value in data.items():
+                session[key] = value
+            self._enforce_limits()
+
+    def __delitem__(self, session_id):
+        with self._lock:
+            self._discard(session_id)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+    def get(self, session_id, default=None):
+        try:
+            return self[session_id]
+        except KeyError:
+            return default
+
+    # ========== セッション操作 ==========
+
+    def new_id(self, prefix: str = '') -> str:
+        """一意なセッションIDを発行（同一秒の複数アップロードでも衝突しない）"""
+        return f"{prefix}{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:12]}"
+
+    def create(self, data: Dict[str, Any], prefix: str = '') -> str:
+        """セッションを作成してIDを返す"""
+        session_id = self.new_id(prefix)
+        self[session_id] = data
+        return session_id
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            spilled = sum(
+                1 for s in self._sessions.values()
+                for v in dict.values(s) if isinstance(v, _SpilledValue)
+            )
+            return {
+                'sessions': len(self._sessions),
+                'memory_bytes': self._memory_bytes,
+                'spilled_values': spilled
+            }
+
+    # ========== 内部処理 ==========
+
+    def _touch(self, session_id: str):
+        now = time.monotonic()
+        self._last_access[session_id] = now
+        self._sessions.move_to_end(session_id)
+        if now - self._last_heartbeat >= HEARTBEAT_INTERVAL_SEC:
+            # 使用中であることを他のストアに示す（_remove_stale_dirs の判定用）
+            self._last_heartbeat = now
+            try:
+                os.utime(self.spill_dir)
+            except OSError:
+                pass
+
+    def _remove_stale_dirs(self, base_dir: Path):
+        """有効期間を過ぎても更新されていない退避ディレクトリ（終了したストア・旧形式）を削除"""
+        deadline = time.time() - self.ttl_sec - HEARTBEAT_INTERVAL_SEC
+        for path in base_dir.iterdir():
+            try:
+                if path.stat().st_mtime >= deadline:
+                    continue
+            except OSError:
+                continue
+            if path.is_dir():
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                path.unlink(missing_ok=True)
+
+    def _on_set(self, session: Session, key, value):
+        with self._lock:
+            if self._sessions.get(session.session_id) is not session:
+                # 破棄済みセッションへの書き込み（実行中ジョブ等）は計上しない
+                session.raw_set(key, value)
+                return
+            self._release_value(session, key)
+            size, payload = _measure(value)
+            if size > self.spill_threshold_bytes:
+                session.raw_set(key, self._spill(session.session_id, key, value, size, payload))
+            else:
+                session.raw_set(key, value)
+                session.sizes[key] = size
+                self._memory_bytes += size
+            self._touch(session.session_id)
+            self._enforce_limits()
+
+    def _release_value(self, session: Session, key):
+        """上書き・破棄される値のメモリ計上と退避ファイルを解放"""
+        if key not in session:
+            return
+        old = session.raw_get(key)
+        if isinstance(old, _SpilledValue):
+            old.path.unlink(missing_ok=True)
+        else:
+            self._memory_bytes -= session.sizes.pop(key, 0)
+
+    def _spill(self, session_id: str, key, value, size: int,
+               payload: Optional[bytes] = None) -> _SpilledValue:
+        """値をディスクに退避（payload はサイズ見積もり時のシリアライズ結果）"""
+        session_dir = self.spill_dir / session_id
+        session_dir.mkdir(parents=True, exist_ok=True)
+        path = session_dir / f"{uuid.uuid4().hex}.pkl.gz"
+        if payload is None:
+            payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with gzip.open(path, 'wb', compresslevel=3) as f:
+            f.write(payload)
+        logger.info(f"セッション値をディスクに退避: {session_id}[{key}] ({size:,} bytes)")
+        return _SpilledValue(path, size)
+
+    def _discard(self, session_id: str):
+        session = self._sessions.pop(session_id, None)
+        self._last_access.pop(session_id, None)
+        if session is None:
+            return
+        self._memory_bytes -= sum(session.sizes.values())
+        session.sizes.clear()
+        shutil.rmtree(self.spill_dir / session_id, ignore_errors=True)
+
+    def _expire(self):
+        """TTL切れのセッションを破棄"""
+        deadline = time.monotonic() - self.ttl_sec
+        expired = [sid for sid, accessed in self._last_access.items() if accessed < deadline]
+        for session_id in expired:
+            logger.info(f"セッション期限切れ: {session_id}")
+            self._discard(session_id)
+
+    def _enforce_limits(self):
+        """件数上限（LRU破棄）とメモリ上限（古いセッションの値から退避）を適用"""
+        self._expire()
+
+        while len(self._sessions) > self.max_sessions:
+            oldest = next(iter(self._sessions))
+            logger.info(f"セッション上限超過のため破棄: {oldest}")
+            self._discard(oldest)
+
+        if self._memory_bytes <= self.memory_limit_bytes:
+            return
+        for session in list(self._sessions.values()):
+            for key, size in sorted(session.sizes.items(), key=lambda kv: -kv[1]):
+                if size < MIN_SPILL_BYTES:
+                    break
+                value = session.raw_get(key)
+                session.raw_set(key, self._spill(session.session_id, key, value, size))
+                del session.sizes[key]
+                self._memory_bytes -= size
+                if self._memory_bytes <= self.memory_limit_bytes:
+                    return
@@ -0,0 +1,98 @@
+"""
+モジュール事前読み込みサービス
+
+集計・取込・ダッシュボード生成のモジュールは pandas / openpyxl を読み込むため重い。
+APIサーバーはこれらを待たずに待ち受けを開始し、バックグラウンドスレッドで読み込んでおく。
+各エンドポイントは関数内でインポートするため、読み込み完了前のリクエストでもその場で読み込まれる。
+"""
+import importlib
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# 状態
+WARMUP_PENDING = 'pending'
+WARMUP_RUNNING = 'running'
+WARMUP_READY = 'ready'
+WARMUP_ERROR = 'error'
+WARMUP_DISABLED = 'disabled'
+
+
+class ModuleWarmup:
+    """
+    重いモジュールをバックグラウンドで読み込み、準備状態を保持する
+
+    使用例:
+        warmup = ModuleWarmup(['backend.aggregator', 'importer_v2'])
+        warmup.start()
+        if warmup.ready:
+            ...
+    """
+
+    def __init__(self, modules: Iterable[str]):
+        """
+        Args:
+            modules: 読み込むモジュール名（importlib.import_module に渡す形式）
+        """
+        self.modules = tuple(modules)
+        self.status = WARMUP_PENDING
+        self.loaded: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self._done = threading.Event()
+
+    def start(self) -> None:
+        """読み込みスレッドを開始（呼び出し元は待たない）"""
+        if self.status != WARMUP_PENDING:
+            return
+        self.status = WARMUP_RUNNING
+        self.started_at = datetime.now()
+        threading.Thread(target=self._run, name='module-warmup', daemon=True).start()
+
+    def disable(self) -> None:
+        """事前読み込みを行わない（各モジュールは初回利用時に読み込まれる）"""
+        self.status = WARMUP_DISABLED
+        self._done.set()
+
+    def _run(self) -> None:
+        begin = time.perf_counter()
+        try:
+            for name in self.modules:
+                start = time.perf_counter()
+                try:
+                    importlib.import_module(name)
+                    self.loaded[name] = round(time.perf_counter() - start, 3)
+                except Exception as e:
+                    logger.exception(f"モジュール読み込みエラー ({name}): {e}")
+                    self.errors[name] = str(e)
+        finally:
+            self.finished_at = datetime.now()
+            self.status = WARMUP_ERROR if self.errors else WARMUP_READY
+            self._done.set()
+            logger.info(f"モジュール事前読み込み完了: {self.status} {time.perf_counter() - begin:.2f}秒")
+
+    @property
+    def ready(self) -> bool:
+        """全モジュールの読み込みが完了した（または事前読み込みが無効）"""
+        return self.status in (WARMUP_READY, WARMUP_DISABLED)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """読み込み完了を待つ（完了したらTrue）"""
+        self._done.wait(timeout)
+        return self.ready
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'ready': self.ready,
+            'warmup_status': self.status,
+            'modules': list(self.modules),
+            'loaded': dict(self.loaded),
+            'errors': dict(self.errors),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
@@ -1,5 +1,11 @@
-from http.server import HTTPServer, SimpleHTTPRequestHandler
+from http.server import HTTPServer, ThreadingHTTPServer, SimpleHTTPRequestHandler
+from email.utils import formatdate
+import hashlib
+import json
 import os
+import re
+import threading
+import urllib.parse
 import argparse
 from datetime import datetime
 
@@ -7,7 +13,77 @@ from datetime import datetime
 WEB_DIR = 'public_dashboards'
 DEFAULT_PORT = 8000
 
+# バージョン管理付き公開（dashboard_publish.py と同じ配置）
+VERSIONS_DIRNAME = 'versions'
+MANIFEST_FILENAME = 'current.json'
+
+# 配信モード
+MODE_NO_CACHE = 'no-cache'
+MODE_PRECOMPRESSED = 'precompressed'
+
+# 事前圧縮ファイルの拡張子（優先順）
+PRECOMPRESSED_ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+# ファイル名にコンテンツハッシュを含む分割ファイル（例: data.3f2a9c1d.js）
+HASHED_FILE_PATTERN = re.compile(r'\.[0-9a-f]{8,}\.(js|css|json)$')
+
+# 分割ファイルは内容が変わればファイル名も変わるため長期キャッシュ可能
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# index.html 等は毎回ETagで再検証させる
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+
+# マニフェスト読み込み結果のキャッシュ: {root: (mtime_ns, version_dir)}
+_manifest_cache = {}
+_manifest_lock = threading.Lock()
+
+
+def resolve_current_version_dir(root):
+    """current.json が指す公開バージョンのディレクトリを返す（未設定ならNone）"""
+    manifest_path = os.path.join(root, MANIFEST_FILENAME)
+    try:
+        mtime_ns = os.stat(manifest_path).st_mtime_ns
+    except OSError:
+        return None
+
+    with _manifest_lock:
+        cached = _manifest_cache.get(root)
+        if cached and cached[0] == mtime_ns:
+            return cached[1]
+
+    version_dir = None
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            version = json.load(f).get('current')
+        if version:
+            candidate = os.path.join(root, VERSIONS_DIRNAME, os.path.basename(version))
+            if os.path.isdir(candidate):
+                version_dir = candidate
+    except (OSError, ValueError, AttributeError):
+        pass
+
+    with _manifest_lock:
+        _manifest_cache[root] = (mtime_ns, version_dir)
+    return version_dir
+
+
 class NoCacheRequestHandler(SimpleHTTPRequestHandler):
+    def translate_path(self, path):
+        # リクエストごとに現在の公開バージョンを解決し、存在するファイルはそちらを配信
+        translated = super().translate_path(path)
+        version_dir = resolve_current_version_dir(self.directory)
+        if version_dir is None:
+            return translated
+        relative = os.path.relpath(translated, self.directory)
+        if relative.startswith(os.pardir):
+            return translated
+        candidate = os.path.normpath(os.path.join(version_dir, relative))
+        if not os.path.exists(candidate):
+            return translated
+        if translated.endswith('/') and os.path.isdir(candidate):
+            candidate += '/'
+        return candidate
+
     def log_message(self, format, *args):
         # 要求ログは「時刻 + アクセス元IP」のみ出力
         timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -28,10 +104,141 @@ class NoCacheRequestHandler(SimpleHTTPRequestHandler):
         self.send_header('Expires', '0')
         super().end_headers()
 
+
+# ETag計算結果のキャッシュ: {path: (mtime_ns, size, etag)}
+_etag_cache = {}
+_etag_lock = threading.Lock()
+
+
+def compute_etag(path):
+    """ファイル内容のハッシュから強いETagを算出（mtime/サイズが変わるまで再計算しない）"""
+    stat = os.stat(path)
+    with _etag_lock:
+        cached = _etag_cache.get(path)
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return cached[2]
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    etag = f'"{digest.hexdigest()[:32]}"'
+
+    with _etag_lock:
+        _etag_cache[path] = (stat.st_mtime_ns, stat.st_size, etag)
+    return etag
+
+
+class PrecompressedRequestHandler(NoCacheRequestHandler):
+    """
+    事前圧縮ファイル・ETag対応ハンドラー
+
+    - 公開時に書き出された .br / .gz を Accept-Encoding に応じて配信
+    - コンテンツハッシュによる強いETagで If-None-Match → 304
+    - ハッシュ付き分割ファイルは長期キャッシュ、それ以外（index.html等）は毎回再検証
+    """
+
+    def end_headers(self):
+        # キャッシュ制御はsend_head側でファイルごとに設定する
+        SimpleHTTPRequestHandler.end_headers(self)
+
+    def _accepted_encodings(self):
+        header = self.headers.get('Accept-Encoding', '')
+        accepted = set()
+        for part in header.split(','):
+            token, _, params = part.partition(';')
+            token = token.strip().lower()
+            if not token:
+                continue
+            quality = 1.0
+            params = params.strip().replace(' ', '')
+            if params.startswith('q='):
+                try:
+                    quality = float(params[2:])
+                except ValueError:
+                    quality = 0.0
+            if quality > 0:
+                accepted.add(token)
+        return accepted
+
+    def _select_variant(self, path):
+        """配信するファイル（圧縮版 or 原本）とContent-Encodingを決定"""
+        accepted = self._accepted_encodings()
+        original_mtime = os.path.getmtime(path)
+        for encoding, suffix in PRECOMPRESSED_ENCODINGS:
+            if encoding not in accepted:
+                continue
+            candidate = path + suffix
+            # 原本より古い圧縮ファイルは内容が食い違うため使わない
+            if os.path.isfile(candidate) and os.path.getmtime(candidate) >= original_mtime:
+                return candidate, encoding
+        return path, None
+
+    def _cache_control(self, path):
+        if HASHED_FILE_PATTERN.search(os.path.basename(path)):
+            return IMMUTABLE_CACHE_CONTROL
+        return REVALIDATE_CACHE_CONTROL
+
+    def _resolve_file(self):
+        """リクエストパスを実ファイルに解決（ディレクトリはindex.html）。対象外ならNone"""
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            if not urllib.parse.urlsplit(self.path).path.endswith('/'):
+                return None
+            path = os.path.join(path, 'index.html')
+        if path.endswith('/') or not os.path.isfile(path):
+            return None
+        return path
+
+    def send_head(self):
+        path = self._resolve_file()
+        if path is None:
+            # リダイレクト・ディレクトリ一覧・404は標準処理に任せる
+            return super().send_head()
+
+        served_path, encoding = self._select_variant(path)
+        etag = compute_etag(served_path)
+        cache_control = self._cache_control(path)
+
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match:
+            candidates = [tag.strip() for tag in if_none_match.split(',')]
+            if '*' in candidates or etag in candidates:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Cache-Control', cache_control)
+                self.send_header('Vary', 'Accept-Encoding')
+                self.end_headers()
+                return None
+
+        try:
+            f = open(served_path, 'rb')
+        except OSError:
+            self.send_error(404, 'File not found')
+            return None
+
+        try:
+            fs = os.fstat(f.fileno())
+            self.send_response(200)
+            self.send_header('Content-Type', self.guess_type(path))
+            if encoding:
+                self.send_header('Content-Encoding', encoding)
+            self.send_header('Content-Length', str(fs.st_size))
+            self.send_header('Last-Modified', formatdate(fs.st_mtime, usegmt=True))
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', cache_control)
+            self.send_header('Vary', 'Accept-Encoding')
+            self.end_headers()
+            return f
+        except Exception:
+            f.close()
+            raise
+
+
 if __name__ == '__main__':
     # コマンドライン引数のパース
     parser = argparse.ArgumentParser(
-        description='ダッシュボード公開用HTTPサーバー（キャッシュ無効化）'
+        description='ダッシュボード公開用HTTPサーバー'
     )
     parser.add_argument(
         '--port', '-p',
@@ -45,16 +252,30 @@ if __name__ == '__main__':
         default=os.getenv('HOST', '0.0.0.0'),
         help='バインドホスト（デフォルト: 0.0.0.0）'
     )
+    parser.add_argument(
+        '--mode',
+        choices=[MODE_NO_CACHE, MODE_PRECOMPRESSED],
+        default=os.getenv('DASHBOARD_SERVER_MODE', MODE_NO_CACHE),
+        help=(
+            f'配信モード（{MODE_NO_CACHE}: 従来のキャッシュ無効化 / '
+            f'{MODE_PRECOMPRESSED}: 事前圧縮・ETag・マルチスレッド）'
+        )
+    )
     args = parser.parse_args()
-    
+
     # カレントディレクトリを移動（public_dashboardsの一つ上を想定）
     if os.path.exists(WEB_DIR):
         os.chdir(WEB_DIR)
-        
+
     server_address = (args.host, args.port)
-    httpd = HTTPServer(server_address, NoCacheRequestHandler)
+    if args.mode == MODE_PRECOMPRESSED:
+        httpd = ThreadingHTTPServer(server_address, PrecompressedRequestHandler)
+        mode_label = 'Precompressed/ETag Mode'
+    else:
+        httpd = HTTPServer(server_address, NoCacheRequestHandler)
+        mode_label = 'No-Cache Mode'
     print(f"========================================================", flush=True)
-    print(f"  Dashboard Server (No-Cache Mode) Started", flush=True)
+    print(f"  Dashboard Server ({mode_label}) Started", flush=True)
     print(f"  Host: {args.host}", flush=True)
     print(f"  Port: {args.port}", flush=True)
     print(f"========================================================", flush=True)
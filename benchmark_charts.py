@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+スクールフォト売上分析システム - グラフ埋め込みデータのベンチマーク
+
+会員率推移グラフページ（member_rate_page）とダッシュボード（dashboard_v2）に埋め込む
+グラフ用データについて、間引き・事前集計の前後で以下を比較する。
+
+- 埋め込みJSONのバイト数
+- Chart.js に渡す点数（描画時間はほぼ点数に比例するため、その目安）
+- データ作成時間
+
+使い方:
+    python benchmark_charts.py [--db <v1 DB>] [--db-v2 <v2 DB>] [--max-points 120]
+"""
+
+import argparse
+import copy
+import json
+import time
+
+from member_rate_chart import CHART_MAX_POINTS, get_filter_options
+
+
+def _json_bytes(value):
+    return len(json.dumps(value, ensure_ascii=False).encode('utf-8'))
+
+
+def _inline_expected(data, expected_series):
+    """間引き前（従来）の形式に戻す: 期待値を各データに埋め込み、間引き位置を除く"""
+    def strip(series):
+        if isinstance(series, dict):
+            return {k: strip(v) for k, v in series.items() if k != 'chart_idx'}
+        return series
+
+    restored = {}
+    for key, entry in data.items():
+        entry = strip(copy.deepcopy(entry))
+        expected_key = entry.pop('expected_key', None)
+        entry['expected'] = strip(copy.deepcopy(expected_series[expected_key])) if expected_key else None
+        restored[key] = entry
+    return restored
+
+
+def _series_points(series, downsampled):
+    if not series or not series.get('dates'):
+        return 0
+    if downsampled and 'chart_idx' in series:
+        return len(series['chart_idx'])
+    return len(series['dates'])
+
+
+def _entry_points(entry, expected, downsampled):
+    """初期表示（前年度・期待値を表示）で描画する点数"""
+    points = 0
+    for year_key in ('current_year', 'prev_year'):
+        data = entry.get(year_key) or {}
+        if entry.get('by_grade'):
+            points += sum(_series_points(s, downsampled) for s in data.values())
+        else:
+            points += _series_points(data, downsampled)
+    if expected and not entry.get('by_grade'):
+        points += _series_points(expected.get('current_year'), downsampled)
+    return points
+
+
+def benchmark_member_rate_page(db_path=None, max_points=CHART_MAX_POINTS):
+    """会員率推移グラフページの埋め込みデータを比較"""
+    from member_rate_page import build_chart_payload
+
+    options = get_filter_options(db_path)
+    start = time.perf_counter()
+    school_data, attribute_data, expected_series = build_chart_payload(db_path, options, max_points)
+    elapsed = time.perf_counter() - start
+
+    before_school = _inline_expected(school_data, expected_series)
+    before_attribute = _inline_expected(attribute_data, expected_series)
+
+    before_bytes = _json_bytes(before_school) + _json_bytes(before_attribute)
+    after_bytes = _json_bytes(school_data) + _json_bytes(attribute_data) + _json_bytes(expected_series)
+
+    before_points = []
+    after_points = []
+    for data in (school_data, attribute_data):
+        for entry in data.values():
+            expected = expected_series.get(entry.get('expected_key'))
+            before_points.append(_entry_points(entry, expected, downsampled=False))
+            after_points.append(_entry_points(entry, expected, downsampled=True))
+
+    return {
+        'name': '会員率推移グラフページ',
+        'before_bytes': before_bytes,
+        'after_bytes': after_bytes,
+        'points_label': '描画点数',
+        'before_points': before_points,
+        'after_points': after_points,
+        'build_sec': elapsed
+    }
+
+
+def benchmark_dashboard(db_path=None):
+    """ダッシュボードの学校別会員率推移（schoolDetails.member_rates）を比較"""
+    from dashboard_v2 import get_member_rates_by_school, get_schools_list, monthly_member_rate_snapshots
+
+    start = time.perf_counter()
+    raw = {}
+    monthly = {}
+    for school in get_schools_list(db_path):
+        rates = get_member_rates_by_school(db_path, school['id'])
+        raw[school['id']] = rates
+        monthly[school['id']] = monthly_member_rate_snapshots(rates)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'name': 'ダッシュボード（学校別会員率推移）',
+        'before_bytes': _json_bytes(raw),
+        'after_bytes': _json_bytes(monthly),
+        # グラフは月ごとに1点を描画するため描画点数は変わらない（埋め込むスナップショット数を表示）
+        'points_label': 'スナップショット数',
+        'before_points': [len(r) for r in raw.values()],
+        'after_points': [len(r) for r in monthly.values()],
+        'build_sec': elapsed
+    }
+
+
+def print_result(result):
+    def ratio(after, before):
+        return f'{after / before:.1%}' if before else '-'
+
+    before_total = sum(result['before_points'])
+    after_total = sum(result['after_points'])
+    print(f"\n[{result['name']}]")
+    print(f"  埋め込みJSON: {result['before_bytes']:,} → {result['after_bytes']:,} bytes"
+          f" ({ratio(result['after_bytes'], result['before_bytes'])})")
+    label = result['points_label']
+    print(f"  {label}（合計）: {before_total:,} → {after_total:,} ({ratio(after_total, before_total)})")
+    print(f"  {label}（1グラフ最大）: {max(result['before_points'], default=0):,}"
+          f" → {max(result['after_points'], default=0):,}")
+    print(f"  データ作成時間: {result['build_sec']:.2f}秒")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='グラフ埋め込みデータのベンチマーク')
+    parser.add_argument('--db', default=None, help='会員率推移グラフ用DB（省略時は既定のDB）')
+    parser.add_argument('--db-v2', default=None, help='ダッシュボード用V2 DB（省略時は既定のDB）')
+    parser.add_argument('--max-points', type=int, default=CHART_MAX_POINTS,
+                        help=f'1系列あたりの描画点数の上限（デフォルト: {CHART_MAX_POINTS}）')
+    parser.add_argument('--skip-dashboard', action='store_true', help='ダッシュボードの計測を省略')
+    args = parser.parse_args()
+
+    print_result(benchmark_member_rate_page(args.db, args.max_points))
+    if not args.skip_dashboard:
+        print_result(benchmark_dashboard(args.db_v2))
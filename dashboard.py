@@ -162,7 +162,7 @@ def generate_html_dashboard(db_path=None, output_path=None):
     prev_sales_data = [d['prev_sales'] for d in stats['monthly_data']]
 
     # 会員率推移グラフ用のデータを取得
-    from member_rate_chart import (get_filter_options, get_member_rate_trend_by_school,
+    from member_rate_chart import (get_filter_options, get_member_rate_trends_bulk,
                                    get_member_rate_trend_by_attribute, get_sales_filter_options,
                                    get_sales_trend_by_school, get_sales_trend_by_studio,
                                    get_event_sales_by_school, get_monthly_sales_by_branch,
@@ -180,14 +180,21 @@ def generate_html_dashboard(db_path=None, output_path=None):
     # 2024年度と2025年度のデータを取得（2023年度は会員率データ未収集のためスキップ）
     target_years_for_member = [y for y in available_years if y >= 2024]
 
+    school_trends_by_year = {
+        year: get_member_rate_trends_bulk(target_fy=year, db_path=db_path)
+        for year in target_years_for_member
+    }
     all_school_data = {}
     for school in filter_options['schools']:
         for year in target_years_for_member:
-            data_all = get_member_rate_trend_by_school(school['id'], by_grade=False, target_fy=year, db_path=db_path)
-            if data_all and data_all.get('current_year', {}).get('dates'):
+            trends = school_trends_by_year[year].get(school['id'])
+            if not trends:
+                continue
+            data_all = trends['all']
+            if data_all.get('current_year', {}).get('dates'):
                 all_school_data[f"school_{school['id']}_all_{year}"] = data_all
-            data_grade = get_member_rate_trend_by_school(school['id'], by_grade=True, target_fy=year, db_path=db_path)
-            if data_grade and data_grade.get('current_year'):
+            data_grade = trends['grade']
+            if data_grade.get('current_year'):
                 all_school_data[f"school_{school['id']}_grade_{year}"] = data_grade
 
     all_attribute_data = {}
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+スクールフォト売上分析システム - ダッシュボード公開処理
+
+公開ディレクトリ（app/public_dashboards）へのバージョン付き配置と、
+配信サーバー（app/simple_server.py）がそのまま返せる事前圧縮ファイルの作成を行う。
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+# 事前圧縮の対象拡張子
+COMPRESSIBLE_SUFFIXES = {'.html', '.js', '.css', '.json', '.svg', '.txt'}
+
+
+def _write_atomic(path, data):
+    """一時ファイルに書き込んでから置き換える（配信中の読み込みで途中状態を見せない）"""
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def write_precompressed(file_path):
+    """
+    公開ファイルの .gz / .br 版を同じディレクトリに書き出す
+
+    brotliパッケージが無い環境では .gz のみ作成する。
+
+    Args:
+        file_path: 公開済みファイルのパス
+
+    Returns:
+        list: 作成した圧縮ファイルのパス
+    """
+    file_path = Path(file_path)
+    if file_path.suffix.lower() not in COMPRESSIBLE_SUFFIXES:
+        return []
+
+    data = file_path.read_bytes()
+    written = []
+
+    # mtime=0 にして同じ内容なら同じバイト列（＝同じETag）になるようにする
+    gz_path = file_path.with_name(file_path.name + '.gz')
+    _write_atomic(gz_path, gzip.compress(data, compresslevel=9, mtime=0))
+    written.append(gz_path)
+
+    br_path = file_path.with_name(file_path.name + '.br')
+    if BROTLI_AVAILABLE:
+        _write_atomic(br_path, brotli.compress(data, quality=11))
+        written.append(br_path)
+    elif br_path.exists():
+        # 古い .br が残っていると内容の異なるファイルが配信されるため削除
+        br_path.unlink()
+
+    return written
+
+
+
+# ============================================
+# バージョン管理付き公開
+# ============================================
+
+# public_dashboards/versions/<コンテンツハッシュ>/index.html に各ビルドを配置し、
+# public_dashboards/current.json（マニフェスト）で現在のバージョンを指す。
+VERSIONS_DIRNAME = 'versions'
+MANIFEST_FILENAME = 'current.json'
+PUBLISH_FILENAME = 'index.html'
+DEFAULT_KEEP_VERSIONS = 5
+
+
+def _content_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+def load_manifest(publish_dir):
+    """マニフェストを読み込む（存在しない場合は空のマニフェスト）"""
+    manifest_path = Path(publish_dir) / MANIFEST_FILENAME
+    if manifest_path.exists():
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if isinstance(manifest, dict):
+                manifest.setdefault('current', None)
+                manifest.setdefault('versions', [])
+                return manifest
+        except (OSError, ValueError):
+            pass
+    return {'current': None, 'versions': []}
+
+
+def _save_manifest(publish_dir, manifest):
+    data = json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8')
+    _write_atomic(Path(publish_dir) / MANIFEST_FILENAME, data)
+
+
+def _replace_entrypoint(publish_dir, version_dir):
+    """直下のindex.html（ファイル直接参照用）もアトミックに差し替える"""
+    source = version_dir / PUBLISH_FILENAME
+    dest = Path(publish_dir) / PUBLISH_FILENAME
+    tmp_path = dest.with_name(dest.name + '.tmp')
+    shutil.copy2(source, tmp_path)
+    os.replace(tmp_path, dest)
+    write_precompressed(dest)
+
+
+def _prune_versions(publish_dir, manifest, keep):
+    """保持数を超えた古いバージョンを削除"""
+    versions_root = Path(publish_dir) / VERSIONS_DIRNAME
+    kept = manifest['versions'][:keep]
+    # 現在のバージョンはロールバック後でも必ず残す
+    if manifest['current'] and manifest['current'] not in [v['version'] for v in kept]:
+        kept += [v for v in manifest['versions'] if v['version'] == manifest['current']]
+    manifest['versions'] = kept
+
+    kept_names = {v['version'] for v in kept}
+    if versions_root.exists():
+        for path in versions_root.iterdir():
+            if path.is_dir() and path.name not in kept_names:
+                shutil.rmtree(path, ignore_errors=True)
+
+
+def publish_version(source_path, publish_dir, keep=DEFAULT_KEEP_VERSIONS):
+    """
+    生成済みダッシュボードをバージョンディレクトリに配置し、マニフェストを切り替える
+
+    同じ内容のビルドは同じバージョン名になるため、再公開しても重複しない。
+
+    Args:
+        source_path: 生成されたダッシュボードHTML
+        publish_dir: 公開ディレクトリ（app/public_dashboards）
+        keep: 保持するバージョン数
+
+    Returns:
+        dict: {'version': str, 'path': Path}
+    """
+    source_path = Path(source_path)
+    publish_dir = Path(publish_dir)
+    versions_root = publish_dir / VERSIONS_DIRNAME
+    versions_root.mkdir(parents=True, exist_ok=True)
+
+    version = _content_hash(source_path)
+    version_dir = versions_root / version
+
+    if not version_dir.exists():
+        # 一時ディレクトリに書き出してからリネーム（書きかけのバージョンを見せない）
+        staging_dir = versions_root / f'.{version}.tmp-{os.getpid()}'
+        if staging_dir.exists():
+            shutil.rmtree(staging_dir)
+        staging_dir.mkdir()
+        shutil.copy2(source_path, staging_dir / PUBLISH_FILENAME)
+        write_precompressed(staging_dir / PUBLISH_FILENAME)
+        os.replace(staging_dir, version_dir)
+
+    manifest = load_manifest(publish_dir)
+    manifest['versions'] = [v for v in manifest['versions'] if v['version'] != version]
+    manifest['versions'].insert(0, {
+        'version': version,
+        'published_at': datetime.now().isoformat(timespec='seconds'),
+        'source': source_path.name
+    })
+    manifest['current'] = version
+    _prune_versions(publish_dir, manifest, keep)
+    _save_manifest(publish_dir, manifest)
+
+    _replace_entrypoint(publish_dir, version_dir)
+
+    return {'version': version, 'path': version_dir / PUBLISH_FILENAME}
+
+
+def rollback_version(publish_dir, version=None):
+    """
+    公開バージョンを切り替える（ロールバック）
+
+    Args:
+        publish_dir: 公開ディレクトリ
+        version: 切り替え先バージョン（Noneの場合は現在の1つ前）
+
+    Returns:
+        str: 切り替え後のバージョン
+
+    Raises:
+        ValueError: 切り替え先のバージョンが存在しない場合
+    """
+    publish_dir = Path(publish_dir)
+    manifest = load_manifest(publish_dir)
+    names = [v['version'] for v in manifest['versions']]
+
+    if version is None:
+        if manifest['current'] not in names or names.index(manifest['current']) + 1 >= len(names):
+            raise ValueError('ロールバック可能な過去バージョンがありません')
+        version = names[names.index(manifest['current']) + 1]
+
+    version_dir = publish_dir / VERSIONS_DIRNAME / version
+    if version not in names or not (version_dir / PUBLISH_FILENAME).exists():
+        raise ValueError(f'バージョンが見つかりません: {version}')
+
+    manifest['current'] = version
+    _save_manifest(publish_dir, manifest)
+    _replace_entrypoint(publish_dir, version_dir)
+    return version
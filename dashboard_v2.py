@@ -10,7 +10,7 @@ import json
 from datetime import datetime
 from pathlib import Path
 from database_v2 import (
-    get_connection, get_rapid_growth_schools, get_new_schools, get_no_events_schools, get_declining_schools,
+    get_connection, get_school_metrics, filter_school_metrics, get_new_schools, get_no_events_schools,
     get_events_for_date_filter, get_all_schools, get_improved_member_rate_schools, get_yearly_event_comparison,
     get_sales_unit_price_analysis, get_studio_decline_analysis
 )
@@ -353,13 +353,7 @@ def get_member_rates_by_school(db_path=None, school_id=None, fiscal_year=None):
     # 年度未指定の場合は最新年度を取得
     if fiscal_year is None:
         cursor.execute('''
-            SELECT MAX(
-                CASE 
-                    WHEN CAST(strftime('%m', snapshot_date) AS INTEGER) >= 4 
-                    THEN CAST(strftime('%Y', snapshot_date) AS INTEGER)
-                    ELSE CAST(strftime('%Y', snapshot_date) AS INTEGER) - 1
-                END
-            ) as max_fy
+            SELECT MAX(fiscal_year) as max_fy
             FROM member_rates
             WHERE school_id = ?
         ''', (school_id,))
@@ -372,13 +366,7 @@ def get_member_rates_by_school(db_path=None, school_id=None, fiscal_year=None):
             SELECT snapshot_date, MAX(report_id) as max_report_id
             FROM member_rates
             WHERE school_id = ?
-              AND (
-                CASE 
-                    WHEN CAST(strftime('%m', snapshot_date) AS INTEGER) >= 4 
-                    THEN CAST(strftime('%Y', snapshot_date) AS INTEGER)
-                    ELSE CAST(strftime('%Y', snapshot_date) AS INTEGER) - 1
-                END
-              ) = ?
+              AND fiscal_year = ?
             GROUP BY snapshot_date
         )
         SELECT m.snapshot_date, m.grade, m.member_rate, m.total_students, m.member_count
@@ -396,13 +384,7 @@ def get_member_rates_by_school(db_path=None, school_id=None, fiscal_year=None):
             SELECT snapshot_date, MAX(report_id) as max_report_id
             FROM member_rates
             WHERE school_id = ?
-              AND (
-                CASE 
-                    WHEN CAST(strftime('%m', snapshot_date) AS INTEGER) >= 4 
-                    THEN CAST(strftime('%Y', snapshot_date) AS INTEGER)
-                    ELSE CAST(strftime('%Y', snapshot_date) AS INTEGER) - 1
-                END
-              ) = ?
+              AND fiscal_year = ?
             GROUP BY snapshot_date
         )
         SELECT 
@@ -452,6 +434,24 @@ def get_member_rates_by_school(db_path=None, school_id=None, fiscal_year=None):
     return data
 
 
+def monthly_member_rate_snapshots(member_rates):
+    """
+    get_member_rates_by_school の結果を月ごとの最新スナップショットに絞る（ダッシュボード埋め込み用）
+
+    会員率推移グラフは月ごとに最新スナップショットの学年別会員率のみを描画するため、
+    同じ月の古いスナップショットと生徒数・会員数は埋め込まない。
+    """
+    latest = {}
+    for snapshot_date in member_rates:
+        month = snapshot_date[:7]
+        if month not in latest or snapshot_date > latest[month]:
+            latest[month] = snapshot_date
+    return {
+        snapshot_date: [{'grade': g['grade'], 'rate': g['rate']} for g in member_rates[snapshot_date]]
+        for snapshot_date in sorted(latest.values())
+    }
+
+
 
 
 
@@ -553,6 +553,34 @@ def get_member_rate_distribution(db_path=None, fiscal_year=None):
     } for row in results]
 
 
+def build_event_sales_index(events):
+    """
+    イベント開始日別データの検索用インデックスを作成
+
+    events はイベント日付の昇順に並べ替える（同日内の順序は維持）。
+    ブラウザ側では日付を二分探索して該当範囲を切り出し、学校別の抽出は行番号から引く。
+
+    Args:
+        events: get_events_for_date_filter の各行（event_date, school_name を含むdict）
+
+    Returns:
+        tuple: (日付順のevents, {'dates': [日付], 'offsets': [各日付の先頭行, ..., 件数],
+                'schools': {学校名: [行番号]}})
+    """
+    events = sorted(events, key=lambda e: e['event_date'] or '')
+    dates = []
+    offsets = []
+    schools = {}
+    for i, event in enumerate(events):
+        event_date = event['event_date'] or ''
+        if not dates or dates[-1] != event_date:
+            dates.append(event_date)
+            offsets.append(i)
+        schools.setdefault(event['school_name'], []).append(i)
+    offsets.append(len(events))
+    return events, {'dates': dates, 'offsets': offsets, 'schools': schools}
+
+
 def generate_dashboard(db_path=None, output_dir=None):
     """ダッシュボードHTMLを生成"""
     
@@ -588,33 +616,31 @@ def generate_dashboard(db_path=None, output_dir=None):
         school_details[school_id] = {
             'name': school['name'],
             'monthly_sales': get_school_monthly_sales(db_path, school_id),
-            'member_rates': get_member_rates_by_school(db_path, school_id)
+            'member_rates': monthly_member_rate_snapshots(get_member_rates_by_school(db_path, school_id))
         }
     
-    # 条件別集計データを取得
-    rapid_growth_data = get_rapid_growth_schools(db_path)
-    
     # デフォルトは最新年度
     default_year =available_years[0] if available_years else datetime.now().year
     stats = all_years_data[default_year]['stats']
     
-    # 売上好調校データの取得（今年度のみ）
-    print("   売上好調校データを取得中...")
-    rapid_growth_schools = get_rapid_growth_schools(db_path, target_fy=default_year)
-    rapid_growth_data = [
+    # 売上好調校・会員率・売上低下校の共通指標（今年度のみ）
+    # 閾値による絞り込みはブラウザ側（filterSchoolMetrics）で行う
+    print("   学校別の前年比指標を取得中...")
+    school_metrics_data = [
         {
             'school_name': r['school_name'],
             'attribute': r['attribute'],
-            'region': r['region'],
             'studio': r['studio'],
             'manager': r['manager'],
             'region': r['region'],
             'current_sales': r['current_sales'],
             'prev_sales': r['prev_sales'],
-            'growth_rate': r['growth_rate']
+            'growth_rate': r['growth_rate'],
+            'member_rate': r['member_rate']
         }
-        for r in rapid_growth_schools
+        for r in filter_school_metrics(get_school_metrics(db_path, target_fy=default_year))
     ]
+    print(f"   -> 取得件数: {len(school_metrics_data)}件")
     
     # 新規開始校データの取得（全年度）
     print("   新規開始校データを取得中...")
@@ -658,25 +684,6 @@ def generate_dashboard(db_path=None, output_dir=None):
             for r in schools
         ]
     
-    # 会員率・売上低下校データの取得（今年度のみ・ベース条件での取得）
-    print("   会員率・売上低下校データを取得中...")
-    decline_data_raw = get_declining_schools(db_path, target_fy=default_year, member_rate_threshold=1.1, sales_decline_threshold=0.0)
-    print(f"   -> 取得件数: {len(decline_data_raw)}件")
-    decline_data = [
-        {
-            'school_name': r['school_name'],
-            'attribute': r['attribute'],
-            'studio': r['studio'],
-            'manager': r['manager'],
-            'region': r['region'],
-            'current_sales': r['current_sales'],
-            'prev_sales': r['prev_sales'],
-            'growth_rate': r['growth_rate'],
-            'member_rate': r['member_rate']
-        }
-        for r in decline_data_raw
-    ]
-
     # 会員率改善校データの取得（全年度）
     print("   会員率改善校データを取得中...")
     improved_all = {}
@@ -711,6 +718,7 @@ def generate_dashboard(db_path=None, output_dir=None):
         }
         for r in event_sales_by_date_raw
     ]
+    event_sales_by_date_data, event_sales_index = build_event_sales_index(event_sales_by_date_data)
     
     # 年度別イベント比較用の学校一覧を取得
     print("   学校一覧データを取得中...")
@@ -718,7 +726,6 @@ def generate_dashboard(db_path=None, output_dir=None):
     
     # JS用にJSON変換
     import json
-    event_sales_by_date_json = json.dumps(event_sales_by_date_data, ensure_ascii=False)
     all_schools_json = json.dumps(all_schools_data, ensure_ascii=False)
     improved_all_json = json.dumps(improved_all, ensure_ascii=False)
     unit_price_all_json = json.dumps(unit_price_all, ensure_ascii=False)
@@ -2355,6 +2362,27 @@ def generate_dashboard(db_path=None, output_dir=None):
         
         <!-- 売上好調校タブコンテンツ -->
         <div id="alert-rapid_growth" class="alert-content active" style="display: block;">
+            <div class="alert-filters" style="display: flex; gap: 15px; margin-bottom: 20px; align-items: center; background: #f9fafb; padding: 15px; border-radius: 8px; border: 1px solid #e5e7eb; flex-wrap: wrap; font-size: 12px;">
+                <div style="display: flex; align-items: center; gap: 5px;">
+                    <label style="font-weight: bold; color: #374151;">売上成長率:</label>
+                    <select id="rapidGrowthRateFilter" onchange="renderAlertTable('rapid_growth', 1)" style="padding: 6px; border: 1px solid #d1d5db; border-radius: 4px; font-size: 12px;">
+                        <option value="10">10%以上</option>
+                        <option value="20">20%以上</option>
+                        <option value="30" selected>30%以上</option>
+                        <option value="50">50%以上</option>
+                        <option value="100">100%以上</option>
+                    </select>
+                </div>
+                <div style="display: flex; align-items: center; gap: 5px;">
+                    <label style="font-weight: bold; color: #374151;">前年度売上:</label>
+                    <select id="rapidGrowthPrevSalesFilter" onchange="renderAlertTable('rapid_growth', 1)" style="padding: 6px; border: 1px solid #d1d5db; border-radius: 4px; font-size: 12px;">
+                        <option value="0">指定なし</option>
+                        <option value="10000" selected>1万円超</option>
+                        <option value="100000">10万円超</option>
+                        <option value="1000000">100万円超</option>
+                    </select>
+                </div>
+            </div>
             <div class="alert-header" style="display: flex; justify-content: flex-end; margin-bottom: 15px;">
                 <button class="csv-download-btn" onclick="downloadAlertCSV('rapid_growth')" style="padding: 6px 14px; background: #3b82f6; color: white; border: none; border-radius: 6px; cursor: pointer; font-size: 12px;">📥 CSV出力</button>
             </div>
@@ -2628,20 +2656,44 @@ def generate_dashboard(db_path=None, output_dir=None):
     
     <script>
         // 条件別集計データ
-        const rapidGrowthData = {json.dumps(rapid_growth_data, ensure_ascii=False)};
+        // 学校別の前年比指標（成長率の昇順）。売上好調校・会員率・売上低下校はここから絞り込む
+        const schoolMetricsData = {json.dumps(school_metrics_data, ensure_ascii=False)};
         const newSchoolsAllData = {json.dumps(new_schools_all, ensure_ascii=False)};
         const noEventsAllData = {json.dumps(no_events_all, ensure_ascii=False)};
-        const declineBaseData = {json.dumps(decline_data, ensure_ascii=False)};
         const eventSalesDataFull = {json.dumps(event_sales_by_date_data, ensure_ascii=False)};
+        // eventSalesDataFullの索引（日付ごとの先頭行・学校別の行番号）
+        const eventSalesIndex = {json.dumps(event_sales_index, ensure_ascii=False)};
+        
+        // 日付が prefix（YYYY / YYYY-MM / YYYY-MM-DD）で始まるイベントを二分探索で切り出す（日付昇順）
+        function eventSalesByDatePrefix(prefix) {{
+            const dates = eventSalesIndex.dates;
+            const lowerBound = (key) => {{
+                let lo = 0, hi = dates.length;
+                while (lo < hi) {{
+                    const mid = (lo + hi) >> 1;
+                    if (dates[mid] < key) lo = mid + 1; else hi = mid;
+                }}
+                return lo;
+            }};
+            const start = eventSalesIndex.offsets[lowerBound(prefix)];
+            const end = eventSalesIndex.offsets[lowerBound(prefix + '\\uffff')];
+            return eventSalesDataFull.slice(start, end);
+        }}
+        
+        // 指定学校・年度のイベントを取得（日付昇順）
+        function eventSalesBySchool(schoolName, fiscalYear) {{
+            const rows = eventSalesIndex.schools[schoolName] || [];
+            return rows.map(i => eventSalesDataFull[i]).filter(e => e.fiscal_year === fiscalYear);
+        }}
         const allSchoolsData = {all_schools_json};
         const availableYears = {json.dumps(available_years, ensure_ascii=False)};
 
 
         const alertsData = {{
-            'rapid_growth': rapidGrowthData,
+            'rapid_growth': [],
             'new_schools': [], // 初期値は空、ロード時に設定
             'no_events': [],
-            'decline': declineBaseData,
+            'decline': [],
             'improved': [],
             'unit_price': [],
             'event_sales_by_date': [],
@@ -2649,6 +2701,18 @@ def generate_dashboard(db_path=None, output_dir=None):
         }};
         
         
+        // 学校別指標を閾値で絞り込む（database_v2.filter_school_metrics と同じ条件）
+        function filterSchoolMetrics(conditions) {{
+            const {{ minPrevSales, minGrowthRate, maxGrowthRate, maxMemberRate }} = conditions;
+            return schoolMetricsData.filter(row => {{
+                if (minPrevSales !== undefined && !(row.prev_sales > minPrevSales)) return false;
+                if (minGrowthRate !== undefined && row.growth_rate < minGrowthRate) return false;
+                if (maxGrowthRate !== undefined && row.growth_rate > maxGrowthRate) return false;
+                if (maxMemberRate !== undefined && !(row.member_rate < maxMemberRate)) return false;
+                return true;
+            }});
+        }}
+        
         let currentAlertPage = 1;
         const alertPageSize = 30;
         
@@ -2756,7 +2820,13 @@ def generate_dashboard(db_path=None, output_dir=None):
             
             // データ取得ロジック分岐
             let data = [];
-            if (alertType === 'new_schools') {{
+            if (alertType === 'rapid_growth') {{
+                const minGrowthRate = parseFloat(document.getElementById('rapidGrowthRateFilter').value) / 100;
+                const minPrevSales = parseFloat(document.getElementById('rapidGrowthPrevSalesFilter').value);
+                // 成長率の降順で表示
+                data = filterSchoolMetrics({{ minPrevSales, minGrowthRate }}).reverse();
+                alertsData['rapid_growth'] = data;
+            }} else if (alertType === 'new_schools') {{
                 const year = document.getElementById('newSchoolsYearFilter').value;
                 const month = document.getElementById('newSchoolsMonthFilter').value;
                 if (year && newSchoolsAllData[year]) {{
@@ -2787,12 +2857,12 @@ def generate_dashboard(db_path=None, output_dir=None):
                 const salesMin = parseFloat(document.getElementById('declineSalesMin').value) / 100;
                 const salesMax = parseFloat(document.getElementById('declineSalesMax').value) / 100;
                 
-                if (declineBaseData) {{
-                    data = declineBaseData.filter(row => {{
-                        const declineRate = -row.growth_rate;
-                        return row.member_rate < memberRateThreshold && declineRate >= salesMin && declineRate <= salesMax;
-                    }});
-                }}
+                // 減少率 salesMin～salesMax ＝ 成長率 -salesMax～-salesMin
+                data = filterSchoolMetrics({{
+                    maxMemberRate: memberRateThreshold,
+                    minGrowthRate: -salesMax,
+                    maxGrowthRate: -salesMin
+                }});
                 alertsData['decline'] = data;
             }} else if (alertType === 'improved') {{
                 const year = document.getElementById('improvedYearFilter').value;
@@ -3303,7 +3373,7 @@ def generate_dashboard(db_path=None, output_dir=None):
             if (!yearSelect) return;
             
             // データからユニークな年を取得
-            const years = [...new Set(eventSalesDataFull.map(d => d.year))].sort().reverse();
+            const years = [...new Set(eventSalesIndex.dates.filter(d => d).map(d => d.substring(0, 4)))].sort().reverse();
             years.forEach(year => {{
                 const option = document.createElement('option');
                 option.value = year;
@@ -3332,12 +3402,14 @@ def generate_dashboard(db_path=None, output_dir=None):
                 return;
             }}
             
-            // フィルタリング
-            let filtered = eventSalesDataFull.filter(d => d.year === year);
+            // フィルタリング（索引の二分探索で該当日付の範囲を切り出す）
+            let prefix = year;
             if (month) {{
-                filtered = filtered.filter(d => d.month === month);
+                prefix += '-' + month;
+                if (day) prefix += '-' + day;
             }}
-            if (day) {{
+            let filtered = eventSalesByDatePrefix(prefix);
+            if (day && !month) {{
                 filtered = filtered.filter(d => d.day === day);
             }}
             
@@ -3476,12 +3548,8 @@ def generate_dashboard(db_path=None, output_dir=None):
             console.log('比較年度:', year1, 'vs', year2);
             
             // eventSalesDataFullから該当学校のデータを抽出
-            let year1Events = eventSalesDataFull.filter(e => 
-                e.school_name === school.school_name && e.fiscal_year === year1
-            );
-            let year2Events = eventSalesDataFull.filter(e => 
-                e.school_name === school.school_name && e.fiscal_year === year2
-            );
+            let year1Events = eventSalesBySchool(school.school_name, year1);
+            let year2Events = eventSalesBySchool(school.school_name, year2);
             
             console.log(`${{year1}}年度イベント:`, year1Events.length, '件');
             console.log(`${{year2}}年度イベント:`, year2Events.length, '件');
@@ -3604,12 +3672,8 @@ def generate_dashboard(db_path=None, output_dir=None):
             }}
             
             // データ抽出
-            let year1Events = eventSalesDataFull.filter(e => 
-                e.school_name === school.school_name && e.fiscal_year === year1
-            );
-            let year2Events = eventSalesDataFull.filter(e => 
-                e.school_name === school.school_name && e.fiscal_year === year2
-            );
+            let year1Events = eventSalesBySchool(school.school_name, year1);
+            let year2Events = eventSalesBySchool(school.school_name, year2);
             
             if (selectedMonth) {{
                 year1Events = year1Events.filter(e => e.month === selectedMonth);
@@ -6,6 +6,14 @@
 """
 
 import sqlite3
+import functools
+import hashlib
+import inspect
+import json
+import os
+import secrets
+import threading
+from collections import OrderedDict
 from pathlib import Path
 from datetime import datetime
 
@@ -29,9 +37,86 @@ def get_connection(db_path=None):
     conn.execute('PRAGMA synchronous=NORMAL')
     conn.execute('PRAGMA foreign_keys = ON')  # 外部キー制約有効化
     
+    # 旧DBは読み出し前に移行（取り込みを経ていないDBでも新しい列・テーブルを参照できるように）
+    ensure_schema_upgrades(conn, db_path)
+    
     return conn
 
 
+# スキーマ移行を確認済みのDB（(パス, inode)。プロセス内で1回だけ確認する）
+_schema_checked = set()
+_schema_lock = threading.Lock()
+
+
+def _schema_upgrades_needed(cursor):
+    """
+    旧DBに必要な移行関数の一覧（読み取りだけで判定する）
+
+    Returns:
+        list: 移行関数（cursorを受け取る）。未初期化のDBの場合はNone
+    """
+    cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'index')")
+    names = {row[0] for row in cursor.fetchall()}
+    if 'member_rates' not in names:
+        # 未初期化（init_database で作成される）
+        return None
+
+    upgrades = []
+    cursor.execute('PRAGMA table_info(member_rates)')
+    if 'fiscal_year' not in [row[1] for row in cursor.fetchall()] or 'idx_member_rates_school_fy' not in names:
+        upgrades.append(migrate_member_rates_fiscal_year)
+    else:
+        cursor.execute('SELECT 1 FROM member_rates WHERE fiscal_year IS NULL LIMIT 1')
+        if cursor.fetchone():
+            upgrades.append(migrate_member_rates_fiscal_year)
+    # 学校ごとの最新会員率（年度列を使って構築するため年度の移行の後）
+    if 'member_rates_latest' not in names:
+        upgrades.append(create_member_rates_latest_table)
+    # DB更新世代（未記録の旧DB同士が世代0を共有し、分析キャッシュが誤ってヒットしないよう乱数で記録）
+    generation_recorded = False
+    if 'db_meta' in names:
+        cursor.execute("SELECT 1 FROM db_meta WHERE key = 'generation'")
+        generation_recorded = cursor.fetchone() is not None
+    if not generation_recorded:
+        upgrades.append(_create_db_meta_table)
+    return upgrades
+
+
+def ensure_schema_upgrades(conn, db_path=None):
+    """
+    init_database・prepare_import を経ていない旧DBを、読み出し側が前提とするスキーマに移行
+
+    get_connection から呼ばれ、DBごとにプロセス内で1回だけ確認する。
+    移行が不要な場合は書き込みを行わない（取り込み中の他の接続をロック待ちさせない）。
+    """
+    path = Path(db_path or DEFAULT_DB_PATH)
+    try:
+        key = (str(path.resolve()), path.stat().st_ino)
+    except OSError:
+        return
+    if key in _schema_checked:
+        return
+
+    with _schema_lock:
+        if key in _schema_checked:
+            return
+        cursor = conn.cursor()
+        upgrades = _schema_upgrades_needed(cursor)
+        if upgrades is None:
+            return
+        if upgrades:
+            try:
+                for upgrade in upgrades:
+                    upgrade(cursor)
+                conn.commit()
+            except sqlite3.Error as e:
+                conn.rollback()
+                print(f"スキーマ移行に失敗しました: {e}")
+                return
+            print(f"旧DBのスキーマを移行しました: {path}")
+        _schema_checked.add(key)
+
+
 def init_database(db_path=None):
     """データベースを初期化（全テーブル作成）"""
     conn = get_connection(db_path)
@@ -153,6 +238,7 @@ def init_database(db_path=None):
     ''')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_event_sales_fy ON event_sales(fiscal_year, month)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_event_sales_school ON event_sales(school_id)')
+    migrate_event_sales_unique_key(cursor)
     
     # 8. member_rates (会員率スナップショット)
     cursor.execute('''
@@ -165,6 +251,7 @@ def init_database(db_path=None):
             member_rate REAL,
             total_students INTEGER,
             member_count INTEGER,
+            fiscal_year INTEGER,
             FOREIGN KEY (report_id) REFERENCES reports(id) ON DELETE CASCADE,
             FOREIGN KEY (school_id) REFERENCES schools_master(school_id),
             UNIQUE(report_id, school_id, grade)
@@ -172,6 +259,8 @@ def init_database(db_path=None):
     ''')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_member_rates_school ON member_rates(school_id)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_member_rates_date ON member_rates(snapshot_date)')
+    migrate_member_rates_fiscal_year(cursor)
+    create_member_rates_latest_table(cursor)
     
     # 9. manager_aliases (担当者名マッピング)
     cursor.execute('''
@@ -180,6 +269,21 @@ def init_database(db_path=None):
             canonical_name TEXT NOT NULL
         )
     ''')
+
+    # 10. db_meta (DB更新世代など)
+    _create_db_meta_table(cursor)
+
+    # 報告書削除（CASCADE）用インデックス
+    ensure_report_indexes(cursor)
+
+    # データ確認画面の絞り込み用インデックス
+    create_viewer_indexes(cursor)
+
+    # 11. schools_name_fts (学校名の部分一致検索用 全文検索インデックス)
+    create_school_name_fts(cursor)
+
+    # 12. school_name_aliases (学校名の表記 → school_id の解決済みマッピング)
+    create_school_name_aliases_table(cursor)
     
     conn.commit()
     conn.close()
@@ -187,6 +291,472 @@ def init_database(db_path=None):
     print(f"データベースを初期化しました: {db_path or DEFAULT_DB_PATH}")
 
 
+# event_sales の自然キー（同一イベント・同一売上月は1行。event_date が無いイベントも1行にまとめる）
+EVENT_SALES_KEY_SQL = "report_id, fiscal_year, month, school_id, event_name, COALESCE(event_date, '')"
+
+# event_sales への登録（同じキーの行があれば売上を加算する: 分割入金など）
+EVENT_SALES_UPSERT_SQL = f'''
+    INSERT INTO event_sales
+    (report_id, fiscal_year, month, branch, school_id, event_name, event_date, sales)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT({EVENT_SALES_KEY_SQL}) DO UPDATE SET
+        sales = sales + excluded.sales,
+        branch = COALESCE(branch, excluded.branch)
+'''
+
+
+def migrate_event_sales_unique_key(cursor):
+    """
+    event_sales に自然キーの一意インデックスを作成（既存の重複行は売上を合算して1行に圧縮）
+
+    一意インデックス作成済みの場合は何もしない。コミットは呼び出し側で行う。
+
+    Returns:
+        int: 圧縮で削除した行数
+    """
+    cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_event_sales_natural_key'"
+    )
+    if cursor.fetchone():
+        return 0
+
+    # 重複キーごとに最小IDの行へ売上を集約し、残りを削除
+    cursor.execute(f'''
+        CREATE TEMP TABLE event_sales_compact AS
+        SELECT MIN(id) AS keep_id, SUM(sales) AS total_sales
+        FROM event_sales
+        GROUP BY {EVENT_SALES_KEY_SQL}
+        HAVING COUNT(*) > 1
+    ''')
+    cursor.execute('''
+        UPDATE event_sales
+        SET sales = (SELECT c.total_sales FROM event_sales_compact c WHERE c.keep_id = event_sales.id)
+        WHERE id IN (SELECT keep_id FROM event_sales_compact)
+    ''')
+    cursor.execute(f'''
+        DELETE FROM event_sales
+        WHERE id NOT IN (SELECT MIN(id) FROM event_sales GROUP BY {EVENT_SALES_KEY_SQL})
+    ''')
+    removed = cursor.rowcount
+    cursor.execute('DROP TABLE temp.event_sales_compact')
+
+    cursor.execute(
+        f'CREATE UNIQUE INDEX idx_event_sales_natural_key ON event_sales({EVENT_SALES_KEY_SQL})'
+    )
+    if removed:
+        print(f"event_salesの重複行を{removed}件圧縮しました")
+        bump_db_generation(cursor)
+    return removed
+
+
+# snapshot_date から年度（4月始まり）を算出するSQL式（fiscal_year列の補完用）
+MEMBER_RATES_FISCAL_YEAR_SQL = """
+    CASE
+        WHEN CAST(strftime('%m', snapshot_date) AS INTEGER) >= 4
+        THEN CAST(strftime('%Y', snapshot_date) AS INTEGER)
+        ELSE CAST(strftime('%Y', snapshot_date) AS INTEGER) - 1
+    END
+"""
+
+
+def migrate_member_rates_fiscal_year(cursor):
+    """
+    member_rates に年度列（fiscal_year）と学校・年度単位のインデックスを用意
+
+    旧DBには列を追加し、未設定の行を snapshot_date から補完する。
+    学校別の会員率推移を式ではなくインデックスの範囲検索で引けるようにする。
+    コミットは呼び出し側で行う。
+
+    Returns:
+        int: 補完した行数
+    """
+    cursor.execute('PRAGMA table_info(member_rates)')
+    if 'fiscal_year' not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute('ALTER TABLE member_rates ADD COLUMN fiscal_year INTEGER')
+
+    cursor.execute(f'''
+        UPDATE member_rates
+        SET fiscal_year = {MEMBER_RATES_FISCAL_YEAR_SQL}
+        WHERE fiscal_year IS NULL
+    ''')
+    filled = cursor.rowcount
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_member_rates_school_fy
+        ON member_rates(school_id, fiscal_year, snapshot_date, report_id)
+    ''')
+    if filled > 0:
+        print(f"member_ratesの年度を{filled}件補完しました")
+        bump_db_generation(cursor)
+    return filled
+
+
+# member_rates_latest で全学年合計を表す学年
+MEMBER_RATES_TOTAL_GRADE = '全学年'
+
+
+def create_member_rates_latest_table(cursor):
+    """
+    学校ごとの最新会員率テーブル（member_rates_latest）を作成
+
+    各学校の最新スナップショット日・その日付の最新報告書の学年別会員率と、
+    学年別を合算した全学年合計（grade = '全学年'）を保持する。
+    旧DBで未作成の場合は member_rates から全件構築する。コミットは呼び出し側で行う。
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS member_rates_latest (
+            school_id INTEGER NOT NULL,
+            grade TEXT NOT NULL,
+            snapshot_date DATE NOT NULL,
+            fiscal_year INTEGER,
+            report_id INTEGER NOT NULL,
+            total_students INTEGER,
+            member_count INTEGER,
+            member_rate REAL,
+            PRIMARY KEY (school_id, grade)
+        )
+    ''')
+    cursor.execute('SELECT 1 FROM member_rates_latest LIMIT 1')
+    if cursor.fetchone():
+        return
+    cursor.execute('SELECT 1 FROM member_rates LIMIT 1')
+    if cursor.fetchone():
+        refresh_member_rates_latest(cursor)
+        print("member_rates_latestを構築しました")
+
+
+def refresh_member_rates_latest(cursor, school_ids=None):
+    """
+    member_rates_latest を指定学校分だけ作り直す
+
+    会員率の取り込み・報告書の削除後に、影響した学校IDを渡して呼ぶ。
+    学年別は元データの学年（'全学年'行を除く）、全学年合計は生徒数のある学年の合算。
+    コミットは呼び出し側で行う。
+
+    Args:
+        cursor: DBカーソル
+        school_ids: 対象学校IDのリスト（Noneの場合は全学校）
+
+    Returns:
+        int: 対象学校数（全学校の場合は作成後の学校数）
+    """
+    if school_ids is None:
+        cursor.execute('DELETE FROM member_rates_latest')
+        chunks = [None]
+    else:
+        school_ids = sorted({int(school_id) for school_id in school_ids})
+        if not school_ids:
+            return 0
+        chunks = [school_ids[i:i + 500] for i in range(0, len(school_ids), 500)]
+
+    for chunk in chunks:
+        if chunk is None:
+            scope_sql, params = '', []
+        else:
+            scope_sql = f"WHERE school_id IN ({', '.join('?' * len(chunk))})"
+            params = list(chunk)
+            cursor.execute(f'DELETE FROM member_rates_latest {scope_sql}', params)
+
+        # 学校ごとの最新スナップショット日 → その日付の最新報告書
+        cursor.execute(f'''
+            WITH latest_snapshot AS (
+                SELECT school_id, MAX(snapshot_date) AS snapshot_date
+                FROM member_rates
+                {scope_sql}
+                GROUP BY school_id
+            ),
+            latest_report AS (
+                SELECT m.school_id, m.snapshot_date, MAX(m.report_id) AS report_id
+                FROM member_rates m
+                JOIN latest_snapshot ls
+                    ON m.school_id = ls.school_id AND m.snapshot_date = ls.snapshot_date
+                GROUP BY m.school_id, m.snapshot_date
+            )
+            INSERT INTO member_rates_latest
+                (school_id, grade, snapshot_date, fiscal_year, report_id,
+                 total_students, member_count, member_rate)
+            SELECT m.school_id, m.grade, m.snapshot_date, m.fiscal_year, m.report_id,
+                   m.total_students, m.member_count, m.member_rate
+            FROM member_rates m
+            JOIN latest_report lr
+                ON m.school_id = lr.school_id
+                AND m.snapshot_date = lr.snapshot_date
+                AND m.report_id = lr.report_id
+            WHERE m.grade != ?
+        ''', params + [MEMBER_RATES_TOTAL_GRADE])
+
+        # 全学年合計
+        total_scope_sql = f"AND {scope_sql[len('WHERE '):]}" if scope_sql else ''
+        cursor.execute(f'''
+            INSERT INTO member_rates_latest
+                (school_id, grade, snapshot_date, fiscal_year, report_id,
+                 total_students, member_count, member_rate)
+            SELECT
+                school_id, ?, snapshot_date, fiscal_year, report_id,
+                SUM(total_students),
+                COALESCE(SUM(member_count), 0),
+                CAST(COALESCE(SUM(member_count), 0) AS REAL) / SUM(total_students)
+            FROM member_rates_latest
+            WHERE grade != ? AND total_students > 0 {total_scope_sql}
+            GROUP BY school_id
+        ''', [MEMBER_RATES_TOTAL_GRADE, MEMBER_RATES_TOTAL_GRADE] + params)
+
+    if school_ids is None:
+        cursor.execute('SELECT COUNT(DISTINCT school_id) FROM member_rates_latest')
+        return cursor.fetchone()[0]
+    return len(school_ids)
+
+
+# reports を参照する（ON DELETE CASCADE）テーブル
+REPORT_CHILD_TABLES = [
+    'monthly_totals',
+    'manager_monthly_sales',
+    'branch_monthly_sales',
+    'school_monthly_sales',
+    'event_sales',
+    'member_rates',
+]
+
+
+def ensure_report_indexes(cursor):
+    """
+    reports の子テーブルに report_id 先頭のインデックスを用意
+
+    報告書の削除（再取り込み・ロールバック）時のCASCADEが子テーブルを全件走査しないようにする。
+    UNIQUE制約などで既に report_id 先頭のインデックスがあるテーブルには作成しない。
+
+    Returns:
+        list: 作成したインデックス名
+    """
+    created = []
+    for table in REPORT_CHILD_TABLES:
+        cursor.execute(f'PRAGMA index_list({table})')
+        index_names = [row[1] for row in cursor.fetchall()]
+        has_leading = False
+        for index_name in index_names:
+            cursor.execute(f'PRAGMA index_info("{index_name}")')
+            columns = sorted(cursor.fetchall())
+            if columns and columns[0][2] == 'report_id':
+                has_leading = True
+                break
+        if not has_leading:
+            name = f'idx_{table}_report'
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table}(report_id)')
+            created.append(name)
+    return created
+
+
+# データ確認画面（/api/data/*）の絞り込み・並び順に対応する複合インデックス
+# 売上系は最新レポートのみを対象とするため report_id を先頭にする
+VIEWER_INDEXES = [
+    ('idx_school_sales_viewer', 'school_monthly_sales(report_id, fiscal_year, month, sales)'),
+    ('idx_school_sales_report_school', 'school_monthly_sales(report_id, school_id, fiscal_year, month)'),
+    ('idx_event_sales_viewer', 'event_sales(report_id, fiscal_year, month, sales)'),
+    ('idx_event_sales_report_school', 'event_sales(report_id, school_id, fiscal_year, month)'),
+    ('idx_event_sales_report_date', 'event_sales(report_id, event_date)'),
+    ('idx_schools_region_manager', 'schools_master(region, manager)'),
+    ('idx_schools_manager', 'schools_master(manager)'),
+    ('idx_member_rates_snapshot', 'member_rates(snapshot_date, school_id, grade, report_id)'),
+]
+
+
+def create_viewer_indexes(cursor):
+    """データ確認画面用のインデックスを作成（既存DBにも後から適用できる）"""
+    for name, target in VIEWER_INDEXES:
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {target}')
+
+
+# 学校名の部分一致検索用 FTS5 テーブル（trigramトークナイザー、rowid = school_id）
+# schools_master は INSERT OR REPLACE で更新されることがあり、その場合は削除トリガーが
+# 発火しないため、外部コンテンツ方式ではなく値を保持する通常のFTS5テーブルにしている
+SCHOOL_NAME_FTS_TABLE = 'schools_name_fts'
+# trigramは3文字未満の語を検索できない
+SCHOOL_NAME_FTS_MIN_LENGTH = 3
+
+
+def create_school_name_fts(cursor):
+    """
+    学校名のFTS5インデックスと同期用トリガーを作成（作成時は既存データを投入）
+
+    Returns:
+        bool: 利用可能か（SQLiteがFTS5/trigram非対応の場合はFalse）
+    """
+    cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+        (SCHOOL_NAME_FTS_TABLE,)
+    )
+    if cursor.fetchone():
+        return True
+
+    try:
+        cursor.execute(f'''
+            CREATE VIRTUAL TABLE {SCHOOL_NAME_FTS_TABLE} USING fts5(
+                school_name, base_school_name, tokenize = 'trigram'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        print(f"学校名の全文検索インデックスは利用できません: {e}")
+        return False
+
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {SCHOOL_NAME_FTS_TABLE}_ai AFTER INSERT ON schools_master BEGIN
+            DELETE FROM {SCHOOL_NAME_FTS_TABLE} WHERE rowid = new.school_id;
+            INSERT INTO {SCHOOL_NAME_FTS_TABLE} (rowid, school_name, base_school_name)
+            VALUES (new.school_id, new.school_name, new.base_school_name);
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {SCHOOL_NAME_FTS_TABLE}_au
+        AFTER UPDATE OF school_id, school_name, base_school_name ON schools_master BEGIN
+            DELETE FROM {SCHOOL_NAME_FTS_TABLE} WHERE rowid = old.school_id;
+            INSERT INTO {SCHOOL_NAME_FTS_TABLE} (rowid, school_name, base_school_name)
+            VALUES (new.school_id, new.school_name, new.base_school_name);
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {SCHOOL_NAME_FTS_TABLE}_ad AFTER DELETE ON schools_master BEGIN
+            DELETE FROM {SCHOOL_NAME_FTS_TABLE} WHERE rowid = old.school_id;
+        END
+    ''')
+    cursor.execute(f'''
+        INSERT INTO {SCHOOL_NAME_FTS_TABLE} (rowid, school_name, base_school_name)
+        SELECT school_id, school_name, base_school_name FROM schools_master
+    ''')
+    return True
+
+
+def create_school_name_aliases_table(cursor):
+    """
+    学校名の別名テーブルを作成
+
+    報告書上の表記（alias）と正規化名から school_id を1回の索引検索で引けるようにする。
+    source は master（学校マスタの名称）/ mapping（名称変更の変換表）/ matched（表記揺れ照合で学習）。
+    schools_master は INSERT OR REPLACE で更新されるため外部キーは張らず、参照時に結合して確認する。
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS school_name_aliases (
+            alias TEXT PRIMARY KEY,
+            normalized_name TEXT NOT NULL,
+            school_id INTEGER NOT NULL,
+            source TEXT NOT NULL,
+            updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_school_name_aliases_normalized '
+        'ON school_name_aliases(normalized_name)'
+    )
+    # 学校マスタの名称完全一致（別名の同期・未登録表記の解決）用
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_schools_name ON schools_master(school_name, updated_at)')
+
+
+def fts_phrase(text):
+    """FTS5のMATCH用に文字列をフレーズとしてエスケープ"""
+    return '"' + text.replace('"', '""') + '"'
+
+
+def school_name_filter_sql(column_prefix, text, use_fts=True):
+    """
+    学校名（school_name）の部分一致条件を構築
+
+    3文字以上ならFTS5インデックスを使い、それ未満（trigramで検索できない）は LIKE にする。
+
+    Args:
+        column_prefix: schools_master のテーブル別名（例: 's'）
+        text: 検索文字列
+        use_fts: FTS5インデックスを使うか
+
+    Returns:
+        tuple: (条件SQL, パラメータのリスト)
+    """
+    if use_fts and len(text) >= SCHOOL_NAME_FTS_MIN_LENGTH:
+        return (
+            f'{column_prefix}.school_id IN ('
+            f'SELECT rowid FROM {SCHOOL_NAME_FTS_TABLE} WHERE {SCHOOL_NAME_FTS_TABLE} MATCH ?)',
+            ['school_name : ' + fts_phrase(text)]
+        )
+    return f'{column_prefix}.school_name LIKE ?', [f'%{text}%']
+
+
+def find_school_name_candidates(cursor, text):
+    """
+    文字列と3文字以上の部分文字列を共有する学校を取得（表記揺れ照合の候補絞り込み用）
+
+    Returns:
+        list: [(school_id, school_name), ...]（更新日時の新しい順）。
+              FTS5が使えない・文字列が短い場合はNone
+    """
+    if len(text) < SCHOOL_NAME_FTS_MIN_LENGTH:
+        return None
+    cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+        (SCHOOL_NAME_FTS_TABLE,)
+    )
+    if not cursor.fetchone():
+        return None
+
+    trigrams = list(dict.fromkeys(text[i:i + 3] for i in range(len(text) - 2)))
+    query = ' OR '.join(fts_phrase(t) for t in trigrams)
+    cursor.execute(f'''
+        SELECT s.school_id, s.school_name
+        FROM schools_master s
+        WHERE s.school_id IN (
+            SELECT rowid FROM {SCHOOL_NAME_FTS_TABLE} WHERE {SCHOOL_NAME_FTS_TABLE} MATCH ?
+        )
+        ORDER BY s.updated_at DESC
+    ''', (query,))
+    return cursor.fetchall()
+
+
+def _new_db_generation():
+    """
+    DB更新世代の新しい値
+
+    連番にすると同じパスに作り直したDBやバックアップから戻したDBで値が重なり、
+    別の内容に対するキャッシュがヒットしてしまうため乱数にする（0は未記録を表す）。
+    APIのJSONでも値が変わらないよう、JavaScriptの安全な整数の範囲に収める。
+    """
+    return secrets.randbits(52) + 1
+
+
+def _create_db_meta_table(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS db_meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    ''')
+    # 新規DBにも世代を記録しておく（同じパスの以前のDBと区別するため）
+    cursor.execute(
+        "INSERT OR IGNORE INTO db_meta (key, value) VALUES ('generation', ?)",
+        (_new_db_generation(),)
+    )
+
+
+def bump_db_generation(cursor):
+    """
+    DB更新世代を更新する（データ取り込みのコミット前に呼ぶ）
+
+    分析結果キャッシュは世代が変わると無効になる。
+    """
+    _create_db_meta_table(cursor)
+    cursor.execute('''
+        INSERT INTO db_meta (key, value) VALUES ('generation', ?)
+        ON CONFLICT(key) DO UPDATE SET value = excluded.value
+    ''', (_new_db_generation(),))
+
+
+def get_db_generation(db_path=None):
+    """DB更新世代を取得（未記録の場合は0。値の大小に意味はなく、一致するかどうかだけを見る）"""
+    conn = get_connection(db_path)
+    try:
+        row = conn.execute("SELECT value FROM db_meta WHERE key = 'generation'").fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    finally:
+        conn.close()
+    return row[0] if row else 0
+
+
 def normalize_manager_name(manager_name, conn=None):
     """担当者名を正規化（manager_aliasesテーブルを使用）"""
     if not manager_name:
@@ -225,18 +795,145 @@ def get_latest_report_id(conn):
     return row[0] if row else None
 
 
-def get_rapid_growth_schools(db_path=None, target_fy=None):
+# ============================================
+# 分析結果キャッシュ
+# ============================================
+
+ANALYTICS_CACHE_MAX_ENTRIES = 256
+# ディスク保存先（ダッシュボード生成・Flask API・ランチャーで共有）。
+# 環境変数 SP_ANALYTICS_CACHE_DIR を空文字にするとメモリのみ
+_analytics_cache_dir = os.getenv('SP_ANALYTICS_CACHE_DIR', str(Path(__file__).parent / '.analytics_cache'))
+ANALYTICS_CACHE_DIR = Path(_analytics_cache_dir) if _analytics_cache_dir.strip() else None
+
+
+class AnalyticsCache:
     """
-    売上好調校を取得
+    分析関数の結果キャッシュ（LRU + 任意のディスク保存）
+
+    エントリは (キー, DB更新世代) で管理し、世代が一致する場合のみヒットとする。
+    """
+
+    def __init__(self, max_entries=ANALYTICS_CACHE_MAX_ENTRIES, persist_dir=ANALYTICS_CACHE_DIR):
+        self.max_entries = max_entries
+        self.persist_dir = Path(persist_dir) if persist_dir else None
+        self.enabled = True
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _disk_path(self, key):
+        name = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return self.persist_dir / f'{name}.json'
+
+    def get(self, key, generation):
+        """キャッシュを取得（ヒットしない場合は (False, None)）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == generation:
+                self._entries.move_to_end(key)
+                return True, entry[1]
+
+        if self.persist_dir is None:
+            return False, None
+        try:
+            with open(self._disk_path(key), 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return False, None
+        if stored.get('generation') != generation:
+            return False, None
+
+        self._remember(key, generation, stored['result'])
+        return True, stored['result']
+
+    def set(self, key, generation, value):
+        self._remember(key, generation, value)
+        if self.persist_dir is None:
+            return
+        try:
+            self.persist_dir.mkdir(parents=True, exist_ok=True)
+            path = self._disk_path(key)
+            tmp_path = path.with_name(f'{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'generation': generation, 'key': key, 'result': value}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError):
+            # ディスク保存に失敗してもメモリキャッシュは有効
+            pass
+
+    def _remember(self, key, generation, value):
+        with self._lock:
+            self._entries[key] = (generation, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """メモリ上のキャッシュを破棄（ディスク上は世代不一致で自然に無効化される）"""
+        with self._lock:
+            self._entries.clear()
+
+
+analytics_cache = AnalyticsCache()
+
+
+def cached_analytics(func):
+    """
+    分析関数をDB更新世代つきでメモ化するデコレーター
+
+    キーは (関数名, DBパス, 現在年度, 引数)。戻り値は共有されるため呼び出し側で変更しないこと。
+    """
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not analytics_cache.enabled:
+            return func(*args, **kwargs)
+
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        arguments = dict(bound.arguments)
+        db_path = arguments.pop('db_path', None)
+        resolved_db = str(Path(db_path or DEFAULT_DB_PATH).resolve())
+
+        # 年度未指定時は現在年度が結果に影響するためキーに含める
+        key = json.dumps(
+            [func.__name__, resolved_db, get_current_fiscal_year(), arguments],
+            ensure_ascii=False, sort_keys=True, default=str
+        )
+        generation = get_db_generation(db_path)
+
+        hit, value = analytics_cache.get(key, generation)
+        if hit:
+            return value
+        value = func(*args, **kwargs)
+        analytics_cache.set(key, generation, value)
+        return value
+
+    wrapper.uncached = func
+    return wrapper
+
+
+# 売上好調校の既定の閾値（前年比の成長率・前年度売上の下限）
+RAPID_GROWTH_MIN_RATE = 0.3
+RAPID_GROWTH_MIN_PREV_SALES = 10000
+
+
+@cached_analytics
+def get_school_metrics(db_path=None, target_fy=None):
+    """
+    学校別の前年比指標（売上好調校・会員率・売上低下校の共通データ）を取得
 
-    前年比で30%以上の売上成長を見せている学校
+    前年度・今年度の両方に売上がある学校について、売上・成長率・最新会員率を1回のクエリで集計する。
+    閾値による絞り込みは filter_school_metrics で行うため、閾値を変えてもSQLを再実行しない。
 
     Args:
         db_path: データベースパス
         target_fy: 対象年度（Noneの場合は現在年度）
 
     Returns:
-        list: [{school_id, school_name, attribute, branch, studio, current_sales, prev_sales, growth_rate}, ...]
+        list: [{school_id, school_name, attribute, studio, manager, region,
+                current_sales, prev_sales, growth_rate, member_rate}, ...]（school_id順）
+              growth_rate は前年度売上が0以下の場合None、member_rate はパーセント
     """
     conn = get_connection(db_path)
     cursor = conn.cursor()
@@ -248,24 +945,19 @@ def get_rapid_growth_schools(db_path=None, target_fy=None):
     current_fy_start = f'{current_fy}-04-01'
     current_fy_end = f'{current_fy + 1}-04-01'
     prev_fy_start = f'{prev_fy}-04-01'
-    prev_fy_end = f'{prev_fy + 1}-04-01'
 
-    # event_salesから売上を集計（重複除外 + event_dateベース）
-    query = '''
-        WITH current_sales AS (
-            -- 重複レコードを除外: event_date + event_name の組み合わせでユニーク化
-            SELECT
-                school_id,
-                COALESCE(SUM(sales), 0) as total_sales
-            FROM event_sales
-            WHERE report_id = ? AND event_date >= ? AND event_date < ?
-            GROUP BY school_id
-        ),
-        prev_sales AS (
-            -- 重複レコードを除外: event_date + event_name の組み合わせでユニーク化
+    report_id = get_latest_report_id(conn)
+    if not report_id:
+        conn.close()
+        return []
+
+    # 2年度分を1回で走査し、年度ごとの合計を条件付きSUMで分ける（行が無い年度はNULL）
+    cursor.execute('''
+        WITH school_sales AS (
             SELECT
                 school_id,
-                COALESCE(SUM(sales), 0) as total_sales
+                SUM(CASE WHEN event_date >= ? THEN sales END) as current_sales,
+                SUM(CASE WHEN event_date < ? THEN sales END) as prev_sales
             FROM event_sales
             WHERE report_id = ? AND event_date >= ? AND event_date < ?
             GROUP BY school_id
@@ -274,47 +966,103 @@ def get_rapid_growth_schools(db_path=None, target_fy=None):
             s.school_id,
             s.school_name,
             s.attribute,
-            s.region,
             s.studio,
             s.manager,
             s.region,
-            COALESCE(curr.total_sales, 0) as current_sales,
-            COALESCE(prev.total_sales, 0) as prev_sales,
-            (COALESCE(curr.total_sales, 0) - prev.total_sales) / prev.total_sales as growth_rate
-        FROM schools_master s
-        JOIN current_sales curr ON curr.school_id = s.school_id
-        JOIN prev_sales prev ON prev.school_id = s.school_id
-        WHERE prev.total_sales > 10000  -- 最低売上を設定
-          AND (COALESCE(curr.total_sales, 0) - prev.total_sales) / prev.total_sales >= 0.3
-        ORDER BY growth_rate DESC
-    '''
+            ss.current_sales,
+            ss.prev_sales,
+            COALESCE(ROUND(r.member_rate * 100, 1), 0) as member_rate
+        FROM school_sales ss
+        JOIN schools_master s ON s.school_id = ss.school_id
+        LEFT JOIN member_rates_latest r ON r.school_id = s.school_id AND r.grade = ?
+        WHERE ss.current_sales IS NOT NULL AND ss.prev_sales IS NOT NULL
+        ORDER BY s.school_id
+    ''', (current_fy_start, current_fy_start, report_id, prev_fy_start, current_fy_end,
+          MEMBER_RATES_TOTAL_GRADE))
 
-    report_id = get_latest_report_id(conn)
-    if not report_id:
-        conn.close()
-        return []
-
-    cursor.execute(query, (report_id, current_fy_start, current_fy_end, report_id, prev_fy_start, prev_fy_end))
-    
     results = []
     for row in cursor.fetchall():
+        current_sales, prev_sales = row[6], row[7]
         results.append({
             'school_id': row[0],
             'school_name': row[1],
             'attribute': row[2] or '',
-            'region': row[3] or '',
-            'studio': row[4] or '',
-            'manager': row[5] or '',
-            'region': row[6] or '',
-            'current_sales': row[7],
-            'prev_sales': row[8],
-            'growth_rate': row[9]
+            'studio': row[3] or '',
+            'manager': row[4] or '',
+            'region': row[5] or '',
+            'current_sales': current_sales,
+            'prev_sales': prev_sales,
+            'growth_rate': (current_sales - prev_sales) / prev_sales if prev_sales > 0 else None,
+            'member_rate': row[8]
         })
-    
+
     conn.close()
     return results
 
 
+def filter_school_metrics(metrics, min_prev_sales=None, min_growth_rate=None, max_growth_rate=None,
+                          max_member_rate=None, descending=False):
+    """
+    get_school_metrics の結果を閾値で絞り込み、成長率順に並べる（DBアクセスなし）
+
+    ダッシュボードのJavaScript（filterSchoolMetrics）と同じ条件で判定する。Noneの条件は適用しない。
+
+    Args:
+        metrics: get_school_metrics の戻り値
+        min_prev_sales: 前年度売上の下限（この値を超える学校）
+        min_growth_rate: 成長率の下限（以上）。例: 0.3 なら +30% 以上
+        max_growth_rate: 成長率の上限（以下）。例: -0.1 なら -10% 以下
+        max_member_rate: 会員率の上限（パーセント、未満）
+        descending: Trueで成長率の降順、Falseで昇順
+
+    Returns:
+        list: 条件に合う行（元のdictをそのまま返すため変更しないこと）
+    """
+    results = []
+    for row in metrics:
+        growth_rate = row['growth_rate']
+        if growth_rate is None:
+            continue
+        if min_prev_sales is not None and not row['prev_sales'] > min_prev_sales:
+            continue
+        if min_growth_rate is not None and growth_rate < min_growth_rate:
+            continue
+        if max_growth_rate is not None and growth_rate > max_growth_rate:
+            continue
+        if max_member_rate is not None and not row['member_rate'] < max_member_rate:
+            continue
+        results.append(row)
+
+    results.sort(key=lambda r: r['growth_rate'], reverse=descending)
+    return results
+
+
+@cached_analytics
+def get_rapid_growth_schools(db_path=None, target_fy=None, min_growth_rate=RAPID_GROWTH_MIN_RATE,
+                             min_prev_sales=RAPID_GROWTH_MIN_PREV_SALES):
+    """
+    売上好調校を取得
+
+    前年比で min_growth_rate 以上の売上成長を見せている学校（既定: 前年度売上1万円超・30%以上）
+
+    Args:
+        db_path: データベースパス
+        target_fy: 対象年度（Noneの場合は現在年度）
+        min_growth_rate: 成長率の下限
+        min_prev_sales: 前年度売上の下限（この値を超える学校）
+
+    Returns:
+        list: [{school_id, school_name, attribute, region, studio, manager, current_sales, prev_sales, growth_rate, ...}, ...]
+    """
+    return filter_school_metrics(
+        get_school_metrics(db_path, target_fy=target_fy),
+        min_prev_sales=min_prev_sales,
+        min_growth_rate=min_growth_rate,
+        descending=True
+    )
+
+
+@cached_analytics
 def get_new_schools(db_path=None, target_fy=None, target_month=None):
     """
     新規開始校を取得（指定年度に売上があり、前年度に売上がない学校）
@@ -352,7 +1100,7 @@ def get_new_schools(db_path=None, target_fy=None, target_month=None):
             GROUP BY school_id
         ),
         current_sales AS (
-            -- 重複レコードを除外: event_date + event_name の組み合わせでユニーク化
+            -- 学校別の売上合計（event_salesは自然キーで一意、分割入金は取り込み時に合算済み）
             SELECT
                 school_id,
                 COALESCE(SUM(sales), 0) as total_sales
@@ -414,6 +1162,7 @@ def get_new_schools(db_path=None, target_fy=None, target_month=None):
     return results
 
 
+@cached_analytics
 def get_no_events_schools(db_path=None, target_fy=None, target_month=None):
     """
     今年度未実施校を取得（前年度売上があり、今年度売上がない学校）
@@ -463,7 +1212,7 @@ def get_no_events_schools(db_path=None, target_fy=None, target_month=None):
             GROUP BY school_id
         ),
         prev_sales AS (
-            -- 前年度売上（重複除外）
+            -- 前年度売上
             SELECT
                 school_id,
                 COALESCE(SUM(sales), 0) as total_sales
@@ -521,6 +1270,7 @@ def get_no_events_schools(db_path=None, target_fy=None, target_month=None):
     return results
 
 
+@cached_analytics
 def get_declining_schools(db_path=None, target_fy=None, member_rate_threshold=0.5, sales_decline_threshold=0.1):
     """
     会員率・売上低下校を取得
@@ -528,126 +1278,22 @@ def get_declining_schools(db_path=None, target_fy=None, member_rate_threshold=0.
     Args:
         db_path: データベースパス
         target_fy: 対象年度
-        member_rate_threshold: 会員率の閾値（これより低い学校を取得）
-        sales_decline_threshold: 売上減少率の閾値（これより減少幅が大きい学校を取得。正の値で指定）
+        member_rate_threshold: 会員率の閾値（これより低い学校を取得。Noneで絞り込まない）
+        sales_decline_threshold: 売上減少率の閾値（これより減少幅が大きい学校を取得。正の値で指定。Noneで絞り込まない）
                                  例: 0.1 なら -10% 以下（減少率10%以上）
-    """
-    conn = get_connection(db_path)
-    cursor = conn.cursor()
 
-    current_fy = target_fy if target_fy else get_current_fiscal_year()
-    prev_fy = current_fy - 1
-
-    # event_dateベースで年度の範囲を計算（4月始まり）
-    current_fy_start = f'{current_fy}-04-01'
-    current_fy_end = f'{current_fy + 1}-04-01'
-    prev_fy_start = f'{prev_fy}-04-01'
-    prev_fy_end = f'{prev_fy + 1}-04-01'
-
-    report_id = get_latest_report_id(conn)
-    if not report_id:
-        conn.close()
-        return []
-
-    # 最新の会員率スナップショットを取得(grade='全学年')
-    # event_salesから売上を集計（event_dateベースで年度判定）
-
-    query = f'''
-        WITH current_sales AS (
-            -- 重複レコードを除外: event_date + event_name の組み合わせでユニーク化
-            SELECT
-                school_id,
-                COALESCE(SUM(sales), 0) as total_sales
-            FROM event_sales
-            WHERE report_id = ? AND event_date >= ? AND event_date < ?
-            GROUP BY school_id
-        ),
-        prev_sales AS (
-            -- 重複レコードを除外: event_date + event_name の組み合わせでユニーク化
-            SELECT
-                school_id,
-                COALESCE(SUM(sales), 0) as total_sales
-            FROM event_sales
-            WHERE report_id = ? AND event_date >= ? AND event_date < ?
-            GROUP BY school_id
-        ),
-        latest_rates AS (
-            -- 各学校の最新snapshot_dateを取得し、そのsnapshotの最新report_idからデータを取得
-            SELECT 
-                m.school_id,
-                ROUND(
-                    CASE 
-                        WHEN COALESCE(SUM(m.total_students), 0) > 0 
-                        THEN CAST(COALESCE(SUM(m.member_count), 0) AS REAL) / SUM(m.total_students) * 100
-                        ELSE 0 
-                    END,
-                    1
-                ) as member_rate
-            FROM member_rates m
-            JOIN (
-                SELECT 
-                    m2.school_id,
-                    m2.snapshot_date,
-                    MAX(m2.report_id) as latest_report
-                FROM member_rates m2
-                JOIN (
-                    SELECT school_id, MAX(snapshot_date) as max_snapshot
-                    FROM member_rates
-                    GROUP BY school_id
-                ) latest_snap ON m2.school_id = latest_snap.school_id 
-                    AND m2.snapshot_date = latest_snap.max_snapshot
-                GROUP BY m2.school_id, m2.snapshot_date
-            ) ls ON m.school_id = ls.school_id 
-                AND m.snapshot_date = ls.snapshot_date 
-                AND m.report_id = ls.latest_report
-            WHERE m.grade != '全学年' AND m.total_students > 0
-            GROUP BY m.school_id
-        )
-        SELECT
-            s.school_id,
-            s.school_name,
-            s.attribute,
-            s.studio,
-            s.manager,
-            s.region,
-            COALESCE(curr.total_sales, 0) as current_sales,
-            COALESCE(prev.total_sales, 0) as prev_sales,
-            (COALESCE(curr.total_sales, 0) - prev.total_sales) / prev.total_sales as growth_rate,
-            COALESCE(r.member_rate, 0) as member_rate
-        FROM schools_master s
-        JOIN current_sales curr ON curr.school_id = s.school_id
-        JOIN prev_sales prev ON prev.school_id = s.school_id
-        LEFT JOIN latest_rates r ON r.school_id = s.school_id
-        WHERE prev.total_sales > 0
-        ORDER BY (COALESCE(curr.total_sales, 0) - prev.total_sales) / prev.total_sales ASC
-    '''
-    
-    # SQL側ではフィルタしない（JavaScript側で全フィルタリングを行う）
-    # パラメータ: 今年度開始日, 今年度終了日, 前年度開始日, 前年度終了日
-    # 修正: report_id, cur_start, cur_end, report_id, prev_start, prev_end
-    params = [report_id, current_fy_start, current_fy_end, report_id, prev_fy_start, prev_fy_end]
-    
-    cursor.execute(query, params)
-    
-    results = []
-    for row in cursor.fetchall():
-        results.append({
-            'school_id': row[0],
-            'school_name': row[1],
-            'attribute': row[2] or '',
-            'studio': row[3] or '',
-            'manager': row[4] or '',
-            'region': row[5] or '',
-            'current_sales': row[6],
-            'prev_sales': row[7],
-            'growth_rate': row[8],
-            'member_rate': row[9]
-        })
-    
-    conn.close()
-    return results
+    Returns:
+        list: [{school_id, school_name, attribute, studio, manager, region, current_sales, prev_sales, growth_rate, member_rate}, ...]
+              成長率の昇順。member_rate はパーセント
+    """
+    return filter_school_metrics(
+        get_school_metrics(db_path, target_fy=target_fy),
+        max_growth_rate=-sales_decline_threshold if sales_decline_threshold is not None else None,
+        max_member_rate=member_rate_threshold * 100 if member_rate_threshold is not None else None
+    )
 
 
+@cached_analytics
 def get_events_for_date_filter(db_path=None, years_back=3):
     """
     イベント開始日別売上分析用の全イベントデータを取得する
@@ -666,20 +1312,12 @@ def get_events_for_date_filter(db_path=None, years_back=3):
     
     query = f'''
         WITH latest_rates AS (
-            -- 最新の会員率（全学年合算の平均的な率を算出）
-            SELECT 
+            -- 最新の会員率（全学年合計、member_rates_latestで取り込み時に集計済み）
+            SELECT
                 school_id,
-                ROUND(
-                    CASE 
-                        WHEN COALESCE(SUM(total_students), 0) > 0 
-                        THEN CAST(COALESCE(SUM(member_count), 0) AS REAL) / SUM(total_students) * 100
-                        ELSE 0 
-                    END,
-                    1
-                ) as member_rate
-            FROM member_rates
-            WHERE report_id = ?
-            GROUP BY school_id
+                ROUND(COALESCE(member_rate, 0) * 100, 1) as member_rate
+            FROM member_rates_latest
+            WHERE grade = '全学年'
         ),
         -- イベントごとに集計（分割入金を合算）
         daily_events AS (
@@ -713,7 +1351,7 @@ def get_events_for_date_filter(db_path=None, years_back=3):
         ORDER BY e.event_date ASC
     '''
     
-    cursor.execute(query, (report_id, report_id, start_fy))
+    cursor.execute(query, (report_id, start_fy))
     
     results = []
     for row in cursor.fetchall():
@@ -736,6 +1374,7 @@ def get_events_for_date_filter(db_path=None, years_back=3):
     return results
 
 
+@cached_analytics
 def get_all_schools(db_path=None):
     """
     全学校の一覧を取得（フィルター用）
@@ -775,6 +1414,7 @@ def get_all_schools(db_path=None):
     return schools
 
 
+@cached_analytics
 def get_yearly_event_comparison(db_path=None, school_id=None, year1=None, year2=None):
     """
     指定学校の2つの年度のイベント一覧を取得して比較
@@ -907,6 +1547,7 @@ def get_yearly_event_comparison(db_path=None, school_id=None, year1=None, year2=
     }
 
 
+@cached_analytics
 def get_improved_member_rate_schools(db_path=None, target_fy=None):
     """
     会員率改善校を取得（前年度と比較して会員率が向上している学校）
@@ -936,24 +1577,12 @@ def get_improved_member_rate_schools(db_path=None, target_fy=None):
     # その時点での全学年合計の会員率を算出する。
 
     query = '''
-        WITH fiscal_snapshots AS (
-            SELECT 
-                school_id,
-                snapshot_date,
-                (CASE 
-                    WHEN CAST(strftime('%m', snapshot_date) AS INTEGER) >= 4 
-                    THEN CAST(strftime('%Y', snapshot_date) AS INTEGER)
-                    ELSE CAST(strftime('%Y', snapshot_date) AS INTEGER) - 1
-                END) as fiscal_year
-            FROM member_rates
-            GROUP BY school_id, snapshot_date
-        ),
-        latest_snapshots AS (
+        WITH latest_snapshots AS (
             SELECT
                 school_id,
                 fiscal_year,
                 MAX(snapshot_date) as max_date
-            FROM fiscal_snapshots
+            FROM member_rates
             WHERE fiscal_year IN (?, ?)
             GROUP BY school_id, fiscal_year
         ),
@@ -1018,6 +1647,7 @@ def get_improved_member_rate_schools(db_path=None, target_fy=None):
     return results
 
 
+@cached_analytics
 def get_sales_unit_price_analysis(db_path=None, target_fy=None):
     """
     イベント平均単価（1イベントあたりの売上）が高い学校を取得
@@ -1043,27 +1673,15 @@ def get_sales_unit_price_analysis(db_path=None, target_fy=None):
         return []
     
     # イベントデータと会員データを結合して取得
-    # 会員データは grade != '全学年' の合計を使用（'全学年'データが存在しない場合に対応）
+    # 会員データは member_rates_latest の全学年合計（学年別データの合算）を使用
     query = '''
-        WITH latest_snapshot AS (
-            SELECT 
-                school_id, 
-                MAX(snapshot_date) as max_snapshot
-            FROM member_rates
-            GROUP BY school_id
-        ),
-        latest_member_counts AS (
-            SELECT 
-                m.school_id,
-                COALESCE(SUM(m.member_count), 0) as member_count,
-                 CASE 
-                    WHEN SUM(m.total_students) > 0 THEN CAST(SUM(m.member_count) AS REAL) / SUM(m.total_students) * 100
-                    ELSE 0 
-                END as member_rate
-            FROM member_rates m
-            JOIN latest_snapshot ls ON m.school_id = ls.school_id AND m.snapshot_date = ls.max_snapshot
-            WHERE m.grade != '全学年'
-            GROUP BY m.school_id
+        WITH latest_member_counts AS (
+            SELECT
+                school_id,
+                member_count,
+                COALESCE(member_rate, 0) * 100 as member_rate
+            FROM member_rates_latest
+            WHERE grade = '全学年'
         )
         SELECT
             s.school_id,
@@ -1144,6 +1762,7 @@ def get_sales_unit_price_analysis(db_path=None, target_fy=None):
     return results
 
 
+@cached_analytics
 def get_studio_decline_analysis(db_path=None, target_fy=None):
     """
     写真館別の売上低下分析
@@ -1234,6 +1853,62 @@ def get_studio_decline_analysis(db_path=None, target_fy=None):
     return results
 
 
+# ============================================
+# データ確認画面
+# ============================================
+
+@cached_analytics
+def get_viewer_filter_options(db_path=None):
+    """
+    データ確認画面のフィルター選択肢を取得
+
+    DB更新世代つきでキャッシュされるため、取り込みがあるまで再集計しない。
+
+    Returns:
+        dict: fiscal_years / months / regions / managers / schools
+    """
+    conn = get_connection(db_path)
+    cursor = conn.cursor()
+
+    latest_report_id = get_latest_report_id(conn)
+
+    # 年度一覧（月次全体売上は最新レポートで数十行程度）
+    cursor.execute('''
+        SELECT DISTINCT fiscal_year FROM monthly_totals
+        WHERE report_id = ?
+        ORDER BY fiscal_year DESC
+    ''', (latest_report_id,))
+    fiscal_years = [row[0] for row in cursor.fetchall()]
+
+    # 事業所・担当者一覧（idx_schools_region_manager / idx_schools_manager のみで解決）
+    cursor.execute('''
+        SELECT DISTINCT region FROM schools_master
+        WHERE region IS NOT NULL AND region != ''
+        ORDER BY region
+    ''')
+    regions = [row[0] for row in cursor.fetchall()]
+
+    cursor.execute('''
+        SELECT DISTINCT manager FROM schools_master
+        WHERE manager IS NOT NULL AND manager != ''
+        ORDER BY manager
+    ''')
+    managers = [row[0] for row in cursor.fetchall()]
+
+    # 学校一覧
+    cursor.execute('SELECT school_id, school_name FROM schools_master ORDER BY school_name')
+    schools = [{'id': row[0], 'name': row[1]} for row in cursor.fetchall()]
+
+    conn.close()
+
+    return {
+        'fiscal_years': fiscal_years,
+        'months': list(range(1, 13)),
+        'regions': regions,
+        'managers': managers,
+        'schools': schools
+    }
+
 
 if __name__ == '__main__':
     # テスト実行: データベース初期化
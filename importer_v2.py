@@ -10,7 +10,12 @@ import numpy as np
 import re
 from pathlib import Path
 from datetime import datetime, timedelta, date
-from database_v2 import get_connection, normalize_manager_name
+from database_v2 import (
+    get_connection, normalize_manager_name, bump_db_generation,
+    create_school_name_fts, find_school_name_candidates, create_school_name_aliases_table,
+    migrate_event_sales_unique_key, EVENT_SALES_UPSERT_SQL, ensure_report_indexes,
+    migrate_member_rates_fiscal_year, create_member_rates_latest_table, refresh_member_rates_latest
+)
 
 
 def excel_serial_to_date(serial):
@@ -154,9 +159,76 @@ def normalize_school_name(school_name):
     return normalized
 
 
+def remember_school_alias(cursor, alias, school_id, source, normalized_name=None):
+    """学校名の表記と school_id の対応を別名テーブルに保存（次回以降は索引検索のみで解決）"""
+    if normalized_name is None:
+        normalized_name = normalize_school_name(alias)
+    cursor.execute('''
+        INSERT OR REPLACE INTO school_name_aliases
+        (alias, normalized_name, school_id, source, updated_at)
+        VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ''', (alias, normalized_name, school_id, source))
+
+
+def sync_school_name_aliases(cursor):
+    """
+    学校マスタの名称と SCHOOL_NAME_MAPPINGS を別名テーブルに反映（コミットは呼び出し側で行う）
+
+    別名未登録の学校名だけを正規化するため、2回目以降はほとんど処理がない。
+    
+    Returns:
+        int: 追加・更新した別名の件数
+    """
+    create_school_name_aliases_table(cursor)
+    count = 0
+    
+    # 学校マスタの名称（同名が複数ある場合は更新日時の新しい学校）
+    # (変換表の別名は get_school_id_by_name と同じく学校マスタの名称より優先)
+    cursor.execute('''
+        SELECT s.school_id, s.school_name FROM schools_master s
+        WHERE s.school_id = (
+            SELECT s2.school_id FROM schools_master s2
+            WHERE s2.school_name = s.school_name
+            ORDER BY s2.updated_at DESC
+            LIMIT 1
+        )
+        AND NOT EXISTS (
+            SELECT 1 FROM school_name_aliases a
+            WHERE a.alias = s.school_name
+              AND (a.school_id = s.school_id OR a.source = 'mapping')
+        )
+    ''')
+    for school_id, school_name in cursor.fetchall():
+        remember_school_alias(cursor, school_name, school_id, 'master')
+        count += 1
+    
+    # 名称変更・表記揺れの変換表（変換先がマスタに存在するもののみ）
+    for alias, target_name in SCHOOL_NAME_MAPPINGS.items():
+        cursor.execute('''
+            SELECT school_id FROM schools_master
+            WHERE school_name = ?
+            ORDER BY updated_at DESC
+            LIMIT 1
+        ''', (target_name,))
+        row = cursor.fetchone()
+        if not row:
+            continue
+        cursor.execute(
+            'SELECT school_id, source FROM school_name_aliases WHERE alias = ?', (alias,)
+        )
+        if cursor.fetchone() != (row[0], 'mapping'):
+            remember_school_alias(cursor, alias, row[0], 'mapping')
+            count += 1
+    
+    return count
+
+
 def get_school_id_by_name(cursor, school_name):
     """
-    学校名からschool_idを取得(完全一致→部分一致の順で検索)
+    学校名からschool_idを取得(別名テーブル→完全一致→正規化名一致→部分一致の順で検索)
+    
+    別名テーブル以外で解決できた表記は別名テーブルに保存する
+    (sync_school_name_aliases でテーブルを用意しておくこと)。
     
     Args:
         cursor: DBカーソル
@@ -165,7 +237,19 @@ def get_school_id_by_name(cursor, school_name):
     Returns:
         int: school_id (見つからない場合はNone)
     """
-    # 0. 学校名マッピングを適用(旧名称→新名称への自動変換)
+    # 0. 解決済みの表記(学校マスタの名称・変換表・過去の照合結果)
+    cursor.execute('''
+        SELECT a.school_id FROM school_name_aliases a
+        JOIN schools_master s ON s.school_id = a.school_id
+        WHERE a.alias = ?
+    ''', (school_name,))
+    row = cursor.fetchone()
+    if row:
+        return row[0]
+    
+    original_name = school_name
+    
+    # 学校名マッピングを適用(旧名称→新名称への自動変換)
     school_name = SCHOOL_NAME_MAPPINGS.get(school_name, school_name)
     
     # 1. 完全一致検索
@@ -177,22 +261,49 @@ def get_school_id_by_name(cursor, school_name):
     ''', (school_name,))
     row = cursor.fetchone()
     if row:
+        source = 'master' if school_name == original_name else 'mapping'
+        remember_school_alias(cursor, original_name, row[0], source)
         return row[0]
     
-    # 2. 部分一致検索(正規化名で)
+    # 2. 正規化名の一致(別名テーブルの索引で検索)
     normalized_input = normalize_school_name(school_name)
+    cursor.execute('''
+        SELECT a.school_id FROM school_name_aliases a
+        JOIN schools_master s ON s.school_id = a.school_id
+        WHERE a.normalized_name = ?
+        ORDER BY s.updated_at DESC
+        LIMIT 1
+    ''', (normalized_input,))
+    row = cursor.fetchone()
+    if row:
+        remember_school_alias(cursor, original_name, row[0], 'matched', normalized_input)
+        return row[0]
+    
+    # 3. 部分一致検索(正規化名で)
+    # まず全文検索インデックスで3文字以上の部分文字列を共有する学校に絞って比較する。
+    # インデックスは正規化前の学校名のため、2文字以下の学校名や空白を除くと一致する学校名は
+    # 候補に入らないことがある。候補内で一致しない場合は全件で比較する
+    candidates = find_school_name_candidates(cursor, normalized_input)
+    if candidates:
+        school_id = _match_school_by_containment(cursor, original_name, normalized_input, candidates)
+        if school_id is not None:
+            return school_id
     
-    # schools_master全件を取得して正規化名で比較
     cursor.execute('''
         SELECT school_id, school_name FROM schools_master
         ORDER BY updated_at DESC
     ''')
-    
-    for school_id, master_name in cursor.fetchall():
+    return _match_school_by_containment(cursor, original_name, normalized_input, cursor.fetchall())
+
+
+def _match_school_by_containment(cursor, original_name, normalized_input, candidates):
+    """正規化名の一致・包含関係で学校を照合（候補は更新日時の新しい順）"""
+    for school_id, master_name in candidates:
         normalized_master = normalize_school_name(master_name)
         
         # 完全一致
         if normalized_input == normalized_master:
+            remember_school_alias(cursor, original_name, school_id, 'matched', normalized_input)
             return school_id
         
         # どちらかが片方に含まれる場合もマッチ(より短い方がより長い方に含まれる)
@@ -200,6 +311,7 @@ def get_school_id_by_name(cursor, school_name):
             # ただし、長さの差が大きすぎる場合は除外(誤マッチ防止)
             len_diff = abs(len(normalized_input) - len(normalized_master))
             if len_diff <= 10:  # 10文字以内の差なら許容
+                remember_school_alias(cursor, original_name, school_id, 'matched', normalized_input)
                 return school_id
     
     return None
@@ -692,17 +804,46 @@ def import_event_sales(xlsx, cursor, report_id, sheet_name, fiscal_year, report_
                 else:
                     actual_fy = fy_from_header
                 
-                cursor.execute('''
-                    INSERT OR REPLACE INTO event_sales
-                    (report_id, fiscal_year, month, branch, school_id, 
-                     event_name, event_date, sales)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (report_id, actual_fy, month, branch, school_id, event_name, event_date, float(sales)))
+                # 同じイベント・同じ月の行（分割入金など）は売上を合算
+                cursor.execute(
+                    EVENT_SALES_UPSERT_SQL,
+                    (report_id, actual_fy, month, branch, school_id, event_name, event_date, float(sales))
+                )
                 stats['count'] += 1
     
     return stats
 
 
+def register_missing_schools(cursor, schools_to_add):
+    """
+    schools_masterに未登録の学校を追加（コミットは呼び出し側で行う）
+    
+    Args:
+        cursor: DBカーソル
+        schools_to_add: {school_id: school_name}
+    
+    Returns:
+        int: 追加件数
+    """
+    cursor.execute('SELECT MAX(logical_school_id) FROM schools_master')
+    next_logical_id = (cursor.fetchone()[0] or 0) + 1
+    
+    added_count = 0
+    for school_id, school_name in schools_to_add.items():
+        cursor.execute('SELECT school_id FROM schools_master WHERE school_id = ?', (school_id,))
+        if not cursor.fetchone():
+            cursor.execute('''
+                INSERT INTO schools_master 
+                (school_id, logical_school_id, school_name, base_school_name, 
+                 fiscal_year, region, attribute, studio, manager, updated_at)
+                VALUES (?, ?, ?, ?, NULL, NULL, NULL, NULL, NULL, CURRENT_TIMESTAMP)
+            ''', (school_id, next_logical_id, school_name, school_name))
+            next_logical_id += 1
+            added_count += 1
+    
+    return added_count
+
+
 def import_member_rates(xlsx, cursor, report_id, report_date, sheet_name='会員率'):
     """会員率を取り込み"""
     # シート名を検索(日付が含まれる場合がある)
@@ -751,6 +892,7 @@ def import_member_rates(xlsx, cursor, report_id, report_date, sheet_name='会員
             snapshot_date = date(year, month, day)
         except:
             snapshot_date = report_date
+    snapshot_fiscal_year = calculate_fiscal_year(snapshot_date.year, snapshot_date.month)
     
     # ヘッダー解析
     header = df.iloc[header_row_idx]
@@ -797,24 +939,11 @@ def import_member_rates(xlsx, cursor, report_id, report_date, sheet_name='会員
                     schools_to_add[school_id] = school_name
         
         # schools_masterに未登録学校を追加
-        cursor.execute('SELECT MAX(logical_school_id) FROM schools_master')
-        next_logical_id = (cursor.fetchone()[0] or 0) + 1
+        added_count = register_missing_schools(cursor, schools_to_add)
         
-        added_count = 0
-        for school_id, school_name in schools_to_add.items():
-            cursor.execute('SELECT school_id FROM schools_master WHERE school_id = ?', (school_id,))
-            if not cursor.fetchone():
-                cursor.execute('''
-                    INSERT INTO schools_master 
-                    (school_id, logical_school_id, school_name, base_school_name, 
-                     fiscal_year, region, attribute, studio, manager, updated_at)
-                    VALUES (?, ?, ?, ?, NULL, NULL, NULL, NULL, NULL, CURRENT_TIMESTAMP)
-                ''', (school_id, next_logical_id, school_name, school_name))
-                next_logical_id += 1
-                added_count += 1
-        
-        cursor.connection.commit()
+        # コミットは呼び出し側で行う（複数ファイル取り込みのSAVEPOINTを解放しないため）
         if added_count > 0:
+            bump_db_generation(cursor)
             print(f"  会員率シートから{added_count}校をschools_masterに自動追加しました")
     
     # データ行を処理
@@ -856,16 +985,159 @@ def import_member_rates(xlsx, cursor, report_id, report_date, sheet_name='会員
         cursor.execute('''
             INSERT OR REPLACE INTO member_rates
             (report_id, snapshot_date, school_id, grade, member_rate, 
-             total_students, member_count)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
+             total_students, member_count, fiscal_year)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
         ''', (report_id, snapshot_date, school_id, grade, member_rate,
               int(total_students) if pd.notna(total_students) else None,
-              int(member_count) if pd.notna(member_count) else None))
+              int(member_count) if pd.notna(member_count) else None,
+              snapshot_fiscal_year))
         stats['count'] += 1
     
     return stats
 
 
+def prepare_import(cursor):
+    """
+    取り込み前のスキーマ準備（既存DBへの後付けインデックス・移行。コミットは呼び出し側で行う）
+    """
+    # event_salesの一意キー（旧DBは重複行を圧縮してから作成）
+    migrate_event_sales_unique_key(cursor)
+    # 報告書削除（ON DELETE CASCADE）で子テーブルを全件走査しないよう report_id 先頭の索引
+    ensure_report_indexes(cursor)
+    # 会員率の年度列（学校別の年度検索をインデックスで行う）
+    migrate_member_rates_fiscal_year(cursor)
+    # 学校ごとの最新会員率（旧DBでは初回のみ全件構築）
+    create_member_rates_latest_table(cursor)
+    # 学校名の全文検索インデックス（学校名の表記揺れ照合で使用）
+    create_school_name_fts(cursor)
+    # 学校名の別名テーブルを最新の学校マスタに合わせる
+    sync_school_name_aliases(cursor)
+
+
+def _member_rate_school_ids(cursor, report_id):
+    """報告書に会員率がある学校IDの集合（member_rates_latest の更新対象の特定用）"""
+    cursor.execute('SELECT DISTINCT school_id FROM member_rates WHERE report_id = ?', (report_id,))
+    return {row[0] for row in cursor.fetchall()}
+
+
+def _import_report_file(cursor, file_path, report_date):
+    """
+    報告書Excel 1ファイルを取り込む（トランザクション制御は呼び出し側で行う）
+    
+    Returns:
+        dict: {'report_id': int, 'stats': dict}
+    
+    Raises:
+        SchoolNotFoundError: 未登録の学校がある場合
+    """
+    # 既存の同じ日付の報告書を削除
+    cursor.execute('SELECT id FROM reports WHERE report_date = ?', (report_date,))
+    existing = cursor.fetchone()
+    member_rate_schools = set()
+    if existing:
+        print(f"既存の報告書(ID: {existing[0]})を削除します")
+        member_rate_schools = _member_rate_school_ids(cursor, existing[0])
+        cursor.execute('DELETE FROM reports WHERE id = ?', (existing[0],))
+    
+    # 報告書メタデータを登録
+    cursor.execute('''
+        INSERT INTO reports (file_name, report_date)
+        VALUES (?, ?)
+    ''', (file_path.name, report_date))
+    report_id = cursor.lastrowid
+    
+    print(f"\n報告書インポート開始: {file_path.name}")
+    print(f"  Report ID: {report_id}")
+    print(f"  報告書日付: {report_date}")
+    
+    xlsx = pd.ExcelFile(file_path)
+    all_stats = {}
+    all_unmatched_schools = []
+    
+    # 1. 月次全体売上
+    print("\n[1/6] 月次全体売上を取り込み中...")
+    stats = import_monthly_totals(xlsx, cursor, report_id)
+    all_stats['monthly_totals'] = stats['count']
+    print(f"  → {stats['count']}件を取り込みました")
+    
+    # 2. 事業所別売上
+    print("\n[2/6] 事業所別売上を取り込み中...")
+    stats = import_branch_monthly_sales(xlsx, cursor, report_id)
+    all_stats['branch_monthly_sales'] = stats['count']
+    print(f"  → {stats['count']}件を取り込みました")
+    
+    # 3. 担当者別月次売上
+    print("\n[3/6] 担当者別月次売上を取り込み中...")
+    stats = import_manager_monthly_sales(xlsx, cursor, report_id)
+    all_stats['manager_monthly_sales'] = stats['count']
+    print(f"  → {stats['count']}件を取り込みました")
+    
+    # 4. 学校別月次売上(複数年度)
+    print("\n[4/6] 学校別月次売上を取り込み中...")
+    school_sales_count = 0
+    for sheet_name in xlsx.sheet_names:
+        if '学校別' in sheet_name and '比較' not in sheet_name:
+            # シート名から年度を抽出
+            match = re.search(r'(\d{4})年度', sheet_name)
+            if match:
+                fiscal_year = int(match.group(1))
+                print(f"  {sheet_name} を処理中...")
+                stats = import_school_monthly_sales(xlsx, cursor, report_id, sheet_name, fiscal_year)
+                school_sales_count += stats['count']
+                all_unmatched_schools.extend(stats['unmatched_schools'])
+    all_stats['school_monthly_sales'] = school_sales_count
+    print(f"  → {school_sales_count}件を取り込みました")
+    
+    # 5. イベント別売上(複数年度)
+    print("\n[5/6] イベント別売上を取り込み中...")
+    event_sales_count = 0
+    for sheet_name in xlsx.sheet_names:
+        if 'イベント別' in sheet_name:
+            match = re.search(r'(\d{4})年度', sheet_name)
+            if match:
+                fiscal_year = int(match.group(1))
+                print(f"  {sheet_name} を処理中...")
+                stats = import_event_sales(xlsx, cursor, report_id, sheet_name, fiscal_year, report_date)
+                event_sales_count += stats['count']
+                all_unmatched_schools.extend(stats['unmatched_schools'])
+    all_stats['event_sales'] = event_sales_count
+    print(f"  → {event_sales_count}件を取り込みました")
+    
+    # 6. 会員率
+    print("\n[6/6] 会員率を取り込み中...")
+    stats = import_member_rates(xlsx, cursor, report_id, report_date)
+    all_stats['member_rates'] = stats['count']
+    all_unmatched_schools.extend(stats['unmatched_schools'])
+    print(f"  → {stats['count']}件を取り込みました")
+    
+    # 取り込んだ学校・削除した報告書の学校だけ最新会員率を更新
+    member_rate_schools |= _member_rate_school_ids(cursor, report_id)
+    refresh_member_rates_latest(cursor, member_rate_schools)
+    
+    # 未登録学校のチェック
+    all_unmatched_schools = list(set(all_unmatched_schools))
+    if all_unmatched_schools:
+        raise SchoolNotFoundError(all_unmatched_schools)
+    
+    return {'report_id': report_id, 'stats': all_stats}
+
+
+def _import_error_result(e):
+    """取り込み失敗時の戻り値（import_excel_v2 と同じ形式）"""
+    if isinstance(e, SchoolNotFoundError):
+        return {
+            'success': False,
+            'error': str(e),
+            'unmatched_schools': e.school_names
+        }
+    import traceback
+    return {
+        'success': False,
+        'error': f'{type(e).__name__}: {str(e)}',
+        'traceback': traceback.format_exc()
+    }
+
+
 def import_excel_v2(file_path, db_path=None):
     """
     報告書Excelファイル全体をV2 DBに取り込み
@@ -887,100 +1159,407 @@ def import_excel_v2(file_path, db_path=None):
     if not report_date:
         return {'success': False, 'error': 'ファイル名から日付を抽出できません'}
     
+    conn = get_connection(db_path)
     try:
-        conn = get_connection(db_path)
         cursor = conn.cursor()
+        prepare_import(cursor)
+        conn.commit()
+        
+        imported = _import_report_file(cursor, file_path, report_date)
+        
+        # コミット（分析結果キャッシュを無効化するため更新世代を進める）
+        bump_db_generation(cursor)
+        conn.commit()
+        
+        print("\n✅ インポート完了")
+        print(f"統計: {imported['stats']}")
         
-        # 既存の同じ日付の報告書を削除
+        return {'success': True, **imported}
+        
+    except Exception as e:
+        conn.rollback()
+        return _import_error_result(e)
+    finally:
+        conn.close()
+
+
+def import_excel_files_v2(file_paths, db_path=None, stop_on_error=True, progress_callback=None):
+    """
+    複数の報告書Excelを1トランザクションで取り込み（ファイルごとにSAVEPOINT）
+    
+    失敗したファイルはSAVEPOINTまで巻き戻すだけなので、取り込み済みの報告書を
+    DELETE（子テーブルへのCASCADE）で消し直す必要がない。同じ日付の既存報告書を
+    置き換えた場合も、全体を巻き戻せば元の報告書がそのまま残る。
+    
+    Args:
+        file_paths: 報告書Excelのパスのリスト（この順に取り込む）
+        db_path: DBパス
+        stop_on_error: Trueなら1ファイルでも失敗したら全体を巻き戻す。
+                       Falseなら失敗したファイルだけを巻き戻して残りを反映する
+        progress_callback: (index, total, file_name) を受け取る関数
+    
+    Returns:
+        dict: {
+            'success': bool（全ファイル成功時True）,
+            'results': [ファイルごとの import_excel_v2 と同じ形式 + 'file_name'],
+            'imported_count': int（反映したファイル数）,
+            'error': str（stop_on_error で中断した場合のみ）
+        }
+    """
+    file_paths = [Path(p) for p in file_paths]
+    results = []
+    
+    conn = get_connection(db_path)
+    try:
+        cursor = conn.cursor()
+        prepare_import(cursor)
+        conn.commit()
+        
+        cursor.execute('BEGIN')
+        for index, file_path in enumerate(file_paths):
+            if progress_callback:
+                progress_callback(index, len(file_paths), file_path.name)
+            
+            report_date = extract_report_date(file_path.name) if file_path.exists() else None
+            if not file_path.exists():
+                result = {'success': False, 'error': f'ファイルが見つかりません: {file_path}'}
+            elif not report_date:
+                result = {'success': False, 'error': 'ファイル名から日付を抽出できません'}
+            else:
+                savepoint = f'import_file_{index}'
+                cursor.execute(f'SAVEPOINT {savepoint}')
+                try:
+                    result = {'success': True, **_import_report_file(cursor, file_path, report_date)}
+                    cursor.execute(f'RELEASE {savepoint}')
+                except Exception as e:
+                    cursor.execute(f'ROLLBACK TO {savepoint}')
+                    cursor.execute(f'RELEASE {savepoint}')
+                    result = _import_error_result(e)
+            
+            result['file_name'] = file_path.name
+            results.append(result)
+            
+            if not result['success'] and stop_on_error:
+                conn.rollback()
+                return {
+                    'success': False,
+                    'results': results,
+                    'imported_count': 0,
+                    'error': f"{file_path.name}: {result['error']}"
+                }
+        
+        imported_count = sum(1 for r in results if r['success'])
+        if imported_count:
+            bump_db_generation(cursor)
+        conn.commit()
+        
+        print(f"\n✅ {imported_count}/{len(file_paths)}件の報告書を取り込みました")
+        return {
+            'success': imported_count == len(file_paths),
+            'results': results,
+            'imported_count': imported_count
+        }
+        
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+# ============================================
+# 集計結果の直接取り込み（Excelを経由しない）
+# ============================================
+
+# 前回報告書から引き継ぐ月次テーブル（対象年度・月の行のみ差し替える。event_salesは売上月で判定）
+CARRY_FORWARD_TABLES = [
+    'monthly_totals',
+    'branch_monthly_sales',
+    'manager_monthly_sales',
+    'school_monthly_sales',
+    'event_sales',
+]
+
+
+def _sales_month_condition(table, fiscal_year, month):
+    """
+    対象年度・月（売上月）の行を表すWHERE条件とパラメータ
+    
+    event_sales の fiscal_year はイベント日の年度で、売上月の年度とは限らない
+    （前年度のイベントの入金など）。年度が一致する行に加え、年度が異なる行は
+    イベント日が売上月の6か月前〜5か月後にあるものを対象年度・月の売上とみなす。
+    """
+    if table != 'event_sales':
+        return 'fiscal_year = ? AND month = ?', (fiscal_year, month)
+    sales_year = fiscal_year if month >= 4 else fiscal_year + 1
+    # event_date が NULL の行も真偽が確定するようにする（NOT (...) で引き継ぐ際に落ちないように）
+    condition = '''month = ? AND (
+        fiscal_year = ?
+        OR COALESCE(event_date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]*'
+            AND ? - (CAST(substr(event_date, 1, 4) AS INTEGER) * 12
+                     + CAST(substr(event_date, 6, 2) AS INTEGER)) BETWEEN -5 AND 6, 0)
+    )'''
+    return condition, (month, fiscal_year, sales_year * 12 + month)
+
+
+def _table_columns(cursor, table):
+    """id・report_id 以外のカラム名一覧"""
+    cursor.execute(f'PRAGMA table_info({table})')
+    return [row[1] for row in cursor.fetchall() if row[1] not in ('id', 'report_id')]
+
+
+def _parse_event_date(value):
+    """集計結果のイベント開始日文字列を date に変換（変換できなければNone）"""
+    if value is None or str(value).strip() == '':
+        return None
+    parsed = pd.to_datetime(str(value).strip(), errors='coerce')
+    if pd.isna(parsed):
+        return None
+    return parsed.date()
+
+
+def _find_column(df, *keywords):
+    """カラム名に全てのキーワードを含む最初の列名（import_member_ratesと同じ判定）"""
+    for col in df.columns:
+        if all(k in str(col) for k in keywords):
+            return col
+    return None
+
+
+def import_aggregation_v2(result, accounts_df, fiscal_year, month, report_date=None,
+                          source_name=None, db_path=None):
+    """
+    月次集計結果（AggregationResult）をV2 DBに直接取り込み
+    
+    ExcelExporterの出力を import_excel_v2 で読み直す代わりに、集計結果と会員率
+    （AccountsCalculatorの出力）を1トランザクションで書き込む。
+    最新の報告書の内容を引き継いだ新しい報告書を作成し、対象年度・月の行だけを差し替える。
+    同じ日付の報告書が最新であれば、その報告書を上書き更新する。
+    
+    Args:
+        result: SalesAggregator.aggregate_all() の結果
+        accounts_df: AccountsCalculator.calculate() の結果（Noneの場合は会員率を引き継ぐ）
+        fiscal_year: 対象年度
+        month: 対象月 (1-12)
+        report_date: 報告書日付（省略時は今日）
+        source_name: 報告書名として記録するファイル名（出力したExcel名など）
+        db_path: DBパス
+    
+    Returns:
+        dict: import_excel_v2 と同じ形式
+    """
+    report_date = report_date or date.today()
+    file_name = source_name or f"aggregation_{fiscal_year}{month:02d}"
+    
+    conn = get_connection(db_path)
+    cursor = conn.cursor()
+    prepare_import(cursor)
+    conn.commit()
+    try:
+        # 報告書の管理（import_excel_v2と同じく報告書日付単位）
+        cursor.execute('SELECT MAX(id) FROM reports')
+        source_report_id = cursor.fetchone()[0]
         cursor.execute('SELECT id FROM reports WHERE report_date = ?', (report_date,))
         existing = cursor.fetchone()
-        if existing:
-            print(f"既存の報告書(ID: {existing[0]})を削除します")
-            cursor.execute('DELETE FROM reports WHERE id = ?', (existing[0],))
+        member_rate_schools = _member_rate_school_ids(cursor, existing[0]) if existing else set()
         
-        # 報告書メタデータを登録
-        cursor.execute('''
-            INSERT INTO reports (file_name, report_date)
-            VALUES (?, ?)
-        ''', (file_path.name, report_date))
-        report_id = cursor.lastrowid
+        if existing and existing[0] == source_report_id:
+            # 最新の報告書を上書き更新
+            report_id = existing[0]
+            cursor.execute('''
+                UPDATE reports SET file_name = COALESCE(?, file_name), imported_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (source_name, report_id))
+            cursor.execute('''
+                SELECT budget FROM monthly_totals WHERE report_id = ? AND fiscal_year = ? AND month = ?
+            ''', (report_id, fiscal_year, month))
+            budget_row = cursor.fetchone()
+            for table in CARRY_FORWARD_TABLES:
+                condition, params = _sales_month_condition(table, fiscal_year, month)
+                cursor.execute(f'DELETE FROM {table} WHERE report_id = ? AND {condition}',
+                               (report_id, *params))
+            if accounts_df is not None:
+                cursor.execute('DELETE FROM member_rates WHERE report_id = ?', (report_id,))
+        else:
+            if existing:
+                print(f"既存の報告書(ID: {existing[0]})を削除します")
+                cursor.execute('DELETE FROM reports WHERE id = ?', (existing[0],))
+            cursor.execute('''
+                INSERT INTO reports (file_name, report_date)
+                VALUES (?, ?)
+            ''', (file_name, report_date))
+            report_id = cursor.lastrowid
+            
+            budget_row = None
+            if source_report_id is not None:
+                cursor.execute('''
+                    SELECT budget FROM monthly_totals WHERE report_id = ? AND fiscal_year = ? AND month = ?
+                ''', (source_report_id, fiscal_year, month))
+                budget_row = cursor.fetchone()
+                
+                # 前回報告書の内容を引き継ぐ（対象年度・月以外）
+                for table in CARRY_FORWARD_TABLES:
+                    columns = ', '.join(_table_columns(cursor, table))
+                    condition, params = _sales_month_condition(table, fiscal_year, month)
+                    cursor.execute(f'''
+                        INSERT INTO {table} (report_id, {columns})
+                        SELECT ?, {columns} FROM {table}
+                        WHERE report_id = ? AND NOT ({condition})
+                    ''', (report_id, source_report_id, *params))
+                if accounts_df is None:
+                    columns = ', '.join(_table_columns(cursor, 'member_rates'))
+                    cursor.execute(f'''
+                        INSERT INTO member_rates (report_id, {columns})
+                        SELECT ?, {columns} FROM member_rates WHERE report_id = ?
+                    ''', (report_id, source_report_id))
         
-        print(f"\n報告書インポート開始: {file_path.name}")
+        print(f"\n集計結果の直接取り込み開始: {fiscal_year}年度 {month}月")
         print(f"  Report ID: {report_id}")
-        print(f"  報告書日付: {report_date}")
         
-        xlsx = pd.ExcelFile(file_path)
         all_stats = {}
-        all_unmatched_schools = []
+        unmatched_schools = []
         
         # 1. 月次全体売上
-        print("\n[1/6] 月次全体売上を取り込み中...")
-        stats = import_monthly_totals(xlsx, cursor, report_id)
-        all_stats['monthly_totals'] = stats['count']
-        print(f"  → {stats['count']}件を取り込みました")
+        summary = result.summary
+        if summary is not None and summary.total_sales:
+            cursor.execute('''
+                INSERT OR REPLACE INTO monthly_totals
+                (report_id, fiscal_year, month, total_sales, direct_sales,
+                 studio_sales, school_count, budget)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (report_id, fiscal_year, month, float(summary.total_sales),
+                  float(summary.direct_sales), float(summary.studio_sales),
+                  int(summary.school_count), budget_row[0] if budget_row else None))
+            all_stats['monthly_totals'] = 1
+        else:
+            all_stats['monthly_totals'] = 0
         
         # 2. 事業所別売上
-        print("\n[2/6] 事業所別売上を取り込み中...")
-        stats = import_branch_monthly_sales(xlsx, cursor, report_id)
-        all_stats['branch_monthly_sales'] = stats['count']
-        print(f"  → {stats['count']}件を取り込みました")
+        rows = [(report_id, fiscal_year, month, str(r.branch_name).strip(), float(r.sales))
+                for r in result.branch_sales if r.branch_name and float(r.sales) != 0]
+        cursor.executemany('''
+            INSERT OR REPLACE INTO branch_monthly_sales
+            (report_id, fiscal_year, month, branch_name, sales, budget)
+            VALUES (?, ?, ?, ?, ?, NULL)
+        ''', rows)
+        all_stats['branch_monthly_sales'] = len(rows)
+        
+        # 3. 担当者別月次売上（同名に正規化された担当者は合算）
+        manager_sales = {}
+        for r in result.salesman_sales:
+            if not r.salesman or float(r.sales) == 0:
+                continue
+            manager = normalize_manager_name(str(r.salesman).strip(), conn)
+            manager_sales[manager] = manager_sales.get(manager, 0.0) + float(r.sales)
+        cursor.executemany('''
+            INSERT OR REPLACE INTO manager_monthly_sales
+            (report_id, fiscal_year, month, manager, sales)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(report_id, fiscal_year, month, m, sales) for m, sales in manager_sales.items()])
+        all_stats['manager_monthly_sales'] = len(manager_sales)
+        
+        # 4. 学校別月次売上
+        school_id_cache = {}
+        
+        def lookup_school(name):
+            if name not in school_id_cache:
+                school_id_cache[name] = get_school_id_by_name(cursor, name)
+            school_id = school_id_cache[name]
+            if school_id is None and name not in unmatched_schools:
+                unmatched_schools.append(name)
+            return school_id
         
-        # 3. 担当者別月次売上
-        print("\n[3/6] 担当者別月次売上を取り込み中...")
-        stats = import_manager_monthly_sales(xlsx, cursor, report_id)
-        all_stats['manager_monthly_sales'] = stats['count']
-        print(f"  → {stats['count']}件を取り込みました")
+        count = 0
+        for r in result.school_sales:
+            school_name = str(r.school_name).strip() if r.school_name else ''
+            if not school_name or float(r.sales) == 0:
+                continue
+            school_id = lookup_school(school_name)
+            if school_id is None:
+                continue
+            manager = normalize_manager_name(str(r.salesman).strip(), conn) if r.salesman else None
+            studio = str(r.photostudio).strip() if r.photostudio else None
+            cursor.execute('''
+                INSERT OR REPLACE INTO school_monthly_sales
+                (report_id, fiscal_year, month, school_id, manager, studio, sales)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (report_id, fiscal_year, month, school_id, manager, studio, float(r.sales)))
+            count += 1
+        all_stats['school_monthly_sales'] = count
         
-        # 4. 学校別月次売上(複数年度)
-        print("\n[4/6] 学校別月次売上を取り込み中...")
-        school_sales_count = 0
-        for sheet_name in xlsx.sheet_names:
-            if '学校別' in sheet_name and '比較' not in sheet_name:
-                # シート名から年度を抽出
-                match = re.search(r'(\d{4})年度', sheet_name)
-                if match:
-                    fiscal_year = int(match.group(1))
-                    print(f"  {sheet_name} を処理中...")
-                    stats = import_school_monthly_sales(xlsx, cursor, report_id, sheet_name, fiscal_year)
-                    school_sales_count += stats['count']
-                    all_unmatched_schools.extend(stats['unmatched_schools'])
-        all_stats['school_monthly_sales'] = school_sales_count
-        print(f"  → {school_sales_count}件を取り込みました")
+        # 5. イベント別売上（年度はイベント開始日から計算、import_event_salesと同じ）
+        count = 0
+        for r in result.event_sales:
+            school_name = str(r.school_name).strip() if r.school_name else ''
+            if not school_name or float(r.sales) == 0:
+                continue
+            school_id = lookup_school(school_name)
+            if school_id is None:
+                continue
+            event_date_obj = _parse_event_date(r.event_start_date)
+            actual_fy = (calculate_fiscal_year(event_date_obj.year, event_date_obj.month)
+                         if event_date_obj else fiscal_year)
+            cursor.execute(EVENT_SALES_UPSERT_SQL, (
+                report_id, actual_fy, month, str(r.branch_name).strip() if r.branch_name else None,
+                school_id, str(r.event_name).strip() if r.event_name else '',
+                event_date_obj.strftime('%Y-%m-%d') if event_date_obj else None, float(r.sales)
+            ))
+            count += 1
+        all_stats['event_sales'] = count
         
-        # 5. イベント別売上(複数年度)
-        print("\n[5/6] イベント別売上を取り込み中...")
-        event_sales_count = 0
-        for sheet_name in xlsx.sheet_names:
-            if 'イベント別' in sheet_name:
-                match = re.search(r'(\d{4})年度', sheet_name)
-                if match:
-                    fiscal_year = int(match.group(1))
-                    print(f"  {sheet_name} を処理中...")
-                    stats = import_event_sales(xlsx, cursor, report_id, sheet_name, fiscal_year, report_date)
-                    event_sales_count += stats['count']
-                    all_unmatched_schools.extend(stats['unmatched_schools'])
-        all_stats['event_sales'] = event_sales_count
-        print(f"  → {event_sales_count}件を取り込みました")
+        # 6. 会員率（報告書日付のスナップショット）
+        count = 0
+        if accounts_df is not None and not accounts_df.empty:
+            id_col = _find_column(accounts_df, '学校ID')
+            school_col = _find_column(accounts_df, '学校名')
+            grade_col = _find_column(accounts_df, '学年')
+            students_col = _find_column(accounts_df, '生徒数')
+            members_col = _find_column(accounts_df, '会員', '登録')
+            
+            if id_col and school_col:
+                schools_to_add = {}
+                for school_id_val, school_name_val in zip(accounts_df[id_col], accounts_df[school_col]):
+                    if pd.notna(school_id_val) and pd.notna(school_name_val):
+                        schools_to_add.setdefault(int(school_id_val), str(school_name_val).strip())
+                register_missing_schools(cursor, schools_to_add)
+            
+            if school_col and grade_col:
+                for _, row in accounts_df.iterrows():
+                    school_name = row[school_col]
+                    grade = row[grade_col]
+                    if pd.isna(school_name) or str(school_name).strip() == '' or pd.isna(grade):
+                        continue
+                    school_id = lookup_school(str(school_name).strip())
+                    if school_id is None:
+                        continue
+                    total_students = row[students_col] if students_col else None
+                    member_count = row[members_col] if members_col else None
+                    member_rate = None
+                    if pd.notna(total_students) and pd.notna(member_count) and float(total_students) > 0:
+                        member_rate = float(member_count) / float(total_students)
+                    cursor.execute('''
+                        INSERT OR REPLACE INTO member_rates
+                        (report_id, snapshot_date, school_id, grade, member_rate,
+                         total_students, member_count, fiscal_year)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', (report_id, report_date, school_id, str(grade).strip(), member_rate,
+                          int(total_students) if pd.notna(total_students) else None,
+                          int(member_count) if pd.notna(member_count) else None,
+                          calculate_fiscal_year(report_date.year, report_date.month)))
+                    count += 1
+        all_stats['member_rates'] = count
         
-        # 6. 会員率
-        print("\n[6/6] 会員率を取り込み中...")
-        stats = import_member_rates(xlsx, cursor, report_id, report_date)
-        all_stats['member_rates'] = stats['count']
-        all_unmatched_schools.extend(stats['unmatched_schools'])
-        print(f"  → {stats['count']}件を取り込みました")
+        if unmatched_schools:
+            raise SchoolNotFoundError(unmatched_schools)
         
-        # 未登録学校のチェック
-        all_unmatched_schools = list(set(all_unmatched_schools))
-        if all_unmatched_schools:
-            conn.rollback()
-            conn.close()
-            raise SchoolNotFoundError(all_unmatched_schools)
+        member_rate_schools |= _member_rate_school_ids(cursor, report_id)
+        refresh_member_rates_latest(cursor, member_rate_schools)
         
-        # コミット
+        # コミット（分析結果キャッシュを無効化するため更新世代を進める）
+        bump_db_generation(cursor)
         conn.commit()
-        conn.close()
         
-        print("\n✅ インポート完了")
+        print("\n✅ 直接取り込み完了")
         print(f"統計: {all_stats}")
         
         return {
@@ -988,20 +1567,24 @@ def import_excel_v2(file_path, db_path=None):
             'report_id': report_id,
             'stats': all_stats
         }
-        
+    
     except SchoolNotFoundError as e:
+        conn.rollback()
         return {
             'success': False,
             'error': str(e),
             'unmatched_schools': e.school_names
         }
     except Exception as e:
+        conn.rollback()
         import traceback
         return {
             'success': False,
             'error': f'{type(e).__name__}: {str(e)}',
             'traceback': traceback.format_exc()
         }
+    finally:
+        conn.close()
 
 
 if __name__ == '__main__':
@@ -7,29 +7,25 @@
 メインデスクトップアプリケーション。
 """
 
+import time
+_STARTUP_BEGIN = time.perf_counter()  # --profile-startup の計測開始点
+
 import sys
 import os
 import subprocess
 import threading
+import importlib
 import json
 import socket
-import time
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext, filedialog
 import webbrowser
 from pathlib import Path
 from datetime import datetime
 import ctypes
-import shutil
-from importer_v2 import import_excel_v2
-from dashboard_v2 import generate_dashboard
-import database_v2
-from database_inspection_page import DatabaseInspectionPage
 
-# バックエンドモジュールをインポート
+# バックエンドモジュールの検索パス（aggregator / services は使用箇所でインポート）
 sys.path.insert(0, str(Path(__file__).parent / 'app' / 'backend'))
-from aggregator import SalesAggregator, AccountsCalculator, ExcelExporter, SchoolMasterMismatchError, CumulativeAggregator
-from services import FileHandler
 
 try:
     from tkinterdnd2 import DND_FILES, TkinterDnD
@@ -38,6 +34,44 @@ except ImportError:
     TKDND_AVAILABLE = False
     TkinterDnD = None
 
+# 起動時には読み込まず、使用箇所でインポートする重いモジュール（pandas / openpyxl を含む）
+# ウィンドウ表示後にバックグラウンドで事前読み込みしておく
+DEFERRED_MODULES = [
+    'database_v2',
+    'importer_v2',
+    'dashboard_v2',
+    'database_inspection_page',
+    'dashboard_publish',
+    'aggregator',
+    'services',
+]
+
+# --profile-startup で内訳を表示する主な外部ライブラリ（DEFERRED_MODULES より先に計測）
+PROFILE_LIBRARIES = ['numpy', 'pandas', 'openpyxl']
+
+_STARTUP_MODULES_LOADED = time.perf_counter()
+
+
+def prewarm_modules(module_names=DEFERRED_MODULES):
+    """
+    モジュールを順に読み込み、各モジュールの読み込み時間を返す
+
+    先に読み込んだモジュールと共通の依存は、後のモジュールの時間には含まれない。
+
+    Returns:
+        list: [(モジュール名, 秒), ...]
+    """
+    timings = []
+    for name in module_names:
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            print(f"モジュールの事前読み込みに失敗しました ({name}): {e}")
+        timings.append((name, time.perf_counter() - start))
+    return timings
+
+
 # パス設定
 BASE_DIR = Path(__file__).parent
 APP_DIR = BASE_DIR / 'app'
@@ -74,6 +108,7 @@ DEFAULT_CONFIG = {
     'api_port': 8080,
     'dashboard_host': '0.0.0.0',
     'dashboard_port': 8000,
+    'dashboard_mode': 'no-cache',  # simple_server.py の配信モード（launcher_config.json で 'precompressed' を指定すると有効）
 }
 
 class ModernButton(tk.Button):
@@ -597,7 +632,9 @@ class SidebarButton(tk.Button):
 
 
 class MainApp:
-    def __init__(self):
+    def __init__(self, profile_startup=False):
+        self.profile_startup = profile_startup
+
         # tkinterdnd2が利用可能ならDnD対応版を使用
         if TKDND_AVAILABLE:
             self.root = TkinterDnD.Tk()
@@ -673,17 +710,24 @@ class MainApp:
         self.content_area = tk.Frame(self.root, bg=COLORS['bg_main'])
         self.content_area.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
-        # ページ保持用辞書
+        # ページ保持用辞書（各ページは初回表示時に作成）
         self.pages = {}
-        
-        # 各ページの初期化
-        self.pages['server'] = ServerControlPage(self.content_area, self.server_manager)
-        self.pages['monthly'] = MonthlyAggregationPage(self.content_area)
-        self.pages['cumulative'] = CumulativeAggregationPage(self.content_area)
-        self.pages['results'] = PerformanceReflectionPage(self.content_area, self.server_manager)
-        self.pages['database'] = DatabaseInspectionPage(self.content_area, ModernButton, ModernDropdown)
+        self.page_factories = {
+            'server': lambda: ServerControlPage(self.content_area, self.server_manager),
+            'monthly': lambda: MonthlyAggregationPage(self.content_area),
+            'cumulative': lambda: CumulativeAggregationPage(self.content_area),
+            'results': lambda: PerformanceReflectionPage(self.content_area, self.server_manager),
+            'database': self._create_database_page,
+        }
+
+    def _create_database_page(self):
+        from database_inspection_page import DatabaseInspectionPage
+        return DatabaseInspectionPage(self.content_area, ModernButton, ModernDropdown)
 
     def show_page(self, page_key):
+        if page_key not in self.pages:
+            self.pages[page_key] = self.page_factories[page_key]()
+
         # メニューボタンの見た目更新
         for key, btn in self.menu_buttons.items():
             btn.set_active(key == page_key)
@@ -703,7 +747,39 @@ class MainApp:
         else:
             self.root.destroy()
 
+    def _on_window_shown(self):
+        """ウィンドウ表示後に重いモジュールをバックグラウンドで読み込む"""
+        window_shown = time.perf_counter()
+        if self.profile_startup:
+            target = lambda: self._report_startup_profile(window_shown)
+        else:
+            target = prewarm_modules
+        thread = threading.Thread(target=target, name='module-prewarm')
+        thread.daemon = True
+        thread.start()
+
+    def _report_startup_profile(self, window_shown):
+        """起動時間とモジュール読み込み時間の内訳を出力して終了（--profile-startup）"""
+        timings = prewarm_modules(PROFILE_LIBRARIES + DEFERRED_MODULES)
+        lines = [
+            '起動時間の内訳',
+            f"  ランチャーの読み込み:      {_STARTUP_MODULES_LOADED - _STARTUP_BEGIN:7.3f}秒",
+            f"  ウィンドウ表示まで:        {window_shown - _STARTUP_BEGIN:7.3f}秒",
+            '表示後に読み込むモジュール（読み込み順、共通の依存は先のモジュールに計上）',
+        ]
+        lines += [f"  {name:<26}{sec:7.3f}秒" for name, sec in timings]
+        lines.append(f"  {'合計':<24}{sum(sec for _, sec in timings):7.3f}秒")
+
+        report = '\n'.join(lines)
+        if sys.stdout is not None:
+            print(report, flush=True)
+        else:
+            # コンソールの無いexeではファイルに出力
+            (BASE_DIR / 'startup_profile.txt').write_text(report + '\n', encoding='utf-8')
+        self.root.after(0, self.root.destroy)
+
     def run(self):
+        self.root.after_idle(self._on_window_shown)
         self.root.mainloop()
 
 
@@ -876,7 +952,11 @@ class ServerManager:
                 )
                 script_path = APP_DIR / 'simple_server.py'
                 process = subprocess.Popen(
-                    [sys.executable, str(script_path), '--host', bind_host, '--port', str(port)],
+                    [
+                        sys.executable, str(script_path),
+                        '--host', bind_host, '--port', str(port),
+                        '--mode', self.config.get('dashboard_mode', DEFAULT_CONFIG['dashboard_mode'])
+                    ],
                     cwd=str(APP_DIR),
                     stdout=subprocess.PIPE,
                     stderr=subprocess.STDOUT,
@@ -1352,6 +1432,8 @@ class CumulativeAggregationPage(tk.Frame):
     def _run_cumulative_process(self):
         """累積集計処理（別スレッド）"""
         try:
+            from aggregator import CumulativeAggregator
+
             # ファイルを年月順にソート
             sorted_files = sorted(self.cumulative_files, key=lambda x: (x['year'], x['month']))
             
@@ -2265,21 +2347,25 @@ class PerformanceReflectionPage(tk.Frame):
     def _run_import_process(self):
         """インポート実行（別スレッド）"""
         try:
-            success_count = 0
-            error_details = []
+            from importer_v2 import import_excel_files_v2
+            from dashboard_v2 import generate_dashboard
+            from dashboard_publish import publish_version
+
             total_files = len(self.uploaded_files)
             
-            for i, file_info in enumerate(self.uploaded_files):
-                file_path = file_info['path']
-                
-                self._update_progress(f"処理中 ({i+1}/{total_files}):\n{file_info['name']}")
-                
-                result = import_excel_v2(file_path)
-                
-                if result['success']:
-                    success_count += 1
-                else:
-                    error_details.append(f"{file_info['name']}: {result.get('error')}")
+            # 1トランザクションで取り込み、失敗したファイルだけSAVEPOINTまで巻き戻す
+            batch = import_excel_files_v2(
+                [file_info['path'] for file_info in self.uploaded_files],
+                stop_on_error=False,
+                progress_callback=lambda i, total, name: self._update_progress(
+                    f"処理中 ({i+1}/{total}):\n{name}"
+                )
+            )
+            success_count = batch['imported_count']
+            error_details = [
+                f"{result['file_name']}: {result.get('error')}"
+                for result in batch['results'] if not result['success']
+            ]
             
             if success_count > 0:
                 self._update_progress("ダッシュボードを更新中...")
@@ -2290,7 +2376,7 @@ class PerformanceReflectionPage(tk.Frame):
                 output_path = generate_dashboard(output_dir=public_dir)
                 
                 try:
-                    shutil.copy(output_path, public_dir / 'index.html')
+                    publish_version(output_path, public_dir)
                 except Exception as e:
                     print(f"index.html creation failed: {e}")
                 
@@ -2765,6 +2851,8 @@ class MonthlyAggregationPage(tk.Frame):
     
     def _run_aggregation_process(self):
         """集計処理の実行（別スレッド）"""
+        from aggregator import SchoolMasterMismatchError
+
         try:
             # 集計実行
             result = self._run_direct_aggregation()
@@ -2805,6 +2893,9 @@ class MonthlyAggregationPage(tk.Frame):
             fiscal_year = int(year_str.replace('年度', ''))
             month = int(month_str.replace('月', ''))
             
+            from aggregator import SalesAggregator, AccountsCalculator, ExcelExporter
+            from services import FileHandler
+
             # ファイルハンドラーで読み込み
             upload_dir = Path(__file__).parent / 'temp_uploads'
             upload_dir.mkdir(parents=True, exist_ok=True)
@@ -2961,7 +3052,8 @@ class MonthlyAggregationPage(tk.Frame):
 
 
 def main():
-    app = MainApp()
+    # --profile-startup: 起動時間とモジュール読み込み時間の内訳を表示して終了
+    app = MainApp(profile_startup='--profile-startup' in sys.argv[1:])
     app.run()
 
 if __name__ == '__main__':
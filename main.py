@@ -16,13 +16,15 @@
     # ダッシュボードを生成してファイルサーバーに公開
     python main.py publish
 
+    # 公開ダッシュボードを過去バージョンに戻す
+    python main.py rollback [バージョン]
+
     # DB初期化（既存データ削除）
     python main.py init --force
 """
 
 import sys
 import os
-import shutil
 from pathlib import Path
 
 # 現在のディレクトリをパスに追加
@@ -32,6 +34,7 @@ from database import init_database, DEFAULT_DB_PATH
 from importer import import_excel, import_all_from_directory, sync_school_master
 from dashboard import generate_html_dashboard
 from member_rate_page import generate_member_rate_page
+from dashboard_publish import publish_version, rollback_version, load_manifest
 
 # ファイルサーバーの公開先パス
 PUBLISH_PATH = Path(__file__).parent / 'app' / 'public_dashboards'
@@ -44,6 +47,7 @@ def show_help():
     print("  import <ファイル/ディレクトリ> [--all]  - Excelデータを取り込み")
     print("  dashboard [出力ファイル]                - ダッシュボード生成")
     print("  publish                                 - ダッシュボード生成＆ファイルサーバーに公開")
+    print("  rollback [バージョン]                   - 公開ダッシュボードを過去バージョンに戻す")
     print("  chart [出力ファイル]                    - 会員率推移グラフページ生成")
     print("  all                                     - 全ページ生成")
     print("  init [--force]                          - DB初期化")
@@ -65,8 +69,10 @@ def publish_dashboard(output_dir=None):
         target_dir.mkdir(parents=True, exist_ok=True)
         print(f"  フォルダを作成しました: {target_dir}")
 
+    # バージョンディレクトリに配置してマニフェストを切り替え（途中状態を見せない）
+    published = publish_version(local_path, target_dir)
     dest_path = target_dir / PUBLISH_FILENAME
-    shutil.copy2(local_path, dest_path)
+    print(f"  公開バージョン: {published['version']}")
     print(f"  公開先: {dest_path}")
     print(f"\n公開完了！")
     print(f"アクセスURL: {dest_path}")
@@ -135,6 +141,21 @@ def main():
             print(f"\nエラー: ファイルサーバーへのコピーに失敗しました")
             print(f"  {e}")
 
+    elif command == 'rollback':
+        # 公開バージョンの切り替え（省略時は1つ前）
+        version = sys.argv[2] if len(sys.argv) > 2 else None
+        try:
+            current = rollback_version(PUBLISH_PATH, version)
+            print(f"公開バージョンを切り替えました: {current}")
+        except ValueError as e:
+            print(f"エラー: {e}")
+            manifest = load_manifest(PUBLISH_PATH)
+            if manifest['versions']:
+                print("保持しているバージョン:")
+                for v in manifest['versions']:
+                    mark = '*' if v['version'] == manifest['current'] else ' '
+                    print(f"  {mark} {v['version']}  {v['published_at']}  {v['source']}")
+
     elif command == 'chart':
         output = sys.argv[2] if len(sys.argv) > 2 else None
         path = generate_member_rate_page(output_path=output)
@@ -9,6 +9,10 @@
 import json
 from datetime import datetime
 from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
 from database import get_connection
 
 # 事業所名の統合マッピング（キー → 値 に統合）
@@ -24,6 +28,42 @@ def normalize_branch(branch_name):
     return BRANCH_MAPPING.get(branch_name, branch_name)
 
 
+def _branch_mapping_cte():
+    """
+    BRANCH_MAPPING をSQLの対応表（CTE: branch_map(region, branch)）にする
+
+    Returns:
+        tuple: (CTE定義SQL, パラメータ)
+    """
+    if not BRANCH_MAPPING:
+        return 'branch_map(region, branch) AS (SELECT NULL, NULL WHERE 0)', []
+    values = ', '.join(['(?, ?)'] * len(BRANCH_MAPPING))
+    params = [value for item in BRANCH_MAPPING.items() for value in item]
+    return f'branch_map(region, branch) AS (VALUES {values})', params
+
+
+def _pivot_monthly_sales(rows, keys, target_years):
+    """
+    (年度, キー, 月, 売上) の集計行を年度別・キー別の {'current': {月: 売上}, 'prev': {...}} に展開
+
+    rows は年度内の月順（4月→3月）に並んでいること。
+    """
+    monthly = defaultdict(dict)
+    for fiscal_year, key, month, sales in rows:
+        monthly[(fiscal_year, key)][month] = sales
+
+    result_by_year = {}
+    for year in target_years:
+        result_by_year[year] = {
+            key: {
+                'current': dict(monthly.get((year, key), {})),
+                'prev': dict(monthly.get((year - 1, key), {}))
+            }
+            for key in keys
+        }
+    return result_by_year
+
+
 def get_filter_options(db_path=None):
     """フィルター用の選択肢を取得"""
     conn = get_connection(db_path)
@@ -272,6 +312,278 @@ def get_attribute_average_all_dates(attribute, cursor, target_fy=None):
     return {'current_year': all_data, 'prev_year': {'dates': [], 'rates': []}}
 
 
+# ============================================
+# 一括取得（会員率推移ページ生成用）
+# ============================================
+
+def _rate_series(frame):
+    """集計済みフレーム（snapshot_date, students, members）を {'dates', 'rates'} に変換"""
+    students = frame['students'].to_numpy(dtype=float)
+    members = frame['members'].to_numpy(dtype=float)
+    rates = np.divide(members, students, out=np.zeros_like(members), where=students > 0)
+    # 丸めは個別取得（Pythonのround、生徒数0は整数の0）と同じ結果にするため要素ごとに行う
+    return {
+        'dates': [str(d) for d in frame['snapshot_date']],
+        'rates': [round(float(r) * 100, 1) if s > 0 else 0 for r, s in zip(rates, students)]
+    }
+
+
+# グラフに描画する1系列あたりの最大点数（超える系列はLTTBで間引いて描画する）
+CHART_MAX_POINTS = 120
+
+
+def _date_ordinal(value, fallback):
+    """YYYY-MM-DD を日数に変換（解釈できない場合は fallback）"""
+    try:
+        return datetime.strptime(str(value)[:10], '%Y-%m-%d').toordinal()
+    except ValueError:
+        return fallback
+
+
+def lttb_indices(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets で残す点の位置を選ぶ
+
+    先頭・末尾の点は必ず残し、間の点を threshold - 2 個のバケットに分けて、
+    各バケットから「直前に残した点・次バケットの平均点」との三角形の面積が最大の点を1つずつ選ぶ。
+
+    Args:
+        x: X座標（昇順）
+        y: Y座標
+        threshold: 残す点数
+
+    Returns:
+        list: 残す点のインデックス（昇順）。点数が threshold 以下なら全点
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    every = (n - 2) / (threshold - 2)
+
+    selected = [0]
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        # 次バケットの平均（最後のバケットでは末尾の点）
+        next_end = min(int((i + 2) * every) + 1, n)
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        selected.append(a)
+
+    selected.append(n - 1)
+    return selected
+
+
+def downsample_series(series, max_points=CHART_MAX_POINTS, keep_dates=()):
+    """
+    {'dates', 'rates'} 系列に描画用の間引き位置 'chart_idx' を付与する
+
+    元の dates / rates は表・CSV・全点表示用にそのまま残す。
+    点数が max_points 以下の系列は変更しない。
+
+    Args:
+        series: {'dates': [...], 'rates': [...]}（その場で更新）
+        max_points: 描画する最大点数
+        keep_dates: 間引かずに残す日付（イベント日など）
+
+    Returns:
+        dict: series
+    """
+    dates = series.get('dates') or []
+    if max_points is None or len(dates) <= max_points:
+        return series
+
+    x = [_date_ordinal(d, i) for i, d in enumerate(dates)]
+    selected = set(lttb_indices(x, series['rates'], max_points))
+    selected.update(i for i, d in enumerate(dates) if d in keep_dates)
+    series['chart_idx'] = sorted(selected)
+    return series
+
+
+def get_member_rate_trends_bulk(target_fy=None, db_path=None):
+    """
+    全学校の会員率推移（全学年まとめ・学年別）を一括で取得
+
+    get_member_rate_trend_by_school を学校数×2回呼ぶ代わりに、
+    会員率スナップショット・イベントを1回ずつ読み込んで pandas で集計する。
+    各学校の結果は get_member_rate_trend_by_school と同じ形式。
+    属性平均（期待値）は (属性, 年度) ごとに1回だけ計算する。
+
+    Args:
+        target_fy: 対象年度。Noneの場合は学校ごとにデータ上の最新年度
+
+    Returns:
+        dict: {school_id: {'all': dict, 'grade': dict}}
+    """
+    conn = get_connection(db_path)
+    cursor = conn.cursor()
+
+    cursor.execute('SELECT id, school_name, attribute FROM schools')
+    schools = [tuple(row) for row in cursor.fetchall()]
+
+    cursor.execute('''
+        SELECT school_id, snapshot_date, fiscal_year, grade_category, grade_name,
+               student_count, member_count
+        FROM member_rates
+    ''')
+    rates_df = pd.DataFrame(
+        [tuple(row) for row in cursor.fetchall()],
+        columns=['school_id', 'snapshot_date', 'fiscal_year', 'grade_category',
+                 'grade_name', 'student_count', 'member_count']
+    )
+
+    cursor.execute('''
+        SELECT id, school_id, event_name, start_date, fiscal_year
+        FROM events
+        WHERE start_date IS NOT NULL
+    ''')
+    events_df = pd.DataFrame(
+        [tuple(row) for row in cursor.fetchall()],
+        columns=['id', 'school_id', 'event_name', 'start_date', 'fiscal_year']
+    )
+    conn.close()
+
+    # 学校ごとの対象年度（データ上の最新年度、無ければ2025）
+    latest_fy = rates_df.dropna(subset=['fiscal_year']).groupby('school_id')['fiscal_year'].max()
+    latest_fy = {sid: int(fy) for sid, fy in latest_fy.items() if fy}
+    target_fy_of = {sid: target_fy if target_fy is not None else latest_fy.get(sid, 2025)
+                    for sid, _, _ in schools}
+
+    # 対象年度・前年度のスナップショットのみ残す
+    rates_df['target_fy'] = rates_df['school_id'].map(target_fy_of)
+    in_scope = rates_df[
+        (rates_df['fiscal_year'] == rates_df['target_fy'])
+        | (rates_df['fiscal_year'] == rates_df['target_fy'] - 1)
+    ]
+
+    # 全学年まとめ: (学校, 日付, 年度) 単位
+    all_grouped = (
+        in_scope.groupby(['school_id', 'snapshot_date', 'fiscal_year'], dropna=False)
+        .agg(students=('student_count', 'sum'), members=('member_count', 'sum'))
+        .reset_index()
+        .sort_values(['school_id', 'snapshot_date', 'fiscal_year'], kind='stable', na_position='first')
+    )
+
+    # 学年別: (学校, 日付, 年度, 学年区分, 学年) 単位
+    grade_grouped = (
+        in_scope.groupby(['school_id', 'snapshot_date', 'fiscal_year', 'grade_category', 'grade_name'],
+                         dropna=False)
+        .agg(students=('student_count', 'sum'), members=('member_count', 'sum'))
+        .reset_index()
+        .sort_values(['school_id', 'snapshot_date', 'grade_category', 'fiscal_year', 'grade_name'],
+                     kind='stable', na_position='first')
+    )
+    # groupby(dropna=False) でNULLはNaNになるため、空扱いにしてから学年キーを決める
+    grade_grouped['grade_key'] = [
+        (name if pd.notna(name) else None) or (cat if pd.notna(cat) else None) or '不明'
+        for name, cat in zip(grade_grouped['grade_name'], grade_grouped['grade_category'])
+    ]
+
+    # イベント（アノテーション用）
+    events_df['target_fy'] = events_df['school_id'].map(target_fy_of)
+    events_df = events_df[
+        (events_df['fiscal_year'] == events_df['target_fy'])
+        | (events_df['fiscal_year'] == events_df['target_fy'] - 1)
+    ].sort_values(['school_id', 'start_date', 'id'], kind='stable')
+    events_by_school = {
+        sid: [{'name': name, 'date': str(date), 'year': int(year)}
+              for name, date, year in zip(group['event_name'], group['start_date'], group['fiscal_year'])]
+        for sid, group in events_df.groupby('school_id')
+    }
+
+    # 属性平均（期待値）は属性×年度でメモ化
+    attribute_of = {sid: attr for sid, _, attr in schools}
+    attr_rates = rates_df[['school_id', 'snapshot_date', 'student_count', 'member_count']].copy()
+    attr_rates['attribute'] = attr_rates['school_id'].map(attribute_of)
+    attr_rates = attr_rates[attr_rates['snapshot_date'].notna()]
+    attr_rates['snapshot_date_str'] = attr_rates['snapshot_date'].astype(str)
+    expected_cache = {}
+
+    def attribute_expected(attribute, target_fy):
+        key = (attribute, target_fy)
+        if key not in expected_cache:
+            start_date = f"{target_fy}-04-01"
+            end_date = f"{target_fy + 1}-03-31"
+            subset = attr_rates[
+                (attr_rates['attribute'] == attribute)
+                & (attr_rates['snapshot_date_str'] >= start_date)
+                & (attr_rates['snapshot_date_str'] <= end_date)
+            ]
+            grouped = (
+                subset.groupby('snapshot_date')
+                .agg(students=('student_count', 'sum'), members=('member_count', 'sum'))
+                .reset_index()
+                .sort_values('snapshot_date', kind='stable')
+            )
+            expected_cache[key] = _rate_series(grouped)
+        # 学校ごとに独立したdictを返す（個別取得と同じ構造）
+        cached = expected_cache[key]
+        return {
+            'current_year': {'dates': list(cached['dates']), 'rates': list(cached['rates'])},
+            'prev_year': {'dates': [], 'rates': []}
+        }
+
+    all_by_school = dict(tuple(all_grouped.groupby('school_id', sort=False)))
+    grade_by_school = dict(tuple(grade_grouped.groupby('school_id', sort=False)))
+    empty_frame = all_grouped.iloc[0:0]
+
+    results = {}
+    for school_id, school_name, attribute in schools:
+        school_fy = target_fy_of[school_id]
+        prev_fy = school_fy - 1
+        events = events_by_school.get(school_id, [])
+        expected = attribute_expected(attribute, school_fy) if attribute else None
+
+        # 全学年まとめ
+        school_all = all_by_school.get(school_id, empty_frame)
+        current_data = _rate_series(school_all[school_all['fiscal_year'] == school_fy])
+        prev_data = _rate_series(school_all[school_all['fiscal_year'] == prev_fy])
+
+        # 学年別（学年の並びは最初に出現した順）
+        school_grade = grade_by_school.get(school_id, empty_frame.assign(grade_key=[]))
+        current_grade_data = {}
+        prev_grade_data = {}
+        for fy, target in ((school_fy, current_grade_data), (prev_fy, prev_grade_data)):
+            year_frame = school_grade[school_grade['fiscal_year'] == fy]
+            for key in pd.unique(year_frame['grade_key']):
+                target[key] = _rate_series(year_frame[year_frame['grade_key'] == key])
+
+        results[school_id] = {
+            'all': {
+                'school_name': school_name,
+                'attribute': attribute,
+                'by_grade': False,
+                'current_year': current_data,
+                'prev_year': prev_data,
+                'events': events,
+                'fiscal_year': school_fy,
+                'expected': expected
+            },
+            'grade': {
+                'school_name': school_name,
+                'attribute': attribute,
+                'by_grade': True,
+                'current_year': current_grade_data,
+                'prev_year': prev_grade_data,
+                'events': [dict(e) for e in events],
+                'fiscal_year': school_fy,
+                'expected': attribute_expected(attribute, school_fy) if attribute else None
+            }
+        }
+
+    return results
+
+
 def get_member_rate_trend_by_attribute(attribute, studio=None, target_fy=None, db_path=None):
     """
     属性単位の会員率推移を取得
@@ -804,56 +1116,31 @@ def get_monthly_sales_by_branch(db_path=None, target_years=None):
     # マッピング適用後の事業所リスト（重複排除）
     normalized_branches = list(dict.fromkeys([normalize_branch(b) for b in raw_branches]))
 
-    # 年度別のデータを格納
-    result_by_year = {}
-
-    for year in target_years:
-        result = {}
-        prev_fy = year - 1
-
-        for branch in normalized_branches:
-            # マッピングで統合される事業所を取得（例：鹿沼 → [鹿沼, 栃木]）
-            source_branches = [b for b in raw_branches if normalize_branch(b) == branch]
-
-            # 対象年度の月別売上（統合対象の事業所を合算）
-            placeholders = ','.join(['?' for _ in source_branches])
-            cursor.execute(f'''
-                SELECT
-                    ss.month,
-                    SUM(ss.sales) as total_sales
-                FROM school_sales ss
-                JOIN schools s ON ss.school_id = s.id
-                WHERE s.region IN ({placeholders}) AND ss.fiscal_year = ?
-                GROUP BY ss.month
-                ORDER BY CASE WHEN ss.month >= 4 THEN ss.month - 4 ELSE ss.month + 8 END
-            ''', (*source_branches, year))
-
-            current_data = {row[0]: row[1] for row in cursor.fetchall()}
-
-            # 前年度の月別売上
-            cursor.execute(f'''
-                SELECT
-                    ss.month,
-                    SUM(ss.sales) as total_sales
-                FROM school_sales ss
-                JOIN schools s ON ss.school_id = s.id
-                WHERE s.region IN ({placeholders}) AND ss.fiscal_year = ?
-                GROUP BY ss.month
-                ORDER BY CASE WHEN ss.month >= 4 THEN ss.month - 4 ELSE ss.month + 8 END
-            ''', (*source_branches, prev_fy))
-
-            prev_data = {row[0]: row[1] for row in cursor.fetchall()}
-
-            # 予算は全体の予算から按分（簡易実装）
-            budget_data = {}
-
-            result[branch] = {
-                'current': current_data,
-                'prev': prev_data,
-                'budget': budget_data
-            }
+    # 対象年度・前年度の月別売上を統合後の事業所単位で一括集計
+    fiscal_years = sorted({y for year in target_years for y in (year, year - 1)})
+    mapping_cte, mapping_params = _branch_mapping_cte()
+    cursor.execute(f'''
+        WITH {mapping_cte}
+        SELECT
+            ss.fiscal_year,
+            COALESCE(bm.branch, s.region) as normalized_branch,
+            ss.month,
+            SUM(ss.sales) as total_sales
+        FROM school_sales ss
+        JOIN schools s ON ss.school_id = s.id
+        LEFT JOIN branch_map bm ON bm.region = s.region
+        WHERE s.region IS NOT NULL AND s.region != ''
+          AND ss.fiscal_year IN ({','.join('?' * len(fiscal_years))})
+        GROUP BY ss.fiscal_year, normalized_branch, ss.month
+        ORDER BY ss.fiscal_year, normalized_branch,
+                 CASE WHEN ss.month >= 4 THEN ss.month - 4 ELSE ss.month + 8 END
+    ''', (*mapping_params, *fiscal_years))
 
-        result_by_year[year] = result
+    # 年度別のデータを格納（予算は全体の予算から按分する想定のため未設定）
+    result_by_year = _pivot_monthly_sales(cursor.fetchall(), normalized_branches, target_years)
+    for result in result_by_year.values():
+        for branch_data in result.values():
+            branch_data['budget'] = {}
 
     conn.close()
 
@@ -922,46 +1209,24 @@ def get_monthly_sales_by_person(db_path=None, target_years=None):
         if normalized_region and normalized_region not in person_branches[person]:
             person_branches[person].append(normalized_region)
 
-    # 年度別のデータを格納
-    result_by_year = {}
-
-    for year in target_years:
-        result = {}
-        prev_fy = year - 1
-
-        for person in persons:
-            # 対象年度の月別売上（school_salesテーブルのmanagerカラムを使用）
-            cursor.execute('''
-                SELECT
-                    ss.month,
-                    SUM(ss.sales) as total_sales
-                FROM school_sales ss
-                WHERE ss.manager = ? AND ss.fiscal_year = ?
-                GROUP BY ss.month
-                ORDER BY CASE WHEN ss.month >= 4 THEN ss.month - 4 ELSE ss.month + 8 END
-            ''', (person, year))
-
-            current_data = {row[0]: row[1] for row in cursor.fetchall()}
-
-            # 前年度の月別売上
-            cursor.execute('''
-                SELECT
-                    ss.month,
-                    SUM(ss.sales) as total_sales
-                FROM school_sales ss
-                WHERE ss.manager = ? AND ss.fiscal_year = ?
-                GROUP BY ss.month
-                ORDER BY CASE WHEN ss.month >= 4 THEN ss.month - 4 ELSE ss.month + 8 END
-            ''', (person, prev_fy))
-
-            prev_data = {row[0]: row[1] for row in cursor.fetchall()}
-
-            result[person] = {
-                'current': current_data,
-                'prev': prev_data
-            }
+    # 対象年度・前年度の月別売上を担当者単位で一括集計（school_salesテーブルのmanagerカラムを使用）
+    fiscal_years = sorted({y for year in target_years for y in (year, year - 1)})
+    cursor.execute(f'''
+        SELECT
+            ss.fiscal_year,
+            ss.manager,
+            ss.month,
+            SUM(ss.sales) as total_sales
+        FROM school_sales ss
+        WHERE ss.manager IS NOT NULL AND ss.manager != ''
+          AND ss.fiscal_year IN ({','.join('?' * len(fiscal_years))})
+        GROUP BY ss.fiscal_year, ss.manager, ss.month
+        ORDER BY ss.fiscal_year, ss.manager,
+                 CASE WHEN ss.month >= 4 THEN ss.month - 4 ELSE ss.month + 8 END
+    ''', fiscal_years)
 
-        result_by_year[year] = result
+    # 年度別のデータを格納
+    result_by_year = _pivot_monthly_sales(cursor.fetchall(), persons, target_years)
 
     conn.close()
 
@@ -10,37 +10,98 @@ import json
 from datetime import datetime
 from pathlib import Path
 from member_rate_chart import (
+    CHART_MAX_POINTS,
+    downsample_series,
     get_filter_options,
-    get_member_rate_trend_by_school,
+    get_member_rate_trends_bulk,
     get_member_rate_trend_by_attribute
 )
 
 
-def generate_member_rate_page(db_path=None, output_path=None):
-    """会員率推移グラフページを生成"""
-
-    # フィルターオプション取得
-    options = get_filter_options(db_path)
-
-    # 全データを事前に取得してJSONとして埋め込む
+def _prepare_chart_entry(entry, max_points, expected_series, expected_keys, expected_source):
+    """
+    推移データ1件を埋め込み用に整える
+
+    - 今年度・前年度（学年別を含む）と期待値の系列に描画用の間引き位置を付与
+    - 期待値（属性平均）は学校間で同じ内容が繰り返されるため expected_series に1回だけ格納し、
+      entry には参照キー expected_key を残す。同じ内容かどうかは期待値の集計元
+      expected_source（例: ('attribute', 属性, 年度)）で判定する
+    """
+    event_dates = {e['date'] for e in entry.get('events') or []}
+    for year_key in ('current_year', 'prev_year'):
+        data = entry.get(year_key)
+        if not data:
+            continue
+        if entry.get('by_grade'):
+            for series in data.values():
+                downsample_series(series, max_points, event_dates)
+        else:
+            downsample_series(data, max_points, event_dates)
+
+    expected = entry.pop('expected', None)
+    if expected is None:
+        entry['expected_key'] = None
+        return entry
+    if expected_source not in expected_keys:
+        for series in expected.values():
+            downsample_series(series, max_points)
+        expected_keys[expected_source] = f'e{len(expected_keys)}'
+        expected_series[expected_keys[expected_source]] = expected
+    entry['expected_key'] = expected_keys[expected_source]
+    return entry
+
+
+def build_chart_payload(db_path=None, options=None, max_points=CHART_MAX_POINTS):
+    """
+    会員率推移グラフページに埋め込むデータを作成
+
+    Args:
+        db_path: データベースパス
+        options: get_filter_options の結果（Noneの場合は取得する）
+        max_points: 1系列あたりの描画点数の上限（Noneで間引かない）
+
+    Returns:
+        tuple: (学校別データ, 属性別データ, 期待値系列 {expected_key: {'current_year', 'prev_year'}})
+    """
+    if options is None:
+        options = get_filter_options(db_path)
+    expected_series = {}
+    expected_keys = {}
+
+    # 全データを事前に取得してJSONとして埋め込む（全学校分を一括集計）
     all_school_data = {}
+    school_trends = get_member_rate_trends_bulk(db_path=db_path)
     for school in options['schools']:
+        trends = school_trends.get(school['id'])
+        if not trends:
+            continue
+        # 期待値は学校の属性・対象年度の属性平均
+        expected_source = ('attribute', trends['all']['attribute'], trends['all']['fiscal_year'])
         # 全学年まとめ
-        data_all = get_member_rate_trend_by_school(school['id'], by_grade=False, db_path=db_path)
-        if data_all:
-            all_school_data[f"school_{school['id']}_all"] = data_all
-
+        all_school_data[f"school_{school['id']}_all"] = _prepare_chart_entry(
+            trends['all'], max_points, expected_series, expected_keys, expected_source)
         # 学年別
-        data_grade = get_member_rate_trend_by_school(school['id'], by_grade=True, db_path=db_path)
-        if data_grade:
-            all_school_data[f"school_{school['id']}_grade"] = data_grade
+        all_school_data[f"school_{school['id']}_grade"] = _prepare_chart_entry(
+            trends['grade'], max_points, expected_series, expected_keys, expected_source)
 
     # 属性別データ
     all_attribute_data = {}
     for attr in options['attributes']:
         data = get_member_rate_trend_by_attribute(attr, db_path=db_path)
         if data:
-            all_attribute_data[f"attr_{attr}"] = data
+            # 期待値は対象年度の全体平均（属性によらない）
+            all_attribute_data[f"attr_{attr}"] = _prepare_chart_entry(
+                data, max_points, expected_series, expected_keys, ('overall', data['fiscal_year']))
+
+    return all_school_data, all_attribute_data, expected_series
+
+
+def generate_member_rate_page(db_path=None, output_path=None):
+    """会員率推移グラフページを生成"""
+
+    # フィルターオプション取得
+    options = get_filter_options(db_path)
+    all_school_data, all_attribute_data, expected_series = build_chart_payload(db_path, options)
 
     html = f'''<!DOCTYPE html>
 <html lang="ja">
@@ -274,6 +335,10 @@ def generate_member_rate_page(db_path=None, output_path=None):
                     <input type="checkbox" id="showExpected" checked>
                     <label for="showExpected">期待値（属性平均）を表示</label>
                 </div>
+                <div class="option-group">
+                    <input type="checkbox" id="showAllPoints">
+                    <label for="showAllPoints">全データ点を表示（間引きなし）</label>
+                </div>
                 <button class="btn btn-secondary" onclick="exportCSV()">CSVエクスポート</button>
             </div>
         </div>
@@ -309,10 +374,33 @@ def generate_member_rate_page(db_path=None, output_path=None):
         const schoolsData = {json.dumps(options['schools'], ensure_ascii=False)};
         const allSchoolData = {json.dumps(all_school_data, ensure_ascii=False)};
         const allAttributeData = {json.dumps(all_attribute_data, ensure_ascii=False)};
+        // 期待値（属性平均）系列。各データの expected_key から参照する
+        const expectedSeries = {json.dumps(expected_series, ensure_ascii=False)};
 
         let chart = null;
         let currentData = null;
 
+        // 埋め込みデータに期待値系列を結び付ける
+        function withExpected(entry) {{
+            if (!entry) return entry;
+            return {{ ...entry, expected: entry.expected_key ? expectedSeries[entry.expected_key] : null }};
+        }}
+
+        // 描画に使う点の位置（間引き済みの系列は chart_idx、全点表示時は全点）
+        function chartIndices(series) {{
+            const showAll = document.getElementById('showAllPoints').checked;
+            if (!showAll && series.chart_idx) return series.chart_idx;
+            return series.dates.map((d, i) => i);
+        }}
+
+        function chartPoints(series) {{
+            return chartIndices(series).map(i => ({{ x: series.dates[i], y: series.rates[i] }}));
+        }}
+
+        function chartDates(series) {{
+            return chartIndices(series).map(i => series.dates[i]);
+        }}
+
         // 属性・写真館でフィルタリング
         document.getElementById('filterAttribute').addEventListener('change', filterSchools);
         document.getElementById('filterStudio').addEventListener('change', filterSchools);
@@ -348,6 +436,7 @@ def generate_member_rate_page(db_path=None, output_path=None):
             document.getElementById('gradeAll').checked = true;
             document.getElementById('showPrevYear').checked = true;
             document.getElementById('showExpected').checked = true;
+            document.getElementById('showAllPoints').checked = false;
         }}
 
         function search() {{
@@ -359,12 +448,12 @@ def generate_member_rate_page(db_path=None, output_path=None):
             if (schoolId) {{
                 // 学校単位
                 const key = gradeMode === 'each' ? `school_${{schoolId}}_grade` : `school_${{schoolId}}_all`;
-                currentData = allSchoolData[key];
+                currentData = withExpected(allSchoolData[key]);
                 document.getElementById('gradeOptionGroup').style.display = 'flex';
             }} else if (attr) {{
                 // 属性単位
                 const key = `attr_${{attr}}`;
-                currentData = allAttributeData[key];
+                currentData = withExpected(allAttributeData[key]);
                 document.getElementById('gradeOptionGroup').style.display = 'none';
             }} else {{
                 alert('属性または学校を選択してください');
@@ -403,14 +492,14 @@ def generate_member_rate_page(db_path=None, output_path=None):
                     if (data.dates && data.dates.length > 0) {{
                         datasets.push({{
                             label: `${{grade}}（今年度）`,
-                            data: data.dates.map((d, i) => ({{ x: d, y: data.rates[i] }})),
+                            data: chartPoints(data),
                             borderColor: colors[colorIdx % colors.length],
                             backgroundColor: 'transparent',
                             borderWidth: 2,
                             tension: 0.3,
                             pointRadius: 4
                         }});
-                        allDates = allDates.concat(data.dates);
+                        allDates = allDates.concat(chartDates(data));
                     }}
 
                     // 前年度
@@ -419,7 +508,7 @@ def generate_member_rate_page(db_path=None, output_path=None):
                         if (prevData.dates && prevData.dates.length > 0) {{
                             datasets.push({{
                                 label: `${{grade}}（前年度）`,
-                                data: prevData.dates.map((d, i) => ({{ x: d, y: prevData.rates[i] }})),
+                                data: chartPoints(prevData),
                                 borderColor: colors[colorIdx % colors.length],
                                 backgroundColor: 'transparent',
                                 borderWidth: 2,
@@ -437,7 +526,7 @@ def generate_member_rate_page(db_path=None, output_path=None):
                 if (current && current.dates && current.dates.length > 0) {{
                     datasets.push({{
                         label: '今年度',
-                        data: current.dates.map((d, i) => ({{ x: d, y: current.rates[i] }})),
+                        data: chartPoints(current),
                         borderColor: '#667eea',
                         backgroundColor: 'rgba(102, 126, 234, 0.1)',
                         borderWidth: 3,
@@ -445,7 +534,7 @@ def generate_member_rate_page(db_path=None, output_path=None):
                         tension: 0.3,
                         pointRadius: 5
                     }});
-                    allDates = allDates.concat(current.dates);
+                    allDates = allDates.concat(chartDates(current));
                 }}
 
                 // 前年度
@@ -454,7 +543,7 @@ def generate_member_rate_page(db_path=None, output_path=None):
                     if (prev.dates && prev.dates.length > 0) {{
                         datasets.push({{
                             label: '前年度',
-                            data: prev.dates.map((d, i) => ({{ x: d, y: prev.rates[i] }})),
+                            data: chartPoints(prev),
                             borderColor: '#888',
                             backgroundColor: 'transparent',
                             borderWidth: 2,
@@ -471,7 +560,7 @@ def generate_member_rate_page(db_path=None, output_path=None):
                     if (exp.dates && exp.dates.length > 0) {{
                         datasets.push({{
                             label: '期待値（属性平均）',
-                            data: exp.dates.map((d, i) => ({{ x: d, y: exp.rates[i] }})),
+                            data: chartPoints(exp),
                             borderColor: '#aaa',
                             backgroundColor: 'transparent',
                             borderWidth: 1,
@@ -725,6 +814,7 @@ def generate_member_rate_page(db_path=None, output_path=None):
         // オプション変更時に再描画
         document.getElementById('showPrevYear').addEventListener('change', renderChart);
         document.getElementById('showExpected').addEventListener('change', renderChart);
+        document.getElementById('showAllPoints').addEventListener('change', renderChart);
         document.querySelectorAll('input[name="gradeMode"]').forEach(el => {{
             el.addEventListener('change', search);
         }});
@@ -0,0 +1,112 @@
+"""
+database_v2 の分析結果キャッシュの回帰テスト
+
+実行方法:
+    python -m pytest tests
+"""
+import sqlite3
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).parent.parent
+if str(BASE_DIR) not in sys.path:
+    sys.path.insert(0, str(BASE_DIR))
+
+import database_v2  # noqa: E402
+
+
+def _create_db(db_path, school_name):
+    """学校1件だけのDBを作成し、取り込み時と同じく更新世代を更新する"""
+    if db_path.exists():
+        db_path.unlink()
+    database_v2.init_database(str(db_path))
+    conn = sqlite3.connect(db_path)
+    conn.execute('''
+        INSERT INTO schools_master (school_id, logical_school_id, school_name, base_school_name)
+        VALUES (1, 1, ?, ?)
+    ''', (school_name, school_name))
+    database_v2.bump_db_generation(conn.cursor())
+    conn.commit()
+    conn.close()
+
+
+def _school_names(db_path):
+    return [s['school_name'] for s in database_v2.get_all_schools(str(db_path))]
+
+
+def test_recreated_db_does_not_hit_disk_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(database_v2.analytics_cache, 'persist_dir', tmp_path / 'cache')
+    db_path = tmp_path / 'test.db'
+
+    _create_db(db_path, '旧校')
+    assert _school_names(db_path) == ['旧校']
+
+    # 同じパスにDBを作り直し、別プロセス（メモリキャッシュなし）から参照する
+    _create_db(db_path, '新校')
+    database_v2.analytics_cache.clear()
+    assert _school_names(db_path) == ['新校']
+
+
+def _create_legacy_db(db_path):
+    """取り込み前の旧スキーマ（member_rates に年度列なし・member_rates_latest なし）のDBを作成"""
+    database_v2.init_database(str(db_path))
+    conn = sqlite3.connect(db_path)
+    conn.executescript('''
+        DROP INDEX idx_member_rates_school_fy;
+        ALTER TABLE member_rates DROP COLUMN fiscal_year;
+        DROP TABLE member_rates_latest;
+        INSERT INTO reports (id, file_name, report_date) VALUES (1, 'report_20250501.xlsx', '2025-05-01');
+        INSERT INTO schools_master (school_id, logical_school_id, school_name, base_school_name)
+        VALUES (1, 1, 'A校', 'A校');
+        INSERT INTO member_rates (report_id, snapshot_date, school_id, grade, member_rate, total_students, member_count)
+        VALUES (1, '2025-04-20', 1, '1年', 0.5, 20, 10);
+        INSERT INTO event_sales (report_id, fiscal_year, month, school_id, event_name, event_date, sales)
+        VALUES (1, 2024, 6, 1, '運動会', '2024-06-01', 1000), (1, 2025, 6, 1, '運動会', '2025-06-01', 800);
+    ''')
+    conn.commit()
+    conn.close()
+    # 別プロセスで開く場合と同じく、移行の確認済み状態を持たない
+    database_v2._schema_checked.clear()
+
+
+def test_legacy_db_is_upgraded_before_reading_member_rates(tmp_path):
+    import dashboard_v2
+
+    db_path = tmp_path / 'legacy.db'
+    _create_legacy_db(db_path)
+
+    rates = dashboard_v2.get_member_rates_by_school(str(db_path), 1)
+
+    assert [r['grade'] for r in rates['2025-04-20']] == ['1年', '全学年']
+
+
+def test_legacy_db_builds_member_rates_latest_before_analytics(tmp_path):
+    db_path = tmp_path / 'legacy.db'
+    _create_legacy_db(db_path)
+
+    metrics = database_v2.get_school_metrics(str(db_path), target_fy=2025)
+
+    assert [(m['school_name'], m['member_rate']) for m in metrics] == [('A校', 50.0)]
+
+
+def _create_db_without_generation(db_path, school_name):
+    """DB更新世代（db_meta）を記録していない旧DBを作成"""
+    _create_db(db_path, school_name)
+    conn = sqlite3.connect(db_path)
+    conn.execute('DROP TABLE db_meta')
+    conn.commit()
+    conn.close()
+    database_v2._schema_checked.clear()
+
+
+def test_legacy_dbs_at_same_path_do_not_share_generation(tmp_path, monkeypatch):
+    monkeypatch.setattr(database_v2.analytics_cache, 'persist_dir', tmp_path / 'cache')
+    db_path = tmp_path / 'legacy.db'
+
+    _create_db_without_generation(db_path, '旧校')
+    assert _school_names(db_path) == ['旧校']
+
+    # 世代未記録の別の旧DBに置き換え、別プロセス（メモリキャッシュなし）から参照する
+    _create_db_without_generation(db_path, '新校')
+    database_v2.analytics_cache.clear()
+    assert _school_names(db_path) == ['新校']
@@ -0,0 +1,179 @@
+"""
+importer_v2 の回帰テスト（複数ファイル取り込み・集計結果の直接取り込み）
+
+実行方法:
+    python -m pytest tests
+"""
+import sqlite3
+import sys
+from datetime import date
+from pathlib import Path
+from types import SimpleNamespace
+
+import pandas as pd
+
+BASE_DIR = Path(__file__).parent.parent
+if str(BASE_DIR) not in sys.path:
+    sys.path.insert(0, str(BASE_DIR))
+
+import database_v2  # noqa: E402
+import importer_v2  # noqa: E402
+
+
+def _write_report(path, rows, with_school_id=True):
+    """売上シート（空）と会員率シートだけの報告書Excelを作成"""
+    header = [''] + (['学校ID'] if with_school_id else []) + ['学校名', '学年', '生徒数', '会員登録数']
+    with pd.ExcelWriter(path) as writer:
+        pd.DataFrame([['', '']]).to_excel(writer, sheet_name='売上', header=False, index=False)
+        pd.DataFrame([header] + [[''] + row for row in rows]).to_excel(
+            writer, sheet_name='会員率', header=False, index=False
+        )
+    return path
+
+
+def _setup(tmp_path):
+    db_path = tmp_path / 'test.db'
+    database_v2.init_database(str(db_path))
+    # 1件目: 学校ID列あり（未登録の学校をschools_masterへ自動追加する経路）
+    ok_file = _write_report(tmp_path / 'report_20250410.xlsx', [[1, 'A小学校', '1年', 30, 10]])
+    # 2件目: 学校ID列なし・未登録の学校（SchoolNotFoundError で失敗する）
+    ng_file = _write_report(
+        tmp_path / 'report_20250510.xlsx', [['未登録校', '1年', 30, 10]], with_school_id=False
+    )
+    return db_path, [ok_file, ng_file]
+
+
+def _count(db_path, table):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+
+def test_import_files_stop_on_error_rolls_back_all(tmp_path):
+    db_path, files = _setup(tmp_path)
+
+    result = importer_v2.import_excel_files_v2(files, str(db_path), stop_on_error=True)
+
+    assert result['success'] is False
+    assert result['imported_count'] == 0
+    assert [r['success'] for r in result['results']] == [True, False]
+    # 1件目で自動追加した学校・会員率も含めて全体が巻き戻る
+    assert _count(db_path, 'reports') == 0
+    assert _count(db_path, 'schools_master') == 0
+    assert _count(db_path, 'member_rates') == 0
+
+
+def test_import_files_continue_on_error_keeps_successful_file(tmp_path):
+    db_path, files = _setup(tmp_path)
+
+    result = importer_v2.import_excel_files_v2(files, str(db_path), stop_on_error=False)
+
+    assert result['success'] is False
+    assert result['imported_count'] == 1
+    assert [r['success'] for r in result['results']] == [True, False]
+    assert _count(db_path, 'reports') == 1
+    assert _count(db_path, 'schools_master') == 1
+    assert _count(db_path, 'member_rates') == 1
+
+
+def _aggregation_result(events):
+    """import_aggregation_v2 が参照する属性だけを持つ集計結果"""
+    return SimpleNamespace(
+        summary=None, branch_sales=[], salesman_sales=[], school_sales=[],
+        event_sales=[
+            SimpleNamespace(school_name='A小学校', branch_name='本社', event_name=name,
+                            event_start_date=event_date, sales=sales)
+            for name, event_date, sales in events
+        ]
+    )
+
+
+def _event_sales(db_path, report_id):
+    with sqlite3.connect(db_path) as conn:
+        return sorted(conn.execute('''
+            SELECT fiscal_year, month, event_name, sales FROM event_sales WHERE report_id = ?
+        ''', (report_id,)).fetchall())
+
+
+def test_direct_save_twice_replaces_previous_fiscal_year_events(tmp_path):
+    db_path = tmp_path / 'test.db'
+    database_v2.init_database(str(db_path))
+    with sqlite3.connect(db_path) as conn:
+        importer_v2.register_missing_schools(conn.cursor(), {1: 'A小学校'})
+
+    # 前年度（2024年度）のイベントの4月入金（2025年度4月分）
+    result = _aggregation_result([('卒業式', '2025-03-20', 1000), ('遠足', '2025-04-25', 500)])
+    for _ in range(2):
+        imported = importer_v2.import_aggregation_v2(
+            result, None, 2025, 4, report_date=date(2025, 5, 1), db_path=str(db_path)
+        )
+        assert imported['success'] is True
+
+    assert _event_sales(db_path, imported['report_id']) == [
+        (2024, 4, '卒業式', 1000.0),
+        (2025, 4, '遠足', 500.0),
+    ]
+
+
+def test_direct_save_carry_forward_keeps_other_sales_months(tmp_path):
+    db_path = tmp_path / 'test.db'
+    database_v2.init_database(str(db_path))
+    with sqlite3.connect(db_path) as conn:
+        importer_v2.register_missing_schools(conn.cursor(), {1: 'A小学校'})
+
+    # 2024年度4月分（同じ月番号の前年度売上は引き継がれる）
+    importer_v2.import_aggregation_v2(
+        _aggregation_result([('入学式', '2024-04-10', 300)]), None, 2024, 4,
+        report_date=date(2024, 5, 1), db_path=str(db_path)
+    )
+    result = _aggregation_result([('卒業式', '2025-03-20', 1000)])
+    importer_v2.import_aggregation_v2(
+        result, None, 2025, 4, report_date=date(2025, 5, 1), db_path=str(db_path)
+    )
+    # 別日付の報告書として再取り込み（前回報告書から引き継ぐ経路）
+    imported = importer_v2.import_aggregation_v2(
+        result, None, 2025, 4, report_date=date(2025, 5, 2), db_path=str(db_path)
+    )
+
+    assert _event_sales(db_path, imported['report_id']) == [
+        (2024, 4, '入学式', 300.0),
+        (2024, 4, '卒業式', 1000.0),
+    ]
+
+
+def test_direct_save_carry_forward_keeps_undated_events(tmp_path):
+    db_path = tmp_path / 'test.db'
+    database_v2.init_database(str(db_path))
+    with sqlite3.connect(db_path) as conn:
+        importer_v2.register_missing_schools(conn.cursor(), {1: 'A小学校'})
+
+    # イベント日なしの2024年度4月分
+    importer_v2.import_aggregation_v2(
+        _aggregation_result([('写真販売', None, 300)]), None, 2024, 4,
+        report_date=date(2024, 5, 1), db_path=str(db_path)
+    )
+    # 別日付の報告書で2025年度4月分を取り込む（前回報告書から引き継ぐ経路）
+    imported = importer_v2.import_aggregation_v2(
+        _aggregation_result([('遠足', '2025-04-25', 500)]), None, 2025, 4,
+        report_date=date(2025, 5, 1), db_path=str(db_path)
+    )
+
+    assert _event_sales(db_path, imported['report_id']) == [
+        (2024, 4, '写真販売', 300.0),
+        (2025, 4, '遠足', 500.0),
+    ]
+
+
+def test_school_name_fuzzy_match_finds_short_master_names(tmp_path):
+    db_path = tmp_path / 'test.db'
+    database_v2.init_database(str(db_path))
+    conn = database_v2.get_connection(str(db_path))
+    try:
+        cursor = conn.cursor()
+        # 2文字の学校名は3文字単位の全文検索インデックスの候補に入らない
+        importer_v2.register_missing_schools(cursor, {1: 'そら', 2: 'ひかり学園'})
+        importer_v2.prepare_import(cursor)
+
+        assert importer_v2.get_school_id_by_name(cursor, 'そら幼稚園') == 1
+        assert importer_v2.get_school_id_by_name(cursor, 'ひかり学園高等部') == 2
+    finally:
+        conn.close()
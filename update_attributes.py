@@ -6,7 +6,7 @@
 
 import pandas as pd
 from pathlib import Path
-from database_v2 import get_connection
+from database_v2 import get_connection, bump_db_generation
 
 def update_attributes_from_master(master_path, db_path='schoolphoto_v2.db'):
     """担当者マスタから属性をschools_masterに反映"""
@@ -69,6 +69,7 @@ def update_attributes_from_master(master_path, db_path='schoolphoto_v2.db'):
             else:
                 not_found_count += 1
         
+        bump_db_generation(cursor)
         conn.commit()
         print(f"\n更新完了:")
         print(f"  属性を更新: {updated_count}件")